@@ -1,49 +1,458 @@
 """This module is responsible for handaling the data acquisition and data cleaning into MADAP"""
 import os
+import re
+import csv
+import bz2
+import gzip
+import lzma
+import struct
+import zipfile
+from collections import Counter
+
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+from pyarrow import feather
+from pyarrow import parquet
 
 from madap.logger import logger
+from madap.data_acquisition import instrument_readers as ir
 
 
 log = logger.get_logger("data_acquisition")
-EXTENSIONS = [".txt", ".csv", ".json", ".xlsx", ".hdf5", ".h5", ".pkl"]
-
-def acquire_data(data_path):
+EXTENSIONS = [".txt", ".csv", ".json", ".xlsx", ".hdf5", ".h5", ".pkl", ".parquet", ".feather", ".arrow",
+              ".npy", ".npz"]
+# compressed files are decompressed while they are read, e.g. data.csv.gz
+COMPRESSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+COMPRESSIBLE_EXTENSIONS = [".txt", ".csv", ".json", ".pkl"]
+# raw numpy arrays that can be memory-mapped without building a dataframe
+ARRAY_EXTENSIONS = [".npy", ".npz"]
+# number of bytes from the head of a text file used for sniffing its format
+SNIFF_SIZE = 64 * 1024
+# default number of rows of a chunk when a file is read in chunks
+CHUNK_SIZE = 1_000_000
+SNIFF_DELIMITERS = ";\t,| "
+DECIMAL_COMMA = re.compile(r"^[-+]?\d+,\d+([eE][-+]?\d+)?$")
+# brackets and separators of numeric lists stored in a single cell
+ARRAY_CELL_SEPARATORS = str.maketrans({separator: " " for separator in "[](),;\t"})
+
+def acquire_data(data_path, columns:list = None, rows:tuple = None):
     """Acquire data from a given file
 
     Args:
         data_path (str): The path to the data
+        columns (list, optional): Column names or positions to load. Positions are counted
+            without the unnamed index column (see remove_unnamed_col). Defaults to None (all columns).
+        rows (tuple, optional): Start and end row (end exclusive) to load. Defaults to None (all rows).
 
     Returns:
        Pandas DataFrame: Dataframe with extracted data
     """
-    _ , extension = os.path.splitext(data_path)
+    extension, compression = split_extension(data_path)
 
-    log.info(f"Importing {extension} file.")
+    log.info(f"Importing {extension} file" + (f" with {compression} compression." if compression else "."))
+
+    if extension.lower() in ir.INSTRUMENT_EXTENSIONS:
+        return _project_data_frame(pd.DataFrame(ir.read_instrument_file(data_path)), columns, rows)
 
     if extension not in EXTENSIONS:
-        log.error(f"Datatype not supported. Supported datatypes are: {EXTENSIONS}")
+        log.error(f"Datatype not supported. Supported datatypes are: {EXTENSIONS + ir.INSTRUMENT_EXTENSIONS}")
         raise ValueError("Datatype not supported")
+    if compression and extension not in COMPRESSIBLE_EXTENSIONS:
+        log.error(f"Compressed files are supported for the datatypes: {COMPRESSIBLE_EXTENSIONS}")
+        raise ValueError("Compressed datatype not supported")
 
     if extension in (".csv", ".txt"):
-        try:
-            df = pd.read_csv(data_path, sep=None, engine="python")
-        except:
-            df = pd.read_csv(data_path, sep=";", engine="python")
+        return _read_delimited(data_path, columns, rows, compression)
 
     if extension == ".xlsx":
-        df = pd.read_excel(data_path)
+        header = pd.read_excel(data_path, nrows=0).columns
+        skiprows, nrows = _rows_to_skip(0, rows)
+        return pd.read_excel(data_path, usecols=_resolve_columns(header, columns),
+                             skiprows=skiprows, nrows=nrows)
+    if extension in (".parquet", ".feather", ".arrow"):
+        return _read_columnar(data_path, extension, columns, rows)
+    if extension in ARRAY_EXTENSIONS:
+        df = pd.DataFrame(acquire_arrays(data_path))
     if extension == ".json":
-        df = pd.read_json(data_path)
+        df = pd.read_json(data_path, compression=compression)
     if extension in (".hdf5", ".h5"):
         df = pd.read_hdf(data_path)
     if extension == ".pkl":
-        df = pd.read_pickle(data_path)
+        df = pd.read_pickle(data_path, compression=compression)
+
+    return _project_data_frame(df, columns, rows)
+
+
+def split_extension(data_path):
+    """Get the extension of the data and its compression from the (compound) extension
+    of the file name, e.g. ".csv" and "gzip" for data.csv.gz.
+
+    Args:
+        data_path (str): The path to the data
+
+    Returns:
+        tuple: The extension of the data and the compression (None if not compressed)
+    """
+    root, extension = os.path.splitext(data_path)
+    compression = COMPRESSIONS.get(extension.lower())
+    if compression:
+        _, extension = os.path.splitext(root)
+    return extension, compression
+
+
+def open_text(data_path, compression:str = None):
+    """Open a text file for reading, it is decompressed as a stream if it is compressed.
+
+    Args:
+        data_path (str): The path to the data
+        compression (str, optional): One of the COMPRESSIONS. Defaults to None.
 
+    Returns:
+        file: The text file
+    """
+    if compression is None:
+        return open(data_path, "r", encoding="utf-8", newline="")
+    if compression == "gzip":
+        return gzip.open(data_path, "rt", encoding="utf-8", newline="")
+    if compression == "bz2":
+        return bz2.open(data_path, "rt", encoding="utf-8", newline="")
+    if compression == "xz":
+        return lzma.open(data_path, "rt", encoding="utf-8", newline="")
+    try:
+        import zstandard # pylint: disable=import-outside-toplevel
+    except ImportError as exp:
+        log.error("Reading zstd compressed files requires the zstandard package.")
+        raise exp
+    return zstandard.open(data_path, "rt", encoding="utf-8", newline="")
+
+
+def acquire_arrays(data_path, names:list = None):
+    """Acquire the columns of a .npy or .npz file as memory-mapped arrays.
+    Nothing is parsed or copied, the data is read from disk when it is used.
+
+    The columns of a .npz file are its arrays, the columns of a .npy file are the
+    fields of a structured array or the columns of a 2D array (named by their position).
+
+    Args:
+        data_path (str): The path to the data
+        names (list, optional): Names of the columns to acquire. Defaults to None (all columns).
+
+    Returns:
+        dict: Column name and the corresponding 1D array
+    """
+    _ , extension = os.path.splitext(data_path)
+    log.info(f"Memory-mapping {extension} file.")
+
+    if extension == ".npz":
+        arrays = _memory_map_npz(data_path)
+    elif extension == ".npy":
+        array = np.load(data_path, mmap_mode="r")
+        if array.dtype.names:
+            arrays = {name: array[name] for name in array.dtype.names}
+        elif array.ndim == 1:
+            arrays = {"0": array}
+        else:
+            arrays = {str(i): array[:, i] for i in range(array.shape[1])}
+    else:
+        log.error(f"Datatype not supported. Supported datatypes are: {ARRAY_EXTENSIONS}")
+        raise ValueError("Datatype not supported")
+
+    if names is None:
+        return arrays
+    missing = [str(name) for name in names if str(name) not in arrays]
+    if missing:
+        log.error(f"The columns {missing} are not available. Available columns are: {list(arrays)}")
+        raise KeyError(f"Columns not available: {missing}")
+    return {str(name): arrays[str(name)] for name in names}
+
+
+def acquire_data_chunks(data_path, columns:list = None, chunk_size:int = CHUNK_SIZE):
+    """Acquire the data of a given file in chunks of rows, so that only one chunk is
+    held in memory at a time. Delimited text files (also compressed ones) are parsed
+    chunk by chunk, parquet files are read batch by batch and feather and numpy files
+    are memory-mapped and sliced.
+
+    Args:
+        data_path (str): The path to the data
+        columns (list, optional): Column names or positions to load. Defaults to None (all columns).
+        chunk_size (int, optional): Number of rows of a chunk. Defaults to CHUNK_SIZE.
+
+    Raises:
+        ValueError: If the datatype can not be read in chunks.
+
+    Yields:
+        Pandas DataFrame: Dataframe with the next chunk of rows
+    """
+    extension, compression = split_extension(data_path)
+    log.info(f"Importing {extension} file in chunks of {chunk_size} rows.")
+
+    if extension in (".csv", ".txt"):
+        text_format = sniff_text_format(data_path, compression=compression)
+        header = pd.read_csv(data_path, engine="c", nrows=0, compression=compression, **text_format).columns
+        usecols = _resolve_columns(header, columns)
+        with pd.read_csv(data_path, engine="c", usecols=usecols, chunksize=chunk_size,
+                         compression=compression, **text_format) as reader:
+            for chunk in reader:
+                remove_unnamed_col(chunk)
+                yield chunk
+    elif compression:
+        log.error("Compressed files can only be read in chunks for the datatypes: ['.txt', '.csv']")
+        raise ValueError("Compressed datatype not supported")
+    elif extension == ".parquet":
+        parquet_file = parquet.ParquetFile(data_path, memory_map=True)
+        header = [label for label in parquet_file.schema_arrow.names if not label.startswith("__index_level_")]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=_resolve_columns(header, columns)):
+            yield batch.to_pandas()
+    elif extension in (".feather", ".arrow"):
+        table = feather.read_table(str(data_path), memory_map=True)
+        header = [label for label in table.column_names if not label.startswith("__index_level_")]
+        usecols = _resolve_columns(header, columns)
+        if usecols is not None:
+            table = table.select(usecols)
+        for start in range(0, table.num_rows, chunk_size):
+            yield table.slice(start, chunk_size).to_pandas()
+    elif extension in ARRAY_EXTENSIONS:
+        arrays = acquire_arrays(data_path)
+        arrays = {name: arrays[name] for name in _resolve_columns(list(arrays), columns) or arrays}
+        length = min(len(array) for array in arrays.values())
+        for start in range(0, length, chunk_size):
+            yield pd.DataFrame({name: np.asarray(array[start: start + chunk_size]) for name, array in arrays.items()})
+    else:
+        log.error("Chunked reading is supported for the datatypes: "
+                  f"{['.txt', '.csv', '.parquet', '.feather', '.arrow'] + ARRAY_EXTENSIONS}")
+        raise ValueError("Datatype not supported for chunked reading")
+
+
+def _memory_map_npz(data_path):
+    """Memory-map the arrays of a .npz file. Arrays stored without compression
+    (numpy.savez) are mapped in place, compressed ones (numpy.savez_compressed)
+    have to be loaded into memory.
+
+    Args:
+        data_path (str): The path to the data
+
+    Returns:
+        dict: Array name and the corresponding array
+    """
+    arrays = {}
+    with zipfile.ZipFile(data_path) as archive, open(data_path, "rb") as file:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                log.warning(f"Array {name} is compressed and is loaded into memory.")
+                with archive.open(info) as member:
+                    arrays[name] = np.load(member)
+                continue
+            # skip the local file header of the zip member to get to the npy data
+            file.seek(info.header_offset)
+            local_header = file.read(30)
+            name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            arrays[name] = np.memmap(data_path, dtype=dtype, mode="r", shape=shape,
+                                     order="F" if fortran_order else "C", offset=file.tell())
+    return arrays
+
+
+def _read_delimited(data_path, columns:list = None, rows:tuple = None, compression:str = None):
+    """Read a delimited text file in a single pass with the C parser.
+    The format is sniffed from the head of the file; if that fails the slower
+    python engine with automatic delimiter detection is used instead.
+    Compressed files are decompressed as a stream while they are parsed.
+
+    Args:
+        data_path (str): The path to the data
+        columns (list, optional): Column names or positions to load. Defaults to None.
+        rows (tuple, optional): Start and end row to load. Defaults to None.
+        compression (str, optional): One of the COMPRESSIONS. Defaults to None.
+
+    Returns:
+        Pandas DataFrame: Dataframe with extracted data
+    """
+    try:
+        text_format = sniff_text_format(data_path, compression=compression)
+        log.info(f"Sniffed delimiter {text_format['sep']!r}, decimal {text_format['decimal']!r} "
+                 f"and header row {text_format['skiprows']}.")
+        usecols = None
+        if columns is not None:
+            header = pd.read_csv(data_path, engine="c", nrows=0, compression=compression, **text_format).columns
+            usecols = _resolve_columns(header, columns)
+        text_format["skiprows"], nrows = _rows_to_skip(text_format["skiprows"], rows)
+        return pd.read_csv(data_path, engine="c", usecols=usecols, nrows=nrows,
+                           compression=compression, **text_format)
+    except (csv.Error, ValueError, UnicodeDecodeError, pd.errors.ParserError) as exp:
+        log.warning(f"Fast reading of the file failed ({exp}). Falling back to the python engine.")
+
+    try:
+        df = pd.read_csv(data_path, sep=None, engine="python", compression=compression)
+    except:
+        df = pd.read_csv(data_path, sep=";", engine="python", compression=compression)
+    return _project_data_frame(df, columns, rows)
+
+
+def _read_columnar(data_path, extension:str, columns:list = None, rows:tuple = None):
+    """Read a parquet or feather (Arrow IPC) file. Only the requested columns are read
+    and the file is memory-mapped, the row range is sliced without copying.
+
+    Args:
+        data_path (str): The path to the data
+        extension (str): The extension of the file
+        columns (list, optional): Column names or positions to load. Defaults to None.
+        rows (tuple, optional): Start and end row to load. Defaults to None.
+
+    Returns:
+        Pandas DataFrame: Dataframe with extracted data
+    """
+    if extension == ".parquet":
+        header = parquet.read_schema(data_path, memory_map=True).names
+    else:
+        with pa.memory_map(str(data_path)) as source:
+            header = pa.ipc.open_file(source).schema.names
+    header = [label for label in header if not label.startswith("__index_level_")]
+    usecols = _resolve_columns(header, columns)
+
+    if extension == ".parquet":
+        table = parquet.read_table(data_path, columns=usecols, memory_map=True)
+    else:
+        table = feather.read_table(str(data_path), columns=usecols, memory_map=True)
+    if rows is not None:
+        table = table.slice(rows[0], max(rows[1] - rows[0], 0))
+    return table.to_pandas()
+
+
+def _resolve_columns(header, columns:list = None):
+    """Translate the requested columns to the labels of the header.
+
+    Args:
+        header (list): Column labels of the file
+        columns (list, optional): Column names or positions. Positions are counted
+            without the unnamed index column. Defaults to None.
+
+    Returns:
+        list: Labels of the requested columns or None if all columns are requested
+    """
+    if columns is None:
+        return None
+    named_header = [label for label in header if label != "Unnamed: 0"]
+    return [named_header[column] if isinstance(column, (int, np.integer)) else column for column in columns]
+
+
+def _rows_to_skip(header_row:int, rows:tuple = None):
+    """Get the skiprows and nrows arguments of the pandas readers for a row range.
+
+    Args:
+        header_row (int): Line number of the header
+        rows (tuple, optional): Start and end row of the data. Defaults to None.
+
+    Returns:
+        tuple: skiprows and nrows
+    """
+    if rows is None:
+        return header_row, None
+    start, end = rows
+    skiprows = lambda line: line < header_row or header_row < line <= header_row + start
+    return skiprows, max(end - start, 0)
+
+
+def _project_data_frame(df, columns:list = None, rows:tuple = None):
+    """Select the requested columns and rows of an already loaded dataframe.
+
+    Args:
+        df (DataFrame): The loaded dataframe
+        columns (list, optional): Column names or positions. Defaults to None.
+        rows (tuple, optional): Start and end row. Defaults to None.
+
+    Returns:
+        DataFrame: The projected dataframe
+    """
+    if rows is not None:
+        df = df.iloc[rows[0]: rows[1]].reset_index(drop=True)
+    if columns is not None:
+        df = df[_resolve_columns(df.columns, columns)]
     return df
 
 
+def project_selection(selections:list):
+    """Get the rows and columns needed by the "start_row,end_row,start_column,end_column"
+    selections of the data and the same selections relative to the projected data.
+    The rows of the first selection are used for all of them, as in select_data.
+
+    Args:
+        selections (list): List of selection strings
+
+    Returns:
+        tuple: Columns positions, row range and the projected selection strings
+    """
+    numbers = [list(map(int, selection.split(","))) for selection in selections]
+    start, end = numbers[0][0], numbers[0][1]
+    columns = sorted({column for number in numbers for column in range(number[2], number[3])})
+    position = {column: i for i, column in enumerate(columns)}
+    projected = [f"0,{end - start},{position[number[2]]},{position[number[3] - 1] + 1}"
+                 for number in numbers]
+    return columns, (start, end), projected
+
+
+def sniff_text_format(data_path, sample_size:int = SNIFF_SIZE, compression:str = None):
+    """Detect the delimiter, decimal mark and header row of a delimited text file
+    from its first bytes only. Of a compressed file only the head is decompressed.
+
+    Args:
+        data_path (str): The path to the data
+        sample_size (int, optional): Number of characters to inspect. Defaults to SNIFF_SIZE.
+        compression (str, optional): One of the COMPRESSIONS. Defaults to None.
+
+    Raises:
+        csv.Error: If no consistent format could be detected.
+
+    Returns:
+        dict: Keyword arguments for pandas.read_csv (sep, decimal, skiprows, skipinitialspace)
+    """
+    with open_text(data_path, compression) as file:
+        sample = file.read(sample_size)
+        truncated = bool(file.read(1))
+
+    lines = sample.splitlines()
+    # the last line of a truncated sample is most likely incomplete
+    if truncated and len(lines) > 1:
+        lines = lines[:-1]
+    line_numbers = [i for i, line in enumerate(lines) if line.strip()]
+    lines = [lines[i] for i in line_numbers]
+    if len(lines) < 2:
+        raise csv.Error("Not enough lines to sniff the file format.")
+
+    # the delimiter is the candidate which splits most lines into the same number (>1) of fields,
+    # semicolon and tab go first since a comma may also be the decimal mark
+    best = None
+    for delimiter in SNIFF_DELIMITERS:
+        rows = list(csv.reader(lines, delimiter=delimiter, skipinitialspace=delimiter == " "))
+        n_columns, _ = Counter(len(row) for row in rows[len(rows)//2:]).most_common(1)[0]
+        if n_columns < 2:
+            continue
+        consistent = sum(len(row) == n_columns for row in rows)
+        if best is None or consistent > best[0]:
+            best = (consistent, delimiter, rows, n_columns)
+    if best is None:
+        raise csv.Error("Could not determine delimiter.")
+    _, delimiter, rows, n_columns = best
+    # leading lines with a different number of fields are metadata written by the instrument
+    header_index = next(i for i, row in enumerate(rows) if len(row) == n_columns)
+    header_row = line_numbers[header_index]
+
+    decimal = "."
+    if delimiter != ",":
+        body = [field.strip() for row in rows[header_index + 1:] for field in row]
+        if any(DECIMAL_COMMA.match(field) for field in body):
+            decimal = ","
+
+    return {"sep": delimiter, "decimal": decimal, "skiprows": header_row,
+            "skipinitialspace": delimiter == " "}
+
+
 def format_data(data):
     """Convert the given data to the array of float
 
@@ -56,6 +465,9 @@ def format_data(data):
     if not data is None:
         if isinstance(data, list):
             data = np.array(data, dtype=np.float64)
+        # float arrays (e.g. memory-mapped) are used as they are without copying
+        if isinstance(data, np.ndarray) and np.issubdtype(data.dtype, np.floating):
+            return data
 
         if not np.array_equal(data, data.astype(float)):
             data = data.astype(np.float)
@@ -80,15 +492,43 @@ def select_data(data, selected_data:str):
     if not isinstance(data, np.ndarray):
         data = np.array(data)
     if isinstance(data[0], str):
-        if len(data) == 1:
-            data = np.array(eval(data[0]))
-        else:
-            for i, _ in enumerate(data):
-                data[i] = eval(data[i])
+        data = parse_array_cells(data)
+        # one value per cell or a single cell holding the whole array
+        if data.ndim == 2 and 1 in data.shape:
+            data = data.reshape(-1)
 
     return data
 
 
+def parse_array_cells(cells):
+    """Parse cells holding numeric lists, e.g. "[1.0, 2.0, 3.0]" or "1.0; 2.0; 3.0",
+    into a 2D float array with one row per cell. All cells are decoded at once
+    without evaluating them. Rows with fewer values are padded with nan.
+
+    Args:
+        cells (np.array): Array of strings
+
+    Raises:
+        ValueError: If a cell holds a non numeric value.
+
+    Returns:
+        np.array: 2D float array of shape (number of cells, maximum number of values)
+    """
+    text = "\n".join(map(str, cells)).translate(ARRAY_CELL_SEPARATORS)
+    lengths = np.fromiter((len(row.split()) for row in text.split("\n")), dtype=np.intp, count=len(cells))
+    try:
+        values = np.array(text.split(), dtype=np.float64)
+    except ValueError as exp:
+        log.error(f"The cells could not be parsed as numeric lists: {exp}")
+        raise
+
+    if np.all(lengths == lengths[0]):
+        return values.reshape(len(lengths), lengths[0])
+    parsed = np.full((len(lengths), lengths.max()), np.nan)
+    parsed[np.arange(lengths.max()) < lengths[:, None]] = values
+    return parsed
+
+
 def format_list(list_data):
     """ Format the selection plots into a list
 
@@ -105,6 +545,52 @@ def format_list(list_data):
     return list_data
 
 
+def remove_outliers(df, columns, low_quantile = 0.05, high_quantile = 0.95):
+    """Remove the rows with outliers or nan values in the given columns in a single vectorized pass.
+    A value is an outlier if it is not strictly between the lower and the upper quantile of its column.
+
+    Args:
+        df (dataframe): original dataframe
+        columns (list): colummns for which the outliers are to be removed
+        low_quantile (float): lower quantile
+        high_quantile (float): upper quantile
+
+    Returns:
+        tuple: the cleaned dataframe and the boolean mask of the kept rows
+    """
+    kept_mask = np.all(_inlier_mask(df, columns, low_quantile, high_quantile), axis=1)
+    cleaned = df[kept_mask]
+    cleaned.index = pd.RangeIndex(len(cleaned))
+    log.info(f"{len(df) - len(cleaned)} rows with outliers or nan values are removed from the dataset.")
+    return cleaned, kept_mask
+
+
+def remove_outliers_per_group(df, group_column, columns, low_quantile = 0.05, high_quantile = 0.95):
+    """Remove the rows with outliers or nan values in the given columns, with the quantiles of every group
+    of rows on its own, e.g. of every spectrum of a potential series. Rows without a group are removed.
+
+    Args:
+        df (dataframe): original dataframe
+        group_column (str): column identifying the group of each row
+        columns (list): colummns for which the outliers are to be removed
+        low_quantile (float): lower quantile
+        high_quantile (float): upper quantile
+
+    Returns:
+        tuple: the cleaned dataframe and the boolean mask of the kept rows
+    """
+    kept_mask = np.zeros(len(df), dtype=bool)
+    for positions in df.groupby(group_column, sort=False).indices.values():
+        kept_mask[positions] = np.all(_inlier_mask(df.iloc[positions], columns, low_quantile, high_quantile), axis=1)
+    n_missing_groups = int(df[group_column].isna().sum())
+    if n_missing_groups:
+        log.warning(f"{n_missing_groups} rows have no value in the column {group_column} and are removed.")
+    cleaned = df[kept_mask]
+    cleaned.index = pd.RangeIndex(len(cleaned))
+    log.info(f"{len(df) - len(cleaned)} rows with outliers or nan values are removed from the dataset.")
+    return cleaned, kept_mask
+
+
 def remove_outlier_specifying_quantile(df, columns, low_quantile = 0.05, high_quantile = 0.95):
     """removing the outliers from the data by specifying the quantile
 
@@ -115,46 +601,48 @@ def remove_outlier_specifying_quantile(df, columns, low_quantile = 0.05, high_qu
         high_quantile (float): upper quantile
 
     Returns:
-        data: the cleaned dataframe
-    """
-    # select the columns that needs to be studied for outliers
-    detect_search = df[columns]
-    # Check if the low_quantile and high_quantile are floats, if not convert them to float
-    if not isinstance(low_quantile, float):
-        low_quantile = float(low_quantile)
-    if not isinstance(high_quantile, float):
-        high_quantile = float(high_quantile)
-    # get the lower quantile of the corresponding columns
-    q_low = detect_search.quantile(low_quantile)
-    # get the upper quantile of the corresponding columns
-    q_high = detect_search.quantile(high_quantile)
-    # detect the outliiers in the data and replace those values with nan
-    detect_search = detect_search[(detect_search < q_high) & (detect_search > q_low)]
-    # find the index of the outliers
-    nan_indices = [*set(np.where(np.asanyarray(np.isnan(detect_search)))[0].tolist())]
-    log.info(f"The outliers are remove from dataset {detect_search} \
-               \n and the indeces are {nan_indices}.")
-
+        data: the selected columns with nan in place of the outliers and the positions of the removed rows
+    """
+    # replace the outliers with nan
+    inlier_mask = _inlier_mask(df, columns, low_quantile, high_quantile)
+    detect_search = df[columns].where(inlier_mask)
+    nan_indices = np.flatnonzero(~np.all(inlier_mask, axis=1)).tolist()
+    log.info(f"{len(nan_indices)} rows with outliers or nan values are detected.")
     return detect_search, nan_indices
 
 
+def _inlier_mask(df, columns, low_quantile, high_quantile):
+    """Get the mask of the values which are strictly between the lower and upper quantile of their column.
+
+    Args:
+        df (dataframe): original dataframe
+        columns (list): colummns for which the outliers are to be detected
+        low_quantile (float): lower quantile
+        high_quantile (float): upper quantile
+
+    Returns:
+        np.array: 2D boolean mask, False for outliers and nan values
+    """
+    values = df[columns].to_numpy(dtype=np.float64)
+    q_low, q_high = np.nanquantile(values, [float(low_quantile), float(high_quantile)], axis=0)
+    # nan values fail both comparisons
+    return (values > q_low) & (values < q_high)
+
+
 def remove_nan_rows(df, nan_indices):
     """ Remove the rows with nan values
 
     Args:
         df (DataFramo): The dataframe from which the rows are to be removed
-        nan_indices (list): The list of indices of the rows to be removed
+        nan_indices (list): The list of positions of the rows to be removed
 
     Returns:
         DataFrame: The dataframe with the rows removed
     """
-    # check if the index of the outliers is present in the dataframe
-    available_nan_indices = [i for i in nan_indices if i in df.index.values]
-    # removing the rows with nan and reset their indeces
-    df = df.drop(df.index[available_nan_indices]).reset_index()
-    # delete the columns
-    if "index" in df.columns:
-        del df["index"]
+    kept_mask = np.ones(len(df), dtype=bool)
+    nan_indices = np.asarray(nan_indices, dtype=np.intp)
+    kept_mask[nan_indices[(nan_indices >= 0) & (nan_indices < len(df))]] = False
+    df = df[kept_mask].reset_index(drop=True)
     remove_unnamed_col(df)
     return df
 
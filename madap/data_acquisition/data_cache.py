@@ -0,0 +1,143 @@
+"""This module implements an on-disk cache of the parsed data files. The entries are keyed
+by the content of the file and the reader options and stored as feather (Arrow IPC) files,
+which are memory-mapped on a repeated run instead of parsing the raw file again."""
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+from madap.logger import logger
+from madap.data_acquisition import data_acquisition as da
+
+
+log = logger.get_logger("data_cache")
+# bump the version if the parsing of the files changes, so that old entries are not used anymore
+CACHE_VERSION = 1
+CACHE_EXTENSION = ".feather"
+# default maximum size of the cache in MB
+CACHE_SIZE = 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def acquire_data_cached(data_path, cache_dir, cache_size:float = CACHE_SIZE,
+                        columns:list = None, rows:tuple = None):
+    """Acquire the data of a given file through the cache. On a miss the file is parsed
+    with acquire_data, its unnamed index column is removed and the result is stored.
+
+    Args:
+        data_path (str): The path to the data
+        cache_dir (str): The directory of the cache
+        cache_size (float, optional): Maximum size of the cache in MB. Defaults to CACHE_SIZE.
+        columns (list, optional): Column names or positions to load. Defaults to None (all columns).
+        rows (tuple, optional): Start and end row (end exclusive) to load. Defaults to None (all rows).
+
+    Returns:
+        Pandas DataFrame: Dataframe with extracted data
+    """
+    key = cache_key(data_path, columns=columns, rows=rows)
+    df = load_cache_entry(cache_dir, key)
+    if df is not None:
+        log.info(f"Loaded the parsed data of {data_path} from the cache.")
+        return df
+
+    df = da.acquire_data(data_path, columns=columns, rows=rows)
+    da.remove_unnamed_col(df)
+    store_cache_entry(cache_dir, key, df, cache_size)
+    return df
+
+
+def cache_key(data_path, **options):
+    """Get the cache key of a file, a hash of its content and the reader options.
+
+    Args:
+        data_path (str): The path to the data
+        **options: Reader options which change the parsed data
+
+    Returns:
+        str: The cache key
+    """
+    file_hash = hashlib.blake2b(digest_size=20)
+    with open(data_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+    _, extension = os.path.splitext(data_path)
+    file_hash.update(json.dumps({"version": CACHE_VERSION, "pandas": pd.__version__,
+                                 "extension": extension, **options}, sort_keys=True, default=str).encode())
+    return file_hash.hexdigest()
+
+
+def load_cache_entry(cache_dir, key):
+    """Load a cache entry and mark it as recently used.
+
+    Args:
+        cache_dir (str): The directory of the cache
+        key (str): The cache key
+
+    Returns:
+        Pandas DataFrame: The cached data or None if there is no entry
+    """
+    path = os.path.join(cache_dir, key + CACHE_EXTENSION)
+    try:
+        df = feather.read_table(path, memory_map=True).to_pandas()
+    except FileNotFoundError:
+        return None
+    except pa.ArrowException as exp:
+        log.warning(f"The cache entry {path} could not be read ({exp}) and is removed.")
+        os.remove(path)
+        return None
+    os.utime(path)
+    return df
+
+
+def store_cache_entry(cache_dir, key, df, cache_size:float = CACHE_SIZE):
+    """Store the data as a cache entry and evict the least recently used entries
+    if the cache is larger than its maximum size.
+
+    Args:
+        cache_dir (str): The directory of the cache
+        key (str): The cache key
+        df (Pandas DataFrame): The data that should be cached
+        cache_size (float, optional): Maximum size of the cache in MB. Defaults to CACHE_SIZE.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + CACHE_EXTENSION)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(pa.Table.from_pandas(df), temp_path)
+    except (pa.ArrowException, TypeError, ValueError) as exp:
+        log.warning(f"The data could not be cached ({exp}).")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return
+    # the entry only appears once it is complete
+    os.replace(temp_path, path)
+    log.info(f"Stored the parsed data in the cache {cache_dir}.")
+    evict_cache_entries(cache_dir, cache_size)
+
+
+def evict_cache_entries(cache_dir, cache_size:float = CACHE_SIZE, extension:str = CACHE_EXTENSION):
+    """Remove the least recently used entries until the cache is not larger than its maximum size.
+
+    Args:
+        cache_dir (str): The directory of the cache
+        cache_size (float, optional): Maximum size of the cache in MB. Defaults to CACHE_SIZE.
+        extension (str, optional): Extension of the cache entries. Defaults to CACHE_EXTENSION.
+    """
+    entries = []
+    with os.scandir(cache_dir) as scan:
+        for entry in scan:
+            if entry.is_file() and entry.name.endswith(extension):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    max_size = cache_size * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        log.info(f"Evicting the cache entry {path}.")
+        os.remove(path)
+        total_size -= size
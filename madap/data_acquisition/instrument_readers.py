@@ -0,0 +1,263 @@
+"""This module reads the native files of common potentiostats (BioLogic .mpr/.mpt and Gamry .DTA)
+directly into typed numpy columns, without exporting them to csv first."""
+import io
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from madap.logger import logger
+
+
+log = logger.get_logger("instrument_readers")
+INSTRUMENT_EXTENSIONS = [".mpr", ".mpt", ".dta"]
+DECIMAL_COMMA = re.compile(r"^[-+]?\d+,\d+([eE][-+]?\d+)?$")
+
+# column roles used by MADAP and the instrument columns they are taken from with their scale to SI units
+COLUMN_ROLES = {"frequency": [("freq/Hz", 1), ("Freq", 1)],
+                "real_impedance": [("Re(Z)/Ohm", 1), ("Zreal", 1)],
+                "imaginary_impedance": [("-Im(Z)/Ohm", -1), ("Zimag", 1)],
+                "current": [("I/mA", 1e-3), ("<I>/mA", 1e-3), ("Im", 1)],
+                "voltage": [("Ewe/V", 1), ("<Ewe>/V", 1), ("Vf", 1)],
+                "time": [("time/s", 1), ("T", 1), ("Time", 1)]}
+# header list of the column roles for each procedure
+ROLE_HEADERS = {"impedance": ["frequency", "real_impedance", "imaginary_impedance"],
+                "voltammetry": ["current", "voltage", "time"]}
+
+# BioLogic does not publish the .mpr format. The magic, the module header layout and the column ids and
+# types below follow the reverse engineered description of the galvani project by Chris Kerr et al.
+# (https://github.com/echemdata/galvani, GPL-3.0). Only these facts about the format are taken from it,
+# no code of galvani is part of this reader.
+MPR_MAGIC = b"BIO-LOGIC MODULAR FILE\x1a" + b" " * 25 + b"\x00" * 4
+MPR_MODULE_HEADER = np.dtype([("shortname", "S10"), ("longname", "S25"), ("length", "<u4"),
+                              ("version", "<u4"), ("date", "S8")])
+# EC-Lab >= 11.50 writes a longer module header, marked by 0xffffffff in place of the length
+MPR_MODULE_HEADER_V2 = np.dtype([("shortname", "S10"), ("longname", "S25"), ("max_length", "<u4"),
+                                 ("length", "<u4"), ("version", "<u4"), ("unknown", "<u4"), ("date", "S8")])
+# column ids of the data module and their name and binary type
+MPR_COLUMNS = {4: ("time/s", "<f8"),
+               5: ("control/V/mA", "<f4"),
+               6: ("Ewe/V", "<f4"),
+               7: ("dQ/mA.h", "<f8"),
+               8: ("I/mA", "<f4"),
+               9: ("Ece/V", "<f4"),
+               11: ("<I>/mA", "<f8"),
+               13: ("(Q-Qo)/mA.h", "<f8"),
+               16: ("Analog IN 1/V", "<f4"),
+               19: ("control/V", "<f4"),
+               20: ("control/mA", "<f4"),
+               23: ("dQ/mA.h", "<f8"),
+               24: ("cycle number", "<f8"),
+               26: ("Rapp/Ohm", "<f4"),
+               32: ("freq/Hz", "<f4"),
+               33: ("|Ewe|/V", "<f4"),
+               34: ("|I|/A", "<f4"),
+               35: ("Phase(Z)/deg", "<f4"),
+               36: ("|Z|/Ohm", "<f4"),
+               37: ("Re(Z)/Ohm", "<f4"),
+               38: ("-Im(Z)/Ohm", "<f4"),
+               39: ("I Range", "<u2"),
+               69: ("R/Ohm", "<f4"),
+               70: ("P/W", "<f4"),
+               74: ("Energy/W.h", "<f8"),
+               76: ("<I>/mA", "<f4"),
+               77: ("<Ewe>/V", "<f4"),
+               131: ("Ns", "<u2")}
+# column ids which are stored as bits of a single flags byte
+MPR_FLAGS = {1: ("mode", 0x03),
+             2: ("ox/red", 0x04),
+             3: ("error", 0x08),
+             21: ("control changes", 0x10),
+             31: ("Ns changes", 0x20),
+             65: ("counter inc.", 0x80)}
+
+
+def read_instrument_file(data_path):
+    """Read a native potentiostat file.
+
+    Args:
+        data_path (str): The path to the data
+
+    Returns:
+        dict: Column name and the corresponding numpy array
+    """
+    _ , extension = os.path.splitext(data_path)
+    extension = extension.lower()
+    log.info(f"Reading native {extension} file.")
+
+    if extension == ".mpr":
+        return read_mpr(data_path)
+    if extension == ".mpt":
+        return read_mpt(data_path)
+    if extension == ".dta":
+        return read_dta(data_path)
+    log.error(f"Datatype not supported. Supported datatypes are: {INSTRUMENT_EXTENSIONS}")
+    raise ValueError("Datatype not supported")
+
+
+def map_column_roles(columns:dict):
+    """Map the instrument columns to the float64 columns used by MADAP in SI units
+    (frequency [Hz], real and imaginary impedance [Ohm], current [A], voltage [V], time [s]).
+    The imaginary impedance is negative for capacitive behaviour.
+
+    Args:
+        columns (dict): Column name and the corresponding array as read from the instrument file
+
+    Returns:
+        dict: Role and the corresponding array for all roles available in the file
+    """
+    roles = {}
+    for role, candidates in COLUMN_ROLES.items():
+        for name, scale in candidates:
+            if name in columns:
+                column = np.asarray(columns[name], dtype=np.float64)
+                roles[role] = column if scale == 1 else column * scale
+                break
+    log.info(f"Found the columns {list(roles)} in the instrument file.")
+    return roles
+
+
+def read_mpr(data_path):
+    """Read a binary BioLogic EC-Lab .mpr file. The records of the data module are
+    read in one go as a structured array.
+
+    Args:
+        data_path (str): The path to the data
+
+    Raises:
+        ValueError: If the file is not a valid .mpr file or holds unknown columns.
+
+    Returns:
+        dict: Column name and the corresponding numpy array
+    """
+    with open(data_path, "rb") as file:
+        if file.read(len(MPR_MAGIC)) != MPR_MAGIC:
+            raise ValueError(f"{data_path} is not a BioLogic .mpr file.")
+        modules = dict(_read_mpr_modules(file))
+
+    if b"VMP data" not in modules:
+        raise ValueError(f"No data module found in {data_path}.")
+    version, data = modules[b"VMP data"]
+
+    n_points = int(np.frombuffer(data[:4], dtype="<u4")[0])
+    n_columns = int(data[4])
+    if version == 0:
+        column_ids = np.frombuffer(data, dtype="u1", count=n_columns, offset=5)
+        data_offset = 100
+    elif version in (2, 3):
+        column_ids = np.frombuffer(data, dtype="<u2", count=n_columns, offset=5)
+        data_offset = 405 if version == 2 else 406
+    else:
+        raise ValueError(f"Unsupported version {version} of the .mpr data module.")
+
+    record_fields, flags = [], []
+    for column_id in column_ids.tolist():
+        if column_id in MPR_FLAGS:
+            flags.append(MPR_FLAGS[column_id])
+        elif column_id in MPR_COLUMNS:
+            record_fields.append(MPR_COLUMNS[column_id])
+        else:
+            log.error(f"Unknown column id {column_id} in {data_path}. Please export the file as .mpt.")
+            raise ValueError(f"Unknown column id {column_id} in the .mpr data module.")
+    if flags:
+        record_fields.insert(0, ("flags", "u1"))
+    # the same column might be stored twice, keep the first one
+    names = [name for name, _ in record_fields]
+    record_fields = [(name if names.index(name) == i else f"{name} ({i})", dtype)
+                     for i, (name, dtype) in enumerate(record_fields)]
+
+    records = np.frombuffer(data, dtype=np.dtype(record_fields), count=n_points, offset=data_offset)
+    columns = {name: records[name] for name, _ in record_fields if name != "flags"}
+    for name, mask in flags:
+        shift = (mask & -mask).bit_length() - 1
+        columns[name] = (records["flags"] & mask) >> shift
+    return columns
+
+
+def _read_mpr_modules(file):
+    """Iterate over the modules of an .mpr file.
+
+    Args:
+        file (file): Binary file positioned after the magic header
+
+    Yields:
+        tuple: Short name of the module and a tuple of its version and data
+    """
+    while True:
+        magic = file.read(len(b"MODULE"))
+        if not magic:
+            return
+        if magic != b"MODULE":
+            raise ValueError("Found no module where one was expected in the .mpr file.")
+        header_bytes = file.read(MPR_MODULE_HEADER.itemsize)
+        if header_bytes[35:39] == b"\xff\xff\xff\xff":
+            header_bytes += file.read(MPR_MODULE_HEADER_V2.itemsize - MPR_MODULE_HEADER.itemsize)
+            header = np.frombuffer(header_bytes, dtype=MPR_MODULE_HEADER_V2, count=1)[0]
+        else:
+            header = np.frombuffer(header_bytes, dtype=MPR_MODULE_HEADER, count=1)[0]
+        data = file.read(int(header["length"]))
+        yield header["shortname"].strip(), (int(header["version"]), data)
+
+
+def read_mpt(data_path):
+    """Read a BioLogic EC-Lab .mpt text export with the C parser.
+
+    Args:
+        data_path (str): The path to the data
+
+    Returns:
+        dict: Column name and the corresponding numpy array
+    """
+    with open(data_path, "r", encoding="latin-1") as file:
+        head = [file.readline() for _ in range(2)]
+    header_row = 0
+    if head[0].startswith("EC-Lab ASCII FILE"):
+        header_row = int(head[1].split(":")[1]) - 1
+
+    with open(data_path, "r", encoding="latin-1") as file:
+        lines = [line for _, line in zip(range(header_row + 20), file)][header_row + 1:]
+    decimal = "," if any(DECIMAL_COMMA.match(field.strip()) for line in lines for field in line.split("\t")) \
+                  else "."
+
+    df = pd.read_csv(data_path, sep="\t", skiprows=header_row, decimal=decimal,
+                     encoding="latin-1", engine="c")
+    return {name: df[name].to_numpy() for name in df.columns if not name.startswith("Unnamed")}
+
+
+def read_dta(data_path):
+    """Read a Gamry .DTA file. Its curve tables (ZCURVE for impedance, CURVE/CURVEn for
+    the other experiments) are joined into one set of columns.
+
+    Args:
+        data_path (str): The path to the data
+
+    Raises:
+        ValueError: If the file does not contain a curve table.
+
+    Returns:
+        dict: Column name and the corresponding numpy array
+    """
+    with open(data_path, "r", encoding="latin-1") as file:
+        lines = file.readlines()
+
+    names, table_lines = None, []
+    i = 0
+    while i < len(lines):
+        fields = lines[i].rstrip("\r\n").split("\t")
+        if len(fields) > 1 and fields[1] == "TABLE" and re.fullmatch(r"Z?CURVE\d*", fields[0]):
+            # the table tag is followed by the column names, the units and the rows starting with a tab
+            names = lines[i + 1].strip().split("\t")
+            i += 3
+            while i < len(lines) and lines[i].startswith("\t"):
+                table_lines.append(lines[i][1:])
+                i += 1
+            continue
+        i += 1
+
+    if names is None:
+        raise ValueError(f"No curve table found in {data_path}.")
+    decimal = "," if any(DECIMAL_COMMA.match(field.strip()) for field in table_lines[0].split("\t")) else "."
+    df = pd.read_csv(io.StringIO("".join(table_lines)), sep="\t", header=None, names=names,
+                     decimal=decimal, engine="c")
+    return {name: df[name].to_numpy() for name in df.columns if pd.api.types.is_numeric_dtype(df[name])}
@@ -30,9 +30,11 @@ class Arrhenius(EChemProcedure):
         ln_conductivity_fit (np.array): Array of log conductivity fit.
         intercept (float): Intercept of the fit.
         coefficients (float): Slope of the fit.
+        data_format (str): Format of the saved data table (csv, parquet or feather).
     """
     temperatures = field(on_setattr=frozen)
     conductivity = field(on_setattr=frozen)
+    data_format = field(default="csv")
     gas_constant = 8.314        # [J/mol.K]
     activation = None           # [mJ/mol]
     arrhenius_constant = None   # [S.cm⁻¹]
@@ -119,9 +121,9 @@ class Arrhenius(EChemProcedure):
                                             "log_conductivty [ln(S/cm)]": self._log_conductivity(),
                                             "log_conductivity_fit [ln(S/cm)]":self.ln_conductivity_fit})
 
-        data_name = utils.assemble_file_name(optional_name, self.__class__.__name__, "data.csv") if \
-                        optional_name else  utils.assemble_file_name(self.__class__.__name__, "data.csv")
-        utils.save_data_as_csv(save_dir, data, data_name)
+        data_name = utils.assemble_file_name(optional_name, self.__class__.__name__, f"data.{self.data_format}") if \
+                        optional_name else  utils.assemble_file_name(self.__class__.__name__, f"data.{self.data_format}")
+        utils.save_data_table(save_dir, data, data_name, self.data_format)
 
 
     def perform_all_actions(self, save_dir:str, plots:list, optional_name:str = None):
@@ -5,13 +5,16 @@
 # Journal of Open Source Software, 5(). https://doi.org/10.21105/joss.02349
 # cite for EIS fitting: https://github.com/ECSHackWeek/impedance.py
 import os
+import time
 import warnings
-import random
+from functools import partial
+from multiprocessing import Pool, TimeoutError as PoolTimeoutError
 
 import numpy as np
-from impedance import validation
-from impedance import preprocessing
+from scipy.optimize import least_squares
+from sklearn.linear_model import LinearRegression
 from impedance.models import circuits
+from impedance.models.circuits.fitting import set_default_bounds, wrapCircuit
 #import impedance.validation as validation
 #import impedance.preprocessing as preprocessing
 #import impedance.models.circuits as circuits
@@ -23,13 +26,30 @@ from madap.logger import logger
 from madap.utils import utils
 from madap.utils.suggested_circuits import suggested_circuits
 from madap.data_acquisition import data_acquisition as da
+from madap.data_acquisition import data_cache
 from madap.echem.procedure import EChemProcedure
 from madap.echem.e_impedance.e_impedance_plotting import ImpedancePlotting as iplt
+from madap.echem.e_impedance import e_impedance_classifier as eclf
+from madap.echem.e_impedance import e_impedance_circuit as ecirc
+from madap.echem.e_impedance import e_impedance_cache as ecache
+from madap.echem.e_impedance import e_impedance_linkk as elkk
+from madap.echem.e_impedance import e_impedance_drt as edrt
+from madap.echem.e_impedance import e_impedance_harmonics as eharm
+from madap.echem.e_impedance import e_impedance_library as elib
 
 warnings.warn("deprecated", DeprecationWarning)
 np.seterr(divide='ignore', invalid='ignore')
 # reference the impedance library
 log = logger.get_logger("impedance")
+# a warm started fit is kept if its relative RMSE is at most this factor above the one of the previous spectrum
+WARM_START_TOLERANCE = 2.0
+# seconds a circuit fitted in a worker process may take before it is recorded as failed
+FIT_TIMEOUT = 300
+# default frequency [Hz] of the Mott-Schottky analysis
+MOTT_SCHOTTKY_FREQUENCY = 1000
+ELEMENTARY_CHARGE = 1.602176634e-19     # [C]
+BOLTZMANN_CONSTANT = 1.380649e-23       # [J/K]
+VACUUM_PERMITTIVITY = 8.8541878128e-14  # [F/cm]
 
 
 @define
@@ -59,7 +79,10 @@ class EIS(EChemProcedure):
                 initial_value = None, max_rc_element: int = 50,
                 cut_off: float = 0.85, fit_type: str = 'complex',
                 val_low_freq: bool = True, cell_constant="n", max_iterations: int = 5,
-                threshold_error:float = 0.009):
+                threshold_error:float = 0.009, data_format:str = "csv", n_workers:int = 1,
+                fit_budget:int = None, classify_spectrum:bool = False, warm_start:tuple = None,
+                cache_dir:str = None, cache_size:float = data_cache.CACHE_SIZE, refine_seed:int = 0,
+                guess_library:str = None, fit_timeout:float = FIT_TIMEOUT):
         """ Initialize the EIS class.
 
         Args:
@@ -72,7 +95,30 @@ class EIS(EChemProcedure):
             fit_type (str, optional): Fit type. Defaults to 'complex'.
             val_low_freq (bool, optional): If True, the low frequency is used for the fit. Defaults to True.
             cell_constant (str, optional): Cell constant. Defaults to "n".
-            max_iterations (int, optional): Maximum number of iterations for evaluating the accuarcy of fit. Defaults to 5.
+            max_iterations (int, optional): Number of perturbed starts fitted in parallel if the fit of the suggested
+                circuit does not reach the threshold error. Defaults to 5.
+            threshold_error (float, optional): Relative RMSE below which the fit is accepted. Defaults to 0.009.
+            data_format (str, optional): Format of the saved data table (csv, parquet or feather). Defaults to "csv".
+            n_workers (int, optional): Number of processes fitting the suggested circuits and the perturbed starts
+                in parallel, None uses the number of CPUs. Defaults to 1 (fitted in-process).
+            fit_budget (int, optional): Total number of function evaluations of the successive halving search
+                over the suggested circuits. Defaults to None (every suggested circuit is fitted to convergence).
+            classify_spectrum (bool, optional): If True, only the suggested circuits matching the shape of the
+                spectrum are fitted. Defaults to False.
+            warm_start (tuple, optional): Circuit, fitted parameters and relative RMSE of the previous spectrum
+                of the same cell (see warm_start_seed). The circuit is refined from these parameters and fitted
+                from the start only if the RMSE degrades. Defaults to None.
+            cache_dir (str, optional): Directory of the cache of the Lin-KK and fit results. A spectrum analyzed
+                before with the same settings is not fitted again, with other settings its cached fit is used
+                as warm start. Defaults to None (no caching).
+            cache_size (float, optional): Maximum size of the fit cache [MB]. Defaults to data_cache.CACHE_SIZE.
+            refine_seed (int, optional): Seed of the perturbed starts, the same seed gives the same refinement.
+                Defaults to 0.
+            guess_library (str, optional): Directory of the initial guess library (see build_guess_library).
+                The suggested circuits are started from the parameters of the closest simulated spectrum.
+                Defaults to None (hard-coded initial guesses).
+            fit_timeout (float, optional): Seconds a circuit fitted in a worker process may take before it is
+                recorded as failed, the fits over all workers share one deadline. Defaults to FIT_TIMEOUT.
         """
         self.impedance = impedance
         self.voltage = voltage
@@ -85,6 +131,19 @@ class EIS(EChemProcedure):
         self.cell_constant = cell_constant
         self.max_iterations = max_iterations
         self.threshold_error = threshold_error
+        self.data_format = data_format
+        self.n_workers = n_workers
+        self.fit_budget = fit_budget
+        self.classify_spectrum = classify_spectrum
+        self.warm_start = warm_start
+        self.warm_started = False
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.refine_seed = refine_seed
+        self.guess_library = guess_library
+        self.fit_timeout = fit_timeout
+        self.refinement = None
+        self.spectrum_classification = None
         self.conductivity = None
         self.rmse_calc = None
         self.num_rc_linkk = None
@@ -98,7 +157,7 @@ class EIS(EChemProcedure):
         self.z_fit_clean = None
         self.impedance.phase_shift = self._calculate_phase_shift() if self.impedance.phase_shift is None else self.impedance.phase_shift
         self.figure = None
-        self.pos_img_index = None
+        self.fit_mask = None
 
 
     # Schönleber, M. et al. A Method for Improving the Robustness of
@@ -108,90 +167,343 @@ class EIS(EChemProcedure):
         """General function for performing the impedance analysis.
         This will fit the circuit and calculate the conductivity if is applicable.
         """
-        f_circuit, z_circuit = np.array(self.impedance.frequency), \
-                               np.array(self.impedance.real_impedance +
-               1j*self.impedance.imaginary_impedance)
-
-        self.num_rc_linkk, self.eval_fit_linkk , self.z_linkk, \
-        self.res_real, self.res_imag = validation.linKK(f_circuit, z_circuit,
-                                                        c=self.cut_off,
-                                                        max_M=self.max_rc_element,
-                                                        fit_type=self.fit_type,
-                                                        add_cap=self.val_low_freq)
+        f_circuit, z_circuit = self._spectrum()
+        cache_key = ecache.spectrum_key(f_circuit, z_circuit) if self.cache_dir else None
+        cached = ecache.load_fit_entry(self.cache_dir, cache_key) if self.cache_dir else None
+
+        if cached and cached["linkk_settings"] == self._linkk_settings():
+            log.info("Loaded the Lin-KK results of the spectrum from the cache.")
+            self.num_rc_linkk, self.eval_fit_linkk = cached["linkk"]["num_rc"], cached["linkk"]["eval_fit"]
+            self.z_linkk = ecache.list_to_complex(cached["linkk"]["z"])
+            self.res_real = np.asarray(cached["linkk"]["res_real"])
+            self.res_imag = np.asarray(cached["linkk"]["res_imag"])
+        else:
+            self._kramers_kronig(f_circuit, z_circuit)
         self.chi_val = self._chi_calculation()
         log.info(f"Chi value from lin_KK method is {self.chi_val}")
-
-        if any(x < 0 for x in self.impedance.imaginary_impedance):
-            # Find the indexes of the positive values
-            self.pos_img_index = np.where(self.impedance.imaginary_impedance > 0)
-            f_circuit, z_circuit = preprocessing.ignoreBelowX(f_circuit, z_circuit)
-
+        f_circuit, z_circuit = self._fit_data(f_circuit, z_circuit)
+
+        if cached and cached["fit_settings"] != self._fit_settings() and self.warm_start is None \
+           and self.suggested_circuit in (None, cached["fit"]["circuit"]):
+            # the fit obtained with other settings is refined instead of fitting from the start
+            self.warm_start = tuple(cached["fit"]["warm_start_seed"])
+
+        if cached and cached["fit_settings"] == self._fit_settings():
+            self._restore_cached_fit(cached, f_circuit)
+            log.info(f"Loaded the fitted circuit {self.custom_circuit.circuit} from the cache, "
+                     f"the RMSE error is {self.rmse_calc}")
+        elif self.warm_start is not None and self._fit_warm_start(f_circuit, z_circuit):
+            log.info(f"Refined the warm started circuit {self.custom_circuit.circuit}, "
+                     f"the RMSE error is {self.rmse_calc}")
         # if the user did not choose any circuit, some default suggestions will be applied.
-        if (self.suggested_circuit and self.initial_value) is None:
-
-            for guess_circuit, guess_value in suggested_circuits.items():
-                # apply some random guess
-                guess_value = self._initialize_random_guess(guess_value, min(self.impedance.real_impedance))
-                # fit the data with random circuit and its randomly guessed elements
-                custom_circuit_guess = circuits.CustomCircuit(initial_guess=guess_value, circuit=guess_circuit)
+        elif (self.suggested_circuit and self.initial_value) is None:
 
-                try:
-                    custom_circuit_guess.fit(f_circuit, z_circuit)
-
-                except RuntimeError as exp:
-                    log.error(exp)
-                    continue
-
-                z_fit_guess = custom_circuit_guess.predict(f_circuit)
-                rmse_guess = circuits.fitting.rmse(z_circuit, z_fit_guess)
-                log.info(f"With the guessed circuit {guess_circuit} the RMSE error is {rmse_guess}")
-
-                if self.rmse_calc is None:
-                    self.rmse_calc = rmse_guess
-
-                if rmse_guess <= self.rmse_calc:
-                    self.rmse_calc = rmse_guess
-                    self.custom_circuit = custom_circuit_guess
-                    self.z_fit = z_fit_guess
+            if self.fit_budget:
+                self._search_suggested_circuits(f_circuit, z_circuit)
+            else:
+                self._fit_suggested_circuits(f_circuit, z_circuit)
         else:
-            self.custom_circuit = circuits.CustomCircuit(initial_guess=self.initial_value, circuit=self.suggested_circuit)
-            self.custom_circuit.fit(f_circuit, z_circuit)
-            self.z_fit = self.custom_circuit.predict(f_circuit)
+            self.custom_circuit, self.z_fit = _fit_circuit(circuits.CustomCircuit(initial_guess=self.initial_value,
+                                                                                  circuit=self.suggested_circuit),
+                                                           f_circuit, z_circuit)
             self.rmse_calc = circuits.fitting.rmse(z_circuit, self.z_fit)
             log.info(f"With the guessed circuit {self.suggested_circuit} the RMSE error is {self.rmse_calc}")
 
-            # re-evaluating the fit
-            iteration = 0
-            random_choice = ["add", "subtract"]
             # get the sum of root mean square of the truth values
             rms = np.linalg.norm(z_circuit) / np.sqrt(len(z_circuit))
-            while iteration < self.max_iterations:
-                iteration += 1
-                try:
-                    # fit again if the threshold error is not satisfied
-                    if self.rmse_calc > (self.threshold_error * rms):
-                        # get the initial values according to previous fit and its uncertainty
-                        random_selection = random.choice(random_choice)
-                        if random_selection == "add":
-                            initial_guess_trial = [i+j for i,j in zip(self.custom_circuit.parameters_.tolist(), self.custom_circuit.conf_.tolist())]
-                        else:
-                            initial_guess_trial = [i-j for i,j in zip(self.custom_circuit.parameters_.tolist(), self.custom_circuit.conf_.tolist())]
-                        # refit
-                        self.custom_circuit = circuits.CustomCircuit(initial_guess=initial_guess_trial,\
-                                                                    circuit=self.suggested_circuit).fit(f_circuit, z_circuit, method="trf")
-                        self.z_fit = self.custom_circuit.predict(f_circuit)
-                        self.rmse_calc = circuits.fitting.rmse(z_circuit, self.z_fit)
-                        log.info(f"With re-evaluating the circuit {self.suggested_circuit} the RMSE error is now {self.rmse_calc}")
-
-
-                except Exception as e:
-                    log.error(e)
-                    continue
+            # fit again if the threshold error is not satisfied
+            if self.rmse_calc > (self.threshold_error * rms) and self.max_iterations > 0:
+                self._refine_multistart(f_circuit, z_circuit)
+
+        if self.cache_dir and self.custom_circuit is not None:
+            ecache.store_fit_entry(self.cache_dir, cache_key, self._cache_entry(), self.cache_size)
 
         if self.cell_constant:
             # calculate the ionic conductivity if cell constant is available
             self.conductivity = self._conductivity_calculation()
 
+    def _refine_multistart(self, f_circuit, z_circuit):
+        """Refit the suggested circuit from perturbed starts around the fitted parameters, scaled by
+        their uncertainty. The starts are drawn from the refine seed and fitted in parallel,
+        the best fit is kept if it improves the RMSE.
+
+        Args:
+            f_circuit (np.array): frequencies used for the fit
+            z_circuit (np.array): complex impedance used for the fit
+        """
+        parameters = self.custom_circuit.parameters_
+        uncertainty = np.abs(self.custom_circuit.conf_) if self.custom_circuit.conf_ is not None \
+                      else np.full(len(parameters), np.nan)
+        # parameters without a finite uncertainty are perturbed by their own size
+        uncertainty = np.where(np.isfinite(uncertainty), uncertainty, np.abs(parameters))
+        rng = np.random.default_rng(self.refine_seed)
+        starts = parameters + uncertainty * rng.standard_normal((self.max_iterations, len(parameters)))
+        # starts outside of the bounds are moved half way from the fitted parameters to the bound
+        lower, upper = (np.asarray(bound, dtype=float) for bound in set_default_bounds(self.suggested_circuit))
+        starts = np.where(starts <= lower, (parameters + lower) / 2, starts)
+        starts = np.where(starts > upper, (parameters + upper) / 2, starts)
+
+        results = self._map_circuit_fits(partial(_fit_guess_circuit, f_circuit=f_circuit, z_circuit=z_circuit),
+                                         [(self.suggested_circuit, start.tolist()) for start in starts], _failed_fit)
+        best_start = None
+        for start, (_, custom_circuit, z_fit, rmse) in enumerate(results):
+            if custom_circuit is None:
+                log.error(rmse)
+            elif rmse < self.rmse_calc:
+                best_start, self.custom_circuit, self.z_fit, self.rmse_calc = start, custom_circuit, z_fit, rmse
+        self.refinement = {"seed": self.refine_seed, "starts": self.max_iterations, "best_start": best_start}
+        log.info(f"With re-evaluating the circuit {self.suggested_circuit} from {self.max_iterations} starts "
+                 f"(seed {self.refine_seed}) the RMSE error is now {self.rmse_calc}")
+
+    def _spectrum(self):
+        """Get the frequencies and the complex impedance of the spectrum.
+
+        Returns:
+            tuple: frequencies and complex impedance
+        """
+        return np.array(self.impedance.frequency), \
+               np.array(self.impedance.real_impedance + 1j*self.impedance.imaginary_impedance)
+
+    def _kramers_kronig(self, f_circuit, z_circuit):
+        """Validate the spectrum with the Lin-KK test.
+
+        Args:
+            f_circuit (np.array): frequencies of the spectrum
+            z_circuit (np.array): complex impedance of the spectrum
+        """
+        self.num_rc_linkk, self.eval_fit_linkk , self.z_linkk, \
+        self.res_real, self.res_imag = elkk.lin_kk(f_circuit, z_circuit,
+                                                     c=self.cut_off,
+                                                     max_M=self.max_rc_element,
+                                                     fit_type=self.fit_type,
+                                                     add_cap=self.val_low_freq)
+
+    def _fit_data(self, f_circuit, z_circuit):
+        """Get the part of the spectrum which is used for the fit.
+
+        Args:
+            f_circuit (np.array): frequencies of the spectrum
+            z_circuit (np.array): complex impedance of the spectrum
+
+        Returns:
+            tuple: frequencies and complex impedance used for the fit
+        """
+        if np.any(z_circuit.imag < 0):
+            # keep only the negative imaginary values as preprocessing.ignoreBelowX,
+            # the mask is used again for inserting nan values in the saved fit
+            self.fit_mask = z_circuit.imag < 0
+            f_circuit, z_circuit = f_circuit[self.fit_mask], z_circuit[self.fit_mask]
+        return f_circuit, z_circuit
+
+    def _linkk_settings(self):
+        """Settings of the Lin-KK test, cached results are only used if they were obtained with the same settings."""
+        return {"cut_off": self.cut_off, "max_rc_element": self.max_rc_element,
+                "fit_type": self.fit_type, "val_low_freq": self.val_low_freq}
+
+    def _fit_settings(self):
+        """Settings of the circuit fit, cached results are only used if they were obtained with the same settings."""
+        # the initial value is stored as list, as it is read back from the cache, e.g. the CLI gives a tuple
+        return {"suggested_circuit": self.suggested_circuit,
+                "initial_value": None if self.initial_value is None else list(self.initial_value),
+                "max_iterations": self.max_iterations, "threshold_error": self.threshold_error,
+                "fit_budget": self.fit_budget, "classify_spectrum": self.classify_spectrum,
+                "refine_seed": self.refine_seed,
+                "guess_library": str(self.guess_library) if self.guess_library else None}
+
+    def _cache_entry(self):
+        """Assemble the Lin-KK and fit results for the cache.
+
+        Returns:
+            dict: cache entry
+        """
+        return {"linkk_settings": self._linkk_settings(),
+                "linkk": {"num_rc": int(self.num_rc_linkk), "eval_fit": float(self.eval_fit_linkk),
+                          "z": ecache.complex_to_list(self.z_linkk),
+                          "res_real": np.asarray(self.res_real).tolist(),
+                          "res_imag": np.asarray(self.res_imag).tolist()},
+                "fit_settings": self._fit_settings(),
+                "fit": {"circuit": self.custom_circuit.circuit,
+                        "parameters": self.custom_circuit.parameters_.tolist(),
+                        "conf": None if self.custom_circuit.conf_ is None else self.custom_circuit.conf_.tolist(),
+                        "rmse": float(self.rmse_calc),
+                        "warm_start_seed": list(self.warm_start_seed()),
+                        "spectrum_classification": self.spectrum_classification,
+                        "refinement": self.refinement}}
+
+    def _restore_cached_fit(self, cached, f_circuit):
+        """Restore the fitted circuit from a cache entry.
+
+        Args:
+            cached (dict): cache entry
+            f_circuit (np.array): frequencies used for the fit
+        """
+        fit = cached["fit"]
+        self.custom_circuit = circuits.CustomCircuit(initial_guess=fit["parameters"], circuit=fit["circuit"])
+        self.custom_circuit.parameters_ = np.array(fit["parameters"])
+        self.custom_circuit.conf_ = None if fit["conf"] is None else np.array(fit["conf"])
+        self.z_fit = ecirc.compile_circuit(fit["circuit"]).predict(fit["parameters"], f_circuit) \
+                     if ecirc.is_supported(fit["circuit"]) else self.custom_circuit.predict(f_circuit)
+        self.rmse_calc = fit["rmse"]
+        self.spectrum_classification = fit["spectrum_classification"]
+        self.refinement = fit["refinement"]
+
+
+    def _fit_warm_start(self, f_circuit, z_circuit):
+        """Refine the circuit of the previous spectrum starting from its fitted parameters.
+
+        Args:
+            f_circuit (np.array): frequencies used for the fit
+            z_circuit (np.array): complex impedance used for the fit
+
+        Returns:
+            bool: True if the refined fit is kept, False if the spectrum has to be fitted from the start
+        """
+        circuit, parameters, previous_rmse = self.warm_start
+        try:
+            custom_circuit, z_fit = _fit_circuit(circuits.CustomCircuit(initial_guess=list(parameters), circuit=circuit),
+                                                 f_circuit, z_circuit)
+        except Exception as exp: # pylint: disable=broad-except
+            log.warning(f"Refining the circuit {circuit} of the previous spectrum failed: {exp}")
+            return False
+        rmse = circuits.fitting.rmse(z_circuit, z_fit)
+        relative_rmse = rmse / (np.linalg.norm(z_circuit) / np.sqrt(len(z_circuit)))
+        if not relative_rmse <= max(WARM_START_TOLERANCE * previous_rmse, self.threshold_error):
+            log.info(f"Refining the circuit {circuit} of the previous spectrum degraded the relative RMSE "
+                     f"from {previous_rmse} to {relative_rmse}, the spectrum is fitted from the start.")
+            return False
+        self.custom_circuit, self.z_fit, self.rmse_calc = custom_circuit, z_fit, rmse
+        self.warm_started = True
+        return True
+
+    def warm_start_seed(self):
+        """Get the fitted circuit for warm starting the fit of the next spectrum of the same cell.
+
+        Returns:
+            tuple: circuit string, fitted parameters and relative RMSE (RMSE divided by the RMS of the impedance)
+        """
+        z_circuit = np.array(self.impedance.real_impedance + 1j*self.impedance.imaginary_impedance)
+        if self.fit_mask is not None:
+            z_circuit = z_circuit[self.fit_mask]
+        rms = np.linalg.norm(z_circuit) / np.sqrt(len(z_circuit))
+        return self.custom_circuit.circuit, self.custom_circuit.parameters_.tolist(), self.rmse_calc / rms
+
+    def _fit_suggested_circuits(self, f_circuit, z_circuit):
+        """Fit all suggested circuits in parallel and keep the one with the lowest RMSE.
+        The results are reduced in the order of the suggested circuits, so the choice does
+        not depend on which process finishes first.
+
+        Args:
+            f_circuit (np.array): frequencies used for the fit
+            z_circuit (np.array): complex impedance used for the fit
+        """
+        guesses = [(guess_circuit, self._initial_guess(guess_circuit, guess_value))
+                   for guess_circuit, guess_value in self._candidate_circuits().items()]
+        results = self._map_circuit_fits(partial(_fit_guess_circuit, f_circuit=f_circuit, z_circuit=z_circuit),
+                                         guesses, _failed_fit)
+
+        for guess_circuit, custom_circuit_guess, z_fit_guess, rmse_guess in results:
+            if custom_circuit_guess is None:
+                log.error(rmse_guess)
+                continue
+            log.info(f"With the guessed circuit {guess_circuit} the RMSE error is {rmse_guess}")
+
+            if self.rmse_calc is None:
+                self.rmse_calc = rmse_guess
+
+            if rmse_guess <= self.rmse_calc:
+                self.rmse_calc = rmse_guess
+                self.custom_circuit = custom_circuit_guess
+                self.z_fit = z_fit_guess
+
+    def _candidate_circuits(self):
+        """Get the suggested circuits to be fitted. If the spectrum is classified, only the circuits
+        matching its shape are kept and the decision is stored for saving it with the circuit.
+
+        Returns:
+            dict: circuit strings and their initial guesses
+        """
+        if not self.classify_spectrum:
+            return suggested_circuits
+        features = eclf.extract_spectrum_features(self.impedance.frequency, self.impedance.real_impedance,
+                                                  self.impedance.imaginary_impedance)
+        candidates = eclf.select_compatible_circuits(features, suggested_circuits)
+        self.spectrum_classification = {**features, "candidate_circuits": list(candidates)}
+        return candidates
+
+    def _search_suggested_circuits(self, f_circuit, z_circuit):
+        """Successive halving search over the suggested circuits. Every circuit is fitted with a
+        small number of function evaluations, the better half by RMSE is kept and fitted further
+        from where it stopped with a larger number of evaluations, until one circuit remains.
+        The fit budget is split evenly over the rounds, the remaining circuit is fitted to convergence.
+
+        Args:
+            f_circuit (np.array): frequencies used for the fit
+            z_circuit (np.array): complex impedance used for the fit
+        """
+        candidates = [(guess_circuit, self._initial_guess(guess_circuit, guess_value))
+                      for guess_circuit, guess_value in self._candidate_circuits().items()]
+        n_rounds = max(1, int(np.ceil(np.log2(len(candidates)))))
+        log.info(f"Searching {len(candidates)} suggested circuits with a budget of {self.fit_budget} "
+                 f"function evaluations in {n_rounds} rounds.")
+
+        while len(candidates) > 1:
+            max_nfev = max(1, self.fit_budget // (n_rounds * len(candidates)))
+            results = self._map_circuit_fits(partial(_fit_guess_circuit_budget, f_circuit=f_circuit,
+                                                     z_circuit=z_circuit, max_nfev=max_nfev), candidates,
+                                             _failed_fit_budget)
+            for guess_circuit, parameters, rmse_guess in results:
+                if parameters is None:
+                    log.error(rmse_guess)
+            # the sort is stable, circuits with the same RMSE keep the order of the suggested circuits
+            ranked = sorted([result for result in results if result[1] is not None], key=lambda result: result[2])
+            if not ranked:
+                log.error("None of the suggested circuits could be fitted.")
+                raise RuntimeError("None of the suggested circuits could be fitted.")
+            ranked = ranked[:max(1, len(ranked) // 2)]
+            log.info(f"With {max_nfev} function evaluations per circuit the kept circuits are: " +
+                     ", ".join(f"{guess_circuit} (RMSE {rmse_guess})" for guess_circuit, _, rmse_guess in ranked))
+            candidates = [(guess_circuit, parameters.tolist()) for guess_circuit, parameters, _ in ranked]
+
+        guess_circuit, guess_value = candidates[0]
+        _, self.custom_circuit, self.z_fit, self.rmse_calc = _fit_guess_circuit(candidates[0], f_circuit, z_circuit)
+        if self.custom_circuit is None:
+            # keep the parameters of the search if fitting to convergence failed
+            log.error(self.rmse_calc)
+            self.custom_circuit = circuits.CustomCircuit(initial_guess=guess_value, circuit=guess_circuit)
+            self.custom_circuit.parameters_ = np.array(guess_value)
+            self.z_fit = self.custom_circuit.predict(f_circuit)
+            self.rmse_calc = circuits.fitting.rmse(z_circuit, self.z_fit)
+        log.info(f"The selected circuit is {guess_circuit} with the RMSE error {self.rmse_calc}")
+
+    def _map_circuit_fits(self, fit, guesses, failed):
+        """Fit the guessed circuits in parallel processes, in-process if only one worker is used.
+        All fits share one deadline of the fit timeout for every round of fits over the workers.
+        Fits which have not returned by then are recorded as failed and the processes are stopped.
+
+        Args:
+            fit (callable): fitting function applied to each guess
+            guesses (list): circuit strings and their initial guesses
+            failed (callable): builds the result of a failed fit from the guess and the error message
+
+        Returns:
+            list: results of the fits in the order of the guesses
+        """
+        n_workers = min(self.n_workers or os.cpu_count() or 1, len(guesses))
+        if n_workers <= 1:
+            return [fit(guess) for guess in guesses]
+        log.info(f"Fitting {len(guesses)} circuits with {n_workers} processes.")
+        deadline = time.monotonic() + self.fit_timeout * int(np.ceil(len(guesses) / n_workers))
+        results = []
+        # leaving the pool terminates its processes, including the ones of fits which did not return
+        with Pool(processes=n_workers) as pool:
+            pending = [pool.apply_async(fit, (guess,)) for guess in guesses]
+            for guess, result in zip(guesses, pending):
+                try:
+                    results.append(result.get(timeout=max(0, deadline - time.monotonic())))
+                except PoolTimeoutError:
+                    results.append(failed(guess, f"Fitting the guessed circuit {guess[0]} did not finish "
+                                                 f"within the timeout of {self.fit_timeout} s per fit."))
+        return results
 
     def plot(self, save_dir, plots, optional_name: str = None):
         """Plot the results of the analysis.
@@ -263,9 +575,13 @@ class EIS(EChemProcedure):
         self.custom_circuit.save(os.path.join(save_dir, f"{name}"))
         added_data = {'rc_linKK': self.num_rc_linkk, "eval_fit_linKK": self.eval_fit_linkk, "RMSE_fit_error": self.rmse_calc,
                       "conductivity [S/cm]": self.conductivity, "chi_square": self.chi_val}
+        if self.spectrum_classification is not None:
+            added_data["spectrum_classification"] = self.spectrum_classification
+        if self.refinement is not None:
+            added_data["refinement"] = self.refinement
         utils.append_to_save_data(directory=save_dir, added_data=added_data, name=name)
         # check if the positive index is available
-        if self.pos_img_index is not None:
+        if self.fit_mask is not None:
             try:
                 self._insert_nan_values()
             except Exception as e:
@@ -279,10 +595,10 @@ class EIS(EChemProcedure):
                                             "impedance [\u03a9]": self.impedance.real_impedance + 1j*self.impedance.imaginary_impedance,
                                             "fit_impedance [\u03a9]": self.z_fit_clean, "residual_real":self.res_real, "residual_imag":self.res_imag,
                                             "Z_linKK [\u03a9]": self.z_linkk})
-        data_name = utils.assemble_file_name(optional_name, self.__class__.__name__, "data.csv") if \
-                        optional_name else  utils.assemble_file_name(self.__class__.__name__, "data.csv")
+        data_name = utils.assemble_file_name(optional_name, self.__class__.__name__, f"data.{self.data_format}") if \
+                        optional_name else  utils.assemble_file_name(self.__class__.__name__, f"data.{self.data_format}")
 
-        utils.save_data_as_csv(save_dir, data, data_name)
+        utils.save_data_table(save_dir, data, data_name, self.data_format)
 
     def perform_all_actions(self, save_dir:str, plots:list, optional_name:str = None):
         """ Wrapper function for executing all action
@@ -349,6 +665,24 @@ class EIS(EChemProcedure):
                              abs(-self.impedance.imaginary_impedance)/da.format_data(abs(self.impedance.real_impedance))))
         return np.rad2deg(phase_shift_in_rad)
 
+    def _initial_guess(self, guess_circuit, guess_value):
+        """Get the initial guess of a suggested circuit, the parameters of the closest spectrum of the
+        guess library if it is given and contains the circuit, otherwise the hard-coded guess.
+
+        Args:
+            guess_circuit (str): suggested circuit
+            guess_value (list): hard-coded initial guess of the suggested circuit
+
+        Returns:
+            list: initial guess
+        """
+        if self.guess_library:
+            library_guess = elib.lookup_initial_guess(self.guess_library, guess_circuit, *self._spectrum())
+            if library_guess is not None:
+                return library_guess
+            log.info(f"The guess library has no initial guess of the circuit {guess_circuit}, the hard-coded guess is used.")
+        return self._initialize_random_guess(guess_value, min(self.impedance.real_impedance))
+
     def _initialize_random_guess(self, guess_value, guess_initial_resistance):
         """Initialize the random guess for the circuit's resistace.
 
@@ -365,59 +699,694 @@ class EIS(EChemProcedure):
     def _insert_nan_values(self):
         """Insert nan values in the fit for the positive imaginary impedance values.
         """
-        self.z_fit_clean = np.empty(len(self.z_fit) + len(self.pos_img_index[0]), dtype=np.complex128)
-        self.z_fit_clean[:] = np.nan
-        j = 0
-        for i in enumerate(self.z_fit_clean):
-            if i in self.pos_img_index[0].tolist():
+        self.z_fit_clean = np.full(len(self.fit_mask), np.nan, dtype=np.complex128)
+        self.z_fit_clean[self.fit_mask] = self.z_fit
+
+def analyze_sequence(impedances, **kwargs):
+    """Fit an ordered series of spectra of the same cell, e.g. of an operando or temperature series.
+    Every spectrum is warm started from the fit of the previous one and only fitted from
+    the start if the RMSE degrades.
+
+    Args:
+        impedances (list): EImpedance objects in the order of the measurement
+        **kwargs: keyword arguments of EIS
+
+    Returns:
+        list: the analyzed EIS objects
+    """
+    results, warm_start = [], None
+    for impedance in impedances:
+        eis = EIS(impedance, warm_start=warm_start, **kwargs)
+        eis.analyze()
+        warm_start = eis.warm_start_seed() if eis.custom_circuit is not None else None
+        results.append(eis)
+    log.info(f"Fitted {len(results)} spectra, {sum(eis.warm_started for eis in results)} of them warm started.")
+    return results
+
+
+def analyze_stacked(impedances, suggested_circuit:str, initial_value:list, **kwargs):
+    """Fit one circuit to many spectra as one stacked least squares problem, the circuit is
+    evaluated once for all spectra per iteration instead of once per spectrum. Every spectrum
+    is validated with the Lin-KK test on its own.
+
+    Args:
+        impedances (list): EImpedance objects
+        suggested_circuit (str): circuit fitted to all spectra
+        initial_value (list): initial parameters, shared or one list per spectrum
+        **kwargs: keyword arguments of EIS
+
+    Returns:
+        list: the analyzed EIS objects
+    """
+    if not ecirc.is_supported(suggested_circuit):
+        log.error(f"The circuit {suggested_circuit} can not be compiled for the stacked fit. "
+                  f"Supported elements are: {list(ecirc.ELEMENTS)}")
+        raise ValueError(f"The circuit {suggested_circuit} can not be compiled for the stacked fit.")
+    # pylint: disable=protected-access
+    procedures, fit_data = [], []
+    for impedance in impedances:
+        eis = EIS(impedance, suggested_circuit=suggested_circuit, initial_value=initial_value, **kwargs)
+        f_circuit, z_circuit = eis._spectrum()
+        eis._kramers_kronig(f_circuit, z_circuit)
+        eis.chi_val = eis._chi_calculation()
+        procedures.append(eis)
+        fit_data.append(eis._fit_data(f_circuit, z_circuit))
+
+    compiled = ecirc.compile_circuit(suggested_circuit)
+    parameters, errors, _ = compiled.fit_stacked([f_circuit for f_circuit, _ in fit_data],
+                                                 [z_circuit for _, z_circuit in fit_data], initial_value)
+    for eis, (f_circuit, z_circuit), spectrum_parameters, spectrum_errors in zip(procedures, fit_data, parameters, errors):
+        eis.custom_circuit = circuits.CustomCircuit(initial_guess=spectrum_parameters.tolist(), circuit=suggested_circuit)
+        eis.custom_circuit.parameters_, eis.custom_circuit.conf_ = spectrum_parameters, spectrum_errors
+        eis.z_fit = compiled.predict(spectrum_parameters, f_circuit)
+        eis.rmse_calc = circuits.fitting.rmse(z_circuit, eis.z_fit)
+        if eis.cell_constant:
+            eis.conductivity = eis._conductivity_calculation()
+    log.info(f"Fitted the circuit {suggested_circuit} to {len(procedures)} spectra at once.")
+    return procedures
+
+
+def _fit_circuit(custom_circuit, f_circuit, z_circuit):
+    """Fit a circuit with the compiled circuit and its analytic Jacobian. Circuits with elements
+    which can not be compiled are fitted by the impedance package.
+
+    Args:
+        custom_circuit (CustomCircuit): circuit with its initial guess
+        f_circuit (np.array): frequencies used for the fit
+        z_circuit (np.array): complex impedance used for the fit
+
+    Returns:
+        tuple: fitted circuit and fitted impedance
+    """
+    if ecirc.is_supported(custom_circuit.circuit):
+        return ecirc.fit_custom_circuit(custom_circuit, f_circuit, z_circuit)
+    custom_circuit.fit(f_circuit, z_circuit)
+    return custom_circuit, custom_circuit.predict(f_circuit)
+
+
+def _fit_guess_circuit(guess, f_circuit, z_circuit):
+    """Fit a suggested circuit with its initial guess. This runs in a worker process,
+    so a failing fit is returned instead of raised.
+
+    Args:
+        guess (tuple): circuit string and its initial guess
+        f_circuit (np.array): frequencies used for the fit
+        z_circuit (np.array): complex impedance used for the fit
+
+    Returns:
+        tuple: circuit string, fitted circuit, fitted impedance and RMSE
+            (fitted circuit and impedance are None and the RMSE is the error message if the fit failed)
+    """
+    guess_circuit, guess_value = guess
+    # fit the data with random circuit and its randomly guessed elements
+    try:
+        custom_circuit_guess, z_fit_guess = _fit_circuit(circuits.CustomCircuit(initial_guess=guess_value,
+                                                                                circuit=guess_circuit),
+                                                         f_circuit, z_circuit)
+    except Exception as exp: # pylint: disable=broad-except
+        return guess_circuit, None, None, f"Fitting the guessed circuit {guess_circuit} failed: {exp}"
+    return guess_circuit, custom_circuit_guess, z_fit_guess, circuits.fitting.rmse(z_circuit, z_fit_guess)
+
+
+def _failed_fit(guess, message):
+    """Result of a failed fit of _fit_guess_circuit.
+
+    Args:
+        guess (tuple): circuit string and its initial guess
+        message (str): error message
+
+    Returns:
+        tuple: circuit string, None for the fitted circuit and impedance and the error message
+    """
+    return guess[0], None, None, message
+
+
+def _failed_fit_budget(guess, message):
+    """Result of a failed fit of _fit_guess_circuit_budget.
+
+    Args:
+        guess (tuple): circuit string and its initial guess
+        message (str): error message
+
+    Returns:
+        tuple: circuit string, None for the parameters and the error message
+    """
+    return guess[0], None, message
+
+
+def _fit_guess_circuit_budget(guess, f_circuit, z_circuit, max_nfev):
+    """Fit a circuit with a limited number of function evaluations, with the same
+    bounds and tolerance as the fit of the impedance package.
+
+    Args:
+        guess (tuple): circuit string and its initial guess
+        f_circuit (np.array): frequencies used for the fit
+        z_circuit (np.array): complex impedance used for the fit
+        max_nfev (int): maximum number of function evaluations
+
+    Returns:
+        tuple: circuit string, parameters reached and RMSE
+            (parameters are None and the RMSE is the error message if the fit failed)
+    """
+    guess_circuit, guess_value = guess
+    try:
+        if ecirc.is_supported(guess_circuit):
+            _, _, result = ecirc.compile_circuit(guess_circuit).fit(f_circuit, z_circuit, guess_value,
+                                                                    max_nfev=max_nfev)
+        else:
+            model = wrapCircuit(guess_circuit, {})
+            z_stacked = np.hstack([z_circuit.real, z_circuit.imag])
+            result = least_squares(lambda parameters: model(f_circuit, *parameters) - z_stacked, guess_value,
+                                   bounds=set_default_bounds(guess_circuit), method="trf", ftol=1e-13,
+                                   max_nfev=max_nfev)
+    except Exception as exp: # pylint: disable=broad-except
+        return guess_circuit, None, f"Fitting the guessed circuit {guess_circuit} failed: {exp}"
+    # the stacked residual has twice the length of the impedance
+    rmse_guess = np.linalg.norm(result.fun) / np.sqrt(len(z_circuit))
+    if not np.isfinite(rmse_guess):
+        return guess_circuit, None, f"Fitting the guessed circuit {guess_circuit} failed: RMSE is not finite"
+    return guess_circuit, result.x, rmse_guess
+
+
+class DRT(EChemProcedure):
+    """ Class for the distribution of relaxation times of an EIS spectrum, a fast screening
+    of its processes without fitting equivalent circuits.
+
+    Args:
+        EChemProcedure (cls): Parent abstract class
+    """
+    def __init__(self, impedance, voltage: float = None, regularization: float = None,
+                 points_per_decade: int = edrt.DRT_POINTS_PER_DECADE, fit_inductance: bool = True,
+                 data_format:str = "csv"):
+        """ Initialize the DRT class.
+
+        Args:
+            impedance (np.array): Impedance data containing real and imaginary part.
+            voltage (float, optional): Voltage of the EIS measurement. Defaults to None.
+            regularization (float, optional): Regularization strength. Defaults to None (chosen from the sweep
+                of edrt.REGULARIZATION_STRENGTHS by generalized cross validation).
+            points_per_decade (int, optional): Time constants per decade. Defaults to edrt.DRT_POINTS_PER_DECADE.
+            fit_inductance (bool, optional): If True, a series inductance is part of the model. Defaults to True.
+            data_format (str, optional): Format of the saved data table (csv, parquet or feather). Defaults to "csv".
+        """
+        self.impedance = impedance
+        self.voltage = voltage
+        self.regularization = regularization
+        self.points_per_decade = points_per_decade
+        self.fit_inductance = fit_inductance
+        self.data_format = data_format
+        self.tau = None
+        self.gamma = None
+        self.r_inf = None
+        self.inductance = None
+        self.z_drt = None
+        self.regularization_strength = None
+        self.sweep = None
+        self.peaks = None
+        self.polarization_resistance = None
+        self.res_real = None
+        self.res_imag = None
+        self.impedance.phase_shift = self._calculate_phase_shift() if self.impedance.phase_shift is None else self.impedance.phase_shift
+        self.figure = None
+
+    def analyze(self):
+        """Find the distribution of relaxation times and its peaks.
+        """
+        f_drt = np.array(self.impedance.frequency)
+        z_drt = np.array(self.impedance.real_impedance + 1j*self.impedance.imaginary_impedance)
+        result = edrt.fit_drt(f_drt, z_drt, regularization=self.regularization,
+                              points_per_decade=self.points_per_decade, inductance=self.fit_inductance)
+        self.tau, self.gamma, self.z_drt = result["tau"], result["gamma"], result["z_drt"]
+        self.r_inf, self.inductance = result["r_inf"], result["inductance"]
+        self.regularization_strength, self.sweep = result["regularization"], result["sweep"]
+        self.peaks = edrt.drt_peaks(self.tau, self.gamma)
+        self.polarization_resistance = float(np.sum(self.gamma) * np.log(self.tau[1] / self.tau[0]))
+        residuals = (z_drt - self.z_drt) / np.abs(z_drt)
+        self.res_real, self.res_imag = residuals.real, residuals.imag
+        log.info(f"The DRT has {len(self.peaks)} peaks at {[peak['tau'] for peak in self.peaks]} [s], "
+                 f"the polarization resistance is {self.polarization_resistance} [\u03a9].")
+
+    def plot(self, save_dir, plots, optional_name: str = None):
+        """Plot the results of the analysis.
+
+        Args:
+            save_dir (str): directory where to save the data
+            plots (list): list of plot types to be plotted
+            optional_name (str, optional): name of the file to be saved. Defaults to None.
+        """
+        if not 1 <= len(plots) <= 5:
+            log.error(f"The DRT can plot between one and five plots, {len(plots)} were selected.")
+            raise ValueError("The DRT can plot between one and five plots.")
+        plot_dir = utils.create_dir(os.path.join(save_dir, "plots"))
+        plot = iplt()
+        fig, available_axes = plot.compose_eis_subplot(plots=plots)
+
+        for sub_ax, plot_name in zip(available_axes, plots):
+            if plot_name == "nyquist":
+                plot.nyquist(subplot_ax=sub_ax, frequency=self.impedance.frequency, real_impedance=self.impedance.real_impedance,
+                             imaginary_impedance=self.impedance.imaginary_impedance,
+                             ax_sci_notation='both', scientific_limit=3, scientific_label_colorbar=False, legend_label=True,
+                             voltage=self.voltage, norm_color=True)
+
+            elif plot_name == "nyquist_fit":
+                plot.nyquist_fit(subplot_ax=sub_ax, frequency=self.impedance.frequency, real_impedance=self.impedance.real_impedance,
+                                 imaginary_impedance=self.impedance.imaginary_impedance, fitted_impedance=self.z_drt,
+                                 chi=np.sum(np.square(self.res_real) + np.square(self.res_imag)), suggested_circuit="DRT",
+                                 ax_sci_notation="both", scientific_limit=3, scientific_label_colorbar=False, legend_label=True,
+                                 voltage=self.voltage, norm_color=True)
+
+            elif plot_name == "bode":
+                plot.bode(subplot_ax=sub_ax, frequency=self.impedance.frequency, real_impedance=self.impedance.real_impedance,
+                          imaginary_impedance=self.impedance.imaginary_impedance,
+                          phase_shift=self.impedance.phase_shift, ax_sci_notation="y", scientific_limit=3, log_scale="x")
+
+            elif plot_name == "residual":
+                plot.residual(subplot_ax=sub_ax, frequency=self.impedance.frequency, res_real=self.res_real,
+                              res_imag=self.res_imag, log_scale='x')
+
+            elif plot_name == "drt":
+                plot.drt(subplot_ax=sub_ax, tau=self.tau, gamma=self.gamma, peaks=self.peaks,
+                         regularization=self.regularization_strength, ax_sci_notation="y", scientific_limit=3)
+
+            else:
+                log.error("DRT class does not have the selected plot.")
                 continue
-            self.z_fit_clean[i] = self.z_fit[j]
-            j += 1
 
-class Mottschotcky(EIS, EChemProcedure):
-    """ Class for performing the Mottschotcky procedure.
+        fig.tight_layout()
+        self.figure = fig
+        name = utils.assemble_file_name(optional_name, self.__class__.__name__) if \
+                    optional_name else utils.assemble_file_name(self.__class__.__name__)
+
+        plot.save_plot(fig, plot_dir, name)
+
+    def save_data(self, save_dir:str, optional_name:str = None):
+        """Save the results of the analysis.
+
+        Args:
+            save_dir (str): Directory where the data should be saved.
+            optional_name (None): Optional name for the data.
+        """
+        save_dir = utils.create_dir(os.path.join(save_dir, "data"))
+        name = utils.assemble_file_name(optional_name, self.__class__.__name__, "params.json") if \
+               optional_name else utils.assemble_file_name(self.__class__.__name__, "params.json")
+        utils.save_data_as_json(directory=save_dir, name=name,
+                                data={"R_inf [\u03a9]": self.r_inf, "L [H]": self.inductance,
+                                      "polarization_resistance [\u03a9]": self.polarization_resistance,
+                                      "regularization": self.regularization_strength, "peaks": self.peaks,
+                                      "regularization_sweep": self.sweep})
+
+        data = utils.assemble_data_frame(**{"frequency [Hz]": self.impedance.frequency,
+                                            "impedance [\u03a9]": self.impedance.real_impedance + 1j*self.impedance.imaginary_impedance,
+                                            "DRT_impedance [\u03a9]": self.z_drt, "residual_real": self.res_real,
+                                            "residual_imag": self.res_imag})
+        data_name = utils.assemble_file_name(optional_name, self.__class__.__name__, f"data.{self.data_format}") if \
+                        optional_name else utils.assemble_file_name(self.__class__.__name__, f"data.{self.data_format}")
+        utils.save_data_table(save_dir, data, data_name, self.data_format)
+
+        distribution = utils.assemble_data_frame(**{"tau [s]": self.tau, "gamma [\u03a9]": self.gamma})
+        distribution_name = utils.assemble_file_name(optional_name, self.__class__.__name__, f"distribution.{self.data_format}") if \
+                        optional_name else utils.assemble_file_name(self.__class__.__name__, f"distribution.{self.data_format}")
+        utils.save_data_table(save_dir, distribution, distribution_name, self.data_format)
+
+    def perform_all_actions(self, save_dir:str, plots:list, optional_name:str = None):
+        """ Wrapper function for executing all action
+
+        Args:
+            save_dir (str): Directory where the data should be saved.
+            plots (list): List of plot types to be plotted.
+        """
+        self.analyze()
+        self.plot(save_dir, plots, optional_name=optional_name)
+        self.save_data(save_dir=save_dir, optional_name=optional_name)
+
+    @property
+    def figure(self):
+        """Get the figure of the plot.
+
+        Returns:
+            obj: Figure object for the DRT plot.
+        """
+        return self._figure
+
+    @figure.setter
+    def figure(self, figure):
+        """Set the figure of the plot.
+
+        Args:
+            figure (obj): Figure object for the DRT plot.
+        """
+        self._figure = figure
+
+    def _calculate_phase_shift(self):
+        """calculate phase shift
+
+        Returns:
+            phase shift: calculated phase shift based on real and imaginary data
+        """
+        phase_shift_in_rad = np.arctan(da.format_data(
+                             abs(-self.impedance.imaginary_impedance)/da.format_data(abs(self.impedance.real_impedance))))
+        return np.rad2deg(phase_shift_in_rad)
+
+
+class Mottschotcky(EChemProcedure):
+    """ Class for performing the Mottschotcky procedure. The spectra of the whole potential series
+    are analyzed at once: the space charge capacitance of every potential is taken from the series
+    RC model at the analysis frequency and 1/C\u00b2 is fitted linearly against the potential.
 
     Args:
-        EIS (class): General EIS class
         EChemProcedure (class): General abstract EChem Procedure class
     """
-    def __init__(self, impedance, suggested_circuit: str = None, initial_value=None,
-                 max_rc_element: int = 20, cut_off: float = 0.85, fit_type: str = 'complex', val_low_freq=True):
-        EIS.__init__(impedance, suggested_circuit, initial_value, max_rc_element, cut_off, fit_type, val_low_freq)
+    def __init__(self, impedance, potential, analysis_frequency: float = MOTT_SCHOTTKY_FREQUENCY,
+                 electrode_area: float = 1.0, dielectric_constant: float = None, temperature: float = 298.15,
+                 fit_range: list = None, data_format: str = "csv"):
+        """ Initialize the Mottschotcky class.
+
+        Args:
+            impedance (EImpedance): Impedance data of all spectra, one below the other.
+            potential (np.array): Applied potential [V] of every row of the impedance data.
+            analysis_frequency (float, optional): Frequency [Hz] at which the capacitance is evaluated, the closest
+                measured frequency of every spectrum is used. Defaults to MOTT_SCHOTTKY_FREQUENCY.
+            electrode_area (float, optional): Electrode area [cm\u00b2]. Defaults to 1.0.
+            dielectric_constant (float, optional): Relative permittivity of the semiconductor, needed for the
+                doping density. Defaults to None.
+            temperature (float, optional): Temperature [K]. Defaults to 298.15.
+            fit_range (list, optional): Lower and upper potential [V] of the linear region. Defaults to None (all potentials).
+            data_format (str, optional): Format of the saved data table (csv, parquet or feather). Defaults to "csv".
+        """
+        self.impedance = impedance
+        self.potential = potential
+        self.analysis_frequency = analysis_frequency
+        self.electrode_area = electrode_area
+        self.dielectric_constant = dielectric_constant
+        self.temperature = temperature
+        self.fit_range = fit_range
+        self.data_format = data_format
+        self.potentials = None
+        self.frequencies = None
+        self.capacitance = None
+        self.inverse_square_capacitance = None
+        self.fit_mask = None
+        self.inverse_square_capacitance_fit = None
+        self.slope = None
+        self.intercept = None
+        self.fit_score = None
+        self.semiconductor_type = None
+        self.flat_band_potential = None
+        self.doping_density = None
+        self.figure = None
 
     def analyze(self):
-        pass
+        """Extract the space charge capacitance of every potential and fit the Mott-Schottky equation.
+        """
+        frequency = np.asarray(self.impedance.frequency, dtype=float)
+        imaginary_impedance = np.asarray(self.impedance.imaginary_impedance, dtype=float)
+        potential = np.asarray(self.potential, dtype=float)
+        if frequency.size == 0 or not frequency.size == imaginary_impedance.size == potential.size:
+            log.error("The potential has to be given for every row of the impedance data, which can not be empty.")
+            raise ValueError("The potential has to be given for every row of the impedance data.")
+
+        # the row closest to the analysis frequency (on a log scale) of every potential
+        self.potentials, spectrum = np.unique(potential, return_inverse=True)
+        distance = np.abs(np.log(frequency / self.analysis_frequency))
+        order = np.lexsort((distance, spectrum))
+        rows = order[np.r_[True, np.diff(spectrum[order]) != 0]]
+        self.frequencies = frequency[rows]
+        # series RC model, capacitive rows only
+        with np.errstate(divide="ignore"):
+            capacitance = np.where(imaginary_impedance[rows] < 0,
+                                   -1 / (2 * np.pi * self.frequencies * imaginary_impedance[rows]), np.nan)
+        self.capacitance = capacitance / self.electrode_area
+        self.inverse_square_capacitance = 1 / self.capacitance**2
+
+        self.fit_mask = np.isfinite(self.inverse_square_capacitance)
+        if self.fit_range is not None:
+            self.fit_mask &= (self.potentials >= min(self.fit_range)) & (self.potentials <= max(self.fit_range))
+        if np.count_nonzero(self.fit_mask) < 2:
+            log.error("The Mott-Schottky fit needs at least two potentials with a capacitive response in the fit range.")
+            raise ValueError("Not enough potentials for the Mott-Schottky fit.")
+
+        reg = LinearRegression().fit(self.potentials[self.fit_mask].reshape(-1, 1),
+                                     self.inverse_square_capacitance[self.fit_mask])
+        self.fit_score = reg.score(self.potentials[self.fit_mask].reshape(-1, 1),
+                                   self.inverse_square_capacitance[self.fit_mask])
+        self.slope, self.intercept = reg.coef_[0], reg.intercept_
+        self.inverse_square_capacitance_fit = reg.predict(self.potentials.reshape(-1, 1))
+
+        # 1/C² = ±2/(e ε ε0 N) (E - E_fb ∓ kT/e), positive slope for n-type semiconductors
+        self.semiconductor_type = "n" if self.slope > 0 else "p"
+        thermal_voltage = BOLTZMANN_CONSTANT * self.temperature / ELEMENTARY_CHARGE
+        self.flat_band_potential = -self.intercept / self.slope - (thermal_voltage if self.slope > 0 else -thermal_voltage)
+        if self.dielectric_constant:
+            self.doping_density = 2 / (ELEMENTARY_CHARGE * self.dielectric_constant * VACUUM_PERMITTIVITY * abs(self.slope))
+        log.info(f"The {self.semiconductor_type}-type flat band potential is {self.flat_band_potential} [V] "
+                 f"and the doping density is {self.doping_density} [cm\u207b\u00b3] with the score {self.fit_score}.")
+
+    def plot(self, save_dir:str, plots:list, optional_name:str = None):
+        """Plot the results of the analysis.
+
+        Args:
+            save_dir (str): directory where to save the data
+            plots (list): list of plot types to be plotted
+            optional_name (str, optional): name of the file to be saved. Defaults to None.
+        """
+        plot_dir = utils.create_dir(os.path.join(save_dir, "plots"))
+        plot = iplt()
+        fig, available_axes = plot.compose_eis_subplot(plots=plots)
+
+        for sub_ax, plot_name in zip(available_axes, plots):
+            if plot_name == "nyquist":
+                plot.nyquist(subplot_ax=sub_ax, frequency=self.impedance.frequency, real_impedance=self.impedance.real_impedance,
+                             imaginary_impedance=self.impedance.imaginary_impedance,
+                             ax_sci_notation='both', scientific_limit=3, scientific_label_colorbar=False, norm_color=True)
+
+            elif plot_name == "mott_schottky":
+                plot.mott_schottky(subplot_ax=sub_ax, potential=self.potentials,
+                                   inverse_square_capacitance=self.inverse_square_capacitance)
+
+            elif plot_name == "mott_schottky_fit":
+                plot.mott_schottky(subplot_ax=sub_ax, potential=self.potentials,
+                                   inverse_square_capacitance=self.inverse_square_capacitance,
+                                   fit_mask=self.fit_mask, inverse_square_capacitance_fit=self.inverse_square_capacitance_fit,
+                                   flat_band_potential=self.flat_band_potential, doping_density=self.doping_density)
+
+            else:
+                log.error("Mottschotcky class does not have the selected plot.")
+                continue
+
+        fig.tight_layout()
+        self.figure = fig
+        name = utils.assemble_file_name(optional_name, self.__class__.__name__) if \
+                    optional_name else utils.assemble_file_name(self.__class__.__name__)
+
+        plot.save_plot(fig, plot_dir, name)
+
+    def save_data(self, save_dir:str, optional_name:str = None):
+        """Save the results of the analysis.
+
+        Args:
+            save_dir (str): Directory where the data should be saved.
+            optional_name (None): Optional name for the data.
+        """
+        save_dir = utils.create_dir(os.path.join(save_dir, "data"))
+        name = utils.assemble_file_name(optional_name, self.__class__.__name__, "linear_fit.json") if \
+               optional_name else utils.assemble_file_name(self.__class__.__name__, "linear_fit.json")
+        meta_data = {"R2_score": self.fit_score, "fit_slope [cm\u2074/(F\u00b2.V)]": self.slope,
+                     "fit_intercept [cm\u2074/F\u00b2]": self.intercept, "semiconductor_type": self.semiconductor_type,
+                     "flat_band_potential [V]": self.flat_band_potential,
+                     "doping_density [cm\u207b\u00b3]": self.doping_density,
+                     "analysis_frequency [Hz]": self.analysis_frequency, "electrode_area [cm\u00b2]": self.electrode_area,
+                     "dielectric_constant": self.dielectric_constant, "temperature [K]": self.temperature,
+                     "fit_range [V]": self.fit_range}
+        utils.save_data_as_json(directory=save_dir, name=name, data=meta_data)
+
+        data = utils.assemble_data_frame(**{"potential [V]": self.potentials, "frequency [Hz]": self.frequencies,
+                                            "capacitance [F/cm\u00b2]": self.capacitance,
+                                            "inverse_square_capacitance [cm\u2074/F\u00b2]": self.inverse_square_capacitance,
+                                            "inverse_square_capacitance_fit [cm\u2074/F\u00b2]": self.inverse_square_capacitance_fit,
+                                            "used_in_fit": self.fit_mask})
+        data_name = utils.assemble_file_name(optional_name, self.__class__.__name__, f"data.{self.data_format}") if \
+                        optional_name else utils.assemble_file_name(self.__class__.__name__, f"data.{self.data_format}")
+        utils.save_data_table(save_dir, data, data_name, self.data_format)
+
+    def perform_all_actions(self, save_dir:str, plots:list, optional_name:str = None):
+        """ Wrapper function for executing all action
+
+        Args:
+            save_dir (str): Directory where the data should be saved.
+            plots (list): List of plot types to be plotted.
+        """
+        self.analyze()
+        self.plot(save_dir, plots, optional_name=optional_name)
+        self.save_data(save_dir=save_dir, optional_name=optional_name)
 
-    def plot(self, save_dir:str, plots:list, optional_name:str):
-        pass
-    # TODO
-    # nyquist
-    # fit nyquist
-    # bode
-    # mott v vs 1/cp_2
-    def save_data(self, save_dir:str, optional_name:str):
-        pass
+    @property
+    def figure(self):
+        """Get the figure of the plot.
 
-    def perform_all_actions(self, save_dir:str, plots:list, optional_name:str):
-        pass
+        Returns:
+            obj: Figure object for the Mott-Schottky plot.
+        """
+        return self._figure
+
+    @figure.setter
+    def figure(self, figure):
+        """Set the figure of the plot.
+
+        Args:
+            figure (obj): Figure object for the Mott-Schottky plot.
+        """
+        self._figure = figure
 
 class Lissajous(EChemProcedure):
-    """ Class for performing the Lissajous procedure."""
-    def __init__(self) -> None:
-        return None
+    """ Class for performing the Lissajous procedure. Time domain recordings of voltage and current at a
+    series of excitation frequencies are streamed block by block and analyzed by DFT: impedance of the
+    fundamental, amplitudes of the higher harmonics and total harmonic distortion per frequency.
+
+    Args:
+        EChemProcedure (class): General abstract EChem Procedure class
+    """
+    def __init__(self, chunks, n_harmonics: int = eharm.N_HARMONICS,
+                 periods_per_window: int = eharm.PERIODS_PER_WINDOW, data_format: str = "csv"):
+        """ Initialize the Lissajous class.
+
+        Args:
+            chunks (iterable): Chunks of the recording as tuples of excitation frequency, time, voltage and current
+                arrays. The rows of one excitation frequency have to be consecutive.
+            n_harmonics (int, optional): Highest harmonic which is extracted. Defaults to eharm.N_HARMONICS.
+            periods_per_window (int, optional): Least periods of the excitation per DFT window.
+                Defaults to eharm.PERIODS_PER_WINDOW.
+            data_format (str, optional): Format of the saved data table (csv, parquet or feather). Defaults to "csv".
+        """
+        self.chunks = chunks
+        self.n_harmonics = n_harmonics
+        self.periods_per_window = periods_per_window
+        self.data_format = data_format
+        self.frequency = None
+        self.impedance = None
+        self.phase_shift = None
+        self.thd_voltage = None
+        self.thd_current = None
+        self.voltage_amplitudes = None
+        self.current_amplitudes = None
+        self.periods = None
+        self.lissajous = None
+        self.figure = None
 
     def analyze(self):
-        pass
-
-    def plot(self, save_dir:str, plots:list, optional_name:str):
-        return None
-    # TODO
-    # legend is the frequency
-    # i vs t
-    # v vs t
-    # i vs E
-    def save_data(self, save_dir:str, optional_name:str):
-        pass
-
-    def perform_all_actions(self, save_dir:str, plots:list, optional_name:str):
-        pass
+        """Stream through the recording and extract the harmonics of every excitation frequency.
+        """
+        analyzer = eharm.HarmonicAnalyzer(n_harmonics=self.n_harmonics, periods_per_window=self.periods_per_window)
+        for frequency, time, voltage, current in self.chunks:
+            analyzer.feed(frequency, time, voltage, current)
+        results = analyzer.finish()
+        if not results:
+            log.error("No excitation frequency of the recording covers a complete window.")
+            raise ValueError("No excitation frequency of the recording covers a complete window.")
+
+        self.frequency = np.array([result["frequency"] for result in results])
+        self.impedance = np.array([result["impedance"] for result in results])
+        # positive for a capacitive response, as the phase shift of EIS
+        self.phase_shift = -np.rad2deg(np.angle(self.impedance))
+        self.thd_voltage = np.array([result["thd_voltage"] for result in results])
+        self.thd_current = np.array([result["thd_current"] for result in results])
+        # frequencies with fewer harmonics below the Nyquist frequency are filled with nan
+        self.voltage_amplitudes, self.current_amplitudes = (
+            np.array([np.pad(result[key], (0, self.n_harmonics - len(result[key])), constant_values=np.nan)
+                      for result in results]) for key in ("voltage_amplitudes", "current_amplitudes"))
+        self.periods = np.array([result["periods"] for result in results])
+        self.lissajous = [result["lissajous"] for result in results]
+        log.info(f"Analyzed {len(results)} excitation frequencies, the maximum total harmonic distortion "
+                 f"of the current is {np.max(self.thd_current)}.")
+
+    def plot(self, save_dir:str, plots:list, optional_name:str = None):
+        """Plot the results of the analysis.
+
+        Args:
+            save_dir (str): directory where to save the data
+            plots (list): list of plot types to be plotted
+            optional_name (str, optional): name of the file to be saved. Defaults to None.
+        """
+        plot_dir = utils.create_dir(os.path.join(save_dir, "plots"))
+        plot = iplt()
+        fig, available_axes = plot.compose_eis_subplot(plots=plots)
+
+        for sub_ax, plot_name in zip(available_axes, plots):
+            if plot_name == "nyquist":
+                plot.nyquist(subplot_ax=sub_ax, frequency=self.frequency, real_impedance=self.impedance.real,
+                             imaginary_impedance=self.impedance.imag,
+                             ax_sci_notation='both', scientific_limit=3, scientific_label_colorbar=False, norm_color=True)
+
+            elif plot_name == "bode":
+                plot.bode(subplot_ax=sub_ax, frequency=self.frequency, real_impedance=self.impedance.real,
+                          imaginary_impedance=self.impedance.imag,
+                          phase_shift=self.phase_shift, ax_sci_notation="y", scientific_limit=3, log_scale="x")
+
+            elif plot_name == "lissajous":
+                plot.lissajous(subplot_ax=sub_ax, frequency=self.frequency, periods=self.lissajous)
+
+            elif plot_name == "harmonic_distortion":
+                plot.harmonic_distortion(subplot_ax=sub_ax, frequency=self.frequency, thd_voltage=self.thd_voltage,
+                                         thd_current=self.thd_current)
+
+            else:
+                log.error("Lissajous class does not have the selected plot.")
+                continue
+
+        fig.tight_layout()
+        self.figure = fig
+        name = utils.assemble_file_name(optional_name, self.__class__.__name__) if \
+                    optional_name else utils.assemble_file_name(self.__class__.__name__)
+
+        plot.save_plot(fig, plot_dir, name)
+
+    def save_data(self, save_dir:str, optional_name:str = None):
+        """Save the results of the analysis.
+
+        Args:
+            save_dir (str): Directory where the data should be saved.
+            optional_name (None): Optional name for the data.
+        """
+        save_dir = utils.create_dir(os.path.join(save_dir, "data"))
+        harmonics = {}
+        for k in range(self.n_harmonics):
+            harmonics[f"V_{k + 1} [V]"] = self.voltage_amplitudes[:, k]
+            harmonics[f"I_{k + 1} [A]"] = self.current_amplitudes[:, k]
+        data = utils.assemble_data_frame(**{"frequency [Hz]": self.frequency,
+                                            "real_impedance [\u03a9]": self.impedance.real,
+                                            "imaginary_impedance [\u03a9]": self.impedance.imag,
+                                            "|Z| [\u03a9]": np.abs(self.impedance),
+                                            "phase_shift [\u00b0]": self.phase_shift,
+                                            "THD_voltage": self.thd_voltage, "THD_current": self.thd_current,
+                                            "periods": self.periods, **harmonics})
+        data_name = utils.assemble_file_name(optional_name, self.__class__.__name__, f"data.{self.data_format}") if \
+                        optional_name else utils.assemble_file_name(self.__class__.__name__, f"data.{self.data_format}")
+        utils.save_data_table(save_dir, data, data_name, self.data_format)
+
+    def perform_all_actions(self, save_dir:str, plots:list, optional_name:str = None):
+        """ Wrapper function for executing all action
+
+        Args:
+            save_dir (str): Directory where the data should be saved.
+            plots (list): List of plot types to be plotted.
+        """
+        self.analyze()
+        self.plot(save_dir, plots, optional_name=optional_name)
+        self.save_data(save_dir=save_dir, optional_name=optional_name)
+
+    @property
+    def figure(self):
+        """Get the figure of the plot.
+
+        Returns:
+            obj: Figure object for the Lissajous plot.
+        """
+        return self._figure
+
+    @figure.setter
+    def figure(self, figure):
+        """Set the figure of the plot.
+
+        Args:
+            figure (obj): Figure object for the Lissajous plot.
+        """
+        self._figure = figure
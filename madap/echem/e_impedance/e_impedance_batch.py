@@ -0,0 +1,153 @@
+"""Batch EIS module. A long format table with many spectra, tagged by a spectrum id column
+(e.g. voltage, state of charge or time), is split into its spectra. They are fitted across a pool
+of worker processes and summarized in one results table instead of one result folder per spectrum."""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from madap.logger import logger
+from madap.utils import utils
+from madap.data_acquisition import data_acquisition as da
+from madap.echem.e_impedance import e_impedance as ei
+
+
+log = logger.get_logger("impedance_batch")
+
+
+def split_spectra(data, spectrum_id:str, columns:list, low_quantile:float = None, high_quantile:float = None):
+    """Split a long format table into its spectra, in the order in which they appear in the table.
+
+    Args:
+        data (Pandas DataFrame): table with the spectra one below the other
+        spectrum_id (str): column identifying the spectrum of each row
+        columns (list): columns of the frequency, real impedance, imaginary impedance and optionally phase shift
+        low_quantile (float, optional): lower quantile for removing the outliers of each spectrum. Defaults to None.
+        high_quantile (float, optional): upper quantile for removing the outliers of each spectrum. Defaults to None.
+
+    Returns:
+        list: spectrum ids and their EImpedance objects
+    """
+    if spectrum_id not in data.columns:
+        log.error(f"The spectrum id column {spectrum_id} is not in the data. Available columns are: {list(data.columns)}")
+        raise ValueError(f"The spectrum id column {spectrum_id} is not in the data.")
+    n_missing_ids = int(data[spectrum_id].isna().sum())
+    if n_missing_ids:
+        # groupby leaves out the rows without a spectrum id
+        log.warning(f"{n_missing_ids} rows have no value in the spectrum id column {spectrum_id} and are left out.")
+    spectra = []
+    for spectrum, group in data.groupby(spectrum_id, sort=False):
+        if low_quantile is not None and high_quantile is not None:
+            # remove the rows with outliers or nan values of every spectrum on its own
+            group, _ = da.remove_outliers(df=group, columns=columns[1:3],
+                                          low_quantile=low_quantile, high_quantile=high_quantile)
+        phase_shift = None if len(columns) == 3 else da.format_data(group[columns[3]])
+        spectra.append((spectrum, ei.EImpedance(da.format_data(group[columns[0]]), da.format_data(group[columns[1]]),
+                                                da.format_data(group[columns[2]]), phase_shift)))
+    log.info(f"Found {len(spectra)} spectra in the column {spectrum_id}.")
+    return spectra
+
+
+def analyze_batch(spectra:list, n_workers:int = 1, spectrum_id:str = "spectrum", stacked:bool = False, **kwargs):
+    """Fit all spectra and summarize the results. The spectra are split into contiguous blocks,
+    one per worker, and every spectrum of a block is warm started from the fit of its predecessor.
+
+    Args:
+        spectra (list): spectrum ids and their EImpedance objects, in the order of the measurement
+        n_workers (int, optional): Number of worker processes, None uses the number of CPUs. Defaults to 1.
+        spectrum_id (str, optional): Name of the spectrum id column of the summary. Defaults to "spectrum".
+        stacked (bool, optional): If True, the suggested circuit is fitted to all spectra as one stacked
+            least squares problem in this process. Defaults to False.
+        **kwargs: keyword arguments of EIS
+
+    Returns:
+        Pandas DataFrame: one row per spectrum with the circuit, its parameters, RMSE, chi square and conductivity
+    """
+    if not spectra:
+        log.error("There are no spectra to fit, check the spectrum id column and the outlier limits.")
+        raise ValueError("There are no spectra to fit.")
+    if stacked:
+        procedures = ei.analyze_stacked([impedance for _, impedance in spectra], **kwargs)
+        return pd.DataFrame([summarize_fit(eis, spectrum, spectrum_id)
+                             for (spectrum, _), eis in zip(spectra, procedures)])
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(spectra)))
+    blocks = [[spectra[i] for i in block] for block in np.array_split(np.arange(len(spectra)), n_workers)]
+    analyze_block = partial(_analyze_block, spectrum_id=spectrum_id, **kwargs)
+    log.info(f"Fitting {len(spectra)} spectra with {n_workers} worker process(es).")
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            rows = [row for block_rows in executor.map(analyze_block, blocks) for row in block_rows]
+    else:
+        rows = analyze_block(blocks[0])
+    summary = pd.DataFrame(rows)
+    log.info(f"Fitted {summary['error'].isna().sum()} of {len(summary)} spectra, "
+             f"{summary['warm_started'].sum()} of them warm started.")
+    return summary
+
+
+def _analyze_block(block:list, spectrum_id:str, **kwargs):
+    """Fit a block of consecutive spectra in one process. A failing spectrum is reported
+    in the summary instead of stopping the batch.
+
+    Args:
+        block (list): spectrum ids and their EImpedance objects
+        spectrum_id (str): name of the spectrum id column of the summary
+        **kwargs: keyword arguments of EIS
+
+    Returns:
+        list: summary rows of the spectra
+    """
+    rows, warm_start = [], None
+    for spectrum, impedance in block:
+        try:
+            # the spectra are already distributed over the processes
+            eis = ei.EIS(impedance, warm_start=warm_start, n_workers=1, **kwargs)
+            eis.analyze()
+        except Exception as exp: # pylint: disable=broad-except
+            log.error(f"Fitting the spectrum {spectrum} failed: {exp}")
+            rows.append({spectrum_id: spectrum, "error": str(exp), "warm_started": False})
+            warm_start = None
+            continue
+        warm_start = eis.warm_start_seed()
+        rows.append(summarize_fit(eis, spectrum, spectrum_id))
+    return rows
+
+
+def summarize_fit(eis, spectrum, spectrum_id:str = "spectrum"):
+    """Summarize the fit of one spectrum in a row of the batch table.
+
+    Args:
+        eis (EIS): analyzed EIS object
+        spectrum (object): spectrum id
+        spectrum_id (str, optional): name of the spectrum id column. Defaults to "spectrum".
+
+    Returns:
+        dict: spectrum id, circuit, RMSE, Lin-KK results, conductivity and the fitted parameters with their errors
+    """
+    row = {spectrum_id: spectrum, "circuit": eis.custom_circuit.circuit, "RMSE_fit_error": eis.rmse_calc,
+           "chi_square": eis.chi_val, "rc_linKK": eis.num_rc_linkk, "eval_fit_linKK": eis.eval_fit_linkk,
+           "conductivity [S/cm]": eis.conductivity, "warm_started": eis.warm_started, "error": None}
+    names, units = eis.custom_circuit.get_param_names()
+    errors = eis.custom_circuit.conf_ if eis.custom_circuit.conf_ is not None else [np.nan] * len(names)
+    for name, unit, value, error in zip(names, units, eis.custom_circuit.parameters_, errors):
+        unit = f" [{unit}]" if unit else ""
+        row[f"{name}{unit}"] = value
+        row[f"{name}_error{unit}"] = error
+    return row
+
+
+def save_batch_summary(summary, save_dir:str, data_format:str = "csv", optional_name:str = None):
+    """Save the summary table of a batch.
+
+    Args:
+        summary (Pandas DataFrame): summary table from analyze_batch
+        save_dir (str): Directory where the data should be saved.
+        data_format (str, optional): Format of the table (csv, parquet or feather). Defaults to "csv".
+        optional_name (str, optional): Optional name for the data. Defaults to None.
+    """
+    save_dir = utils.create_dir(os.path.join(save_dir, "data"))
+    name = utils.assemble_file_name(optional_name, "EIS", f"batch_summary.{data_format}") if \
+           optional_name else utils.assemble_file_name("EIS", f"batch_summary.{data_format}")
+    utils.save_data_table(save_dir, summary, name, data_format)
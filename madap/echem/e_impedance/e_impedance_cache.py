@@ -0,0 +1,112 @@
+"""Fit cache module. The results of the Lin-KK test and of the circuit fit are stored on disk,
+keyed by a hash of the frequency and impedance arrays, together with the settings they were
+obtained with. A repeated analysis of the same spectrum loads them instead of fitting again."""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from madap.logger import logger
+from madap.data_acquisition import data_cache
+
+
+log = logger.get_logger("impedance_cache")
+# bump the version if the fit changes, so that old entries are not used anymore
+FIT_CACHE_VERSION = 1
+FIT_CACHE_EXTENSION = ".json"
+# the fits are kept apart from the cached data files in the same cache directory
+FIT_CACHE_SUBDIR = "eis_fits"
+
+
+def spectrum_key(frequency, impedance):
+    """Get the cache key of a spectrum, a hash of its frequency and impedance arrays.
+
+    Args:
+        frequency (np.array): frequencies
+        impedance (np.array): complex impedance
+
+    Returns:
+        str: The cache key
+    """
+    spectrum_hash = hashlib.blake2b(digest_size=20)
+    spectrum_hash.update(str(FIT_CACHE_VERSION).encode())
+    spectrum_hash.update(np.ascontiguousarray(frequency, dtype=np.float64).tobytes())
+    spectrum_hash.update(np.ascontiguousarray(impedance, dtype=np.complex128).tobytes())
+    return spectrum_hash.hexdigest()
+
+
+def load_fit_entry(cache_dir, key):
+    """Load the cached results of a spectrum and mark them as recently used.
+
+    Args:
+        cache_dir (str): The directory of the cache
+        key (str): The cache key
+
+    Returns:
+        dict: The cached results or None if there is no entry
+    """
+    path = os.path.join(cache_dir, FIT_CACHE_SUBDIR, key + FIT_CACHE_EXTENSION)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            entry = json.load(file)
+    except FileNotFoundError:
+        return None
+    except ValueError as exp:
+        log.warning(f"The cache entry {path} could not be read ({exp}) and is removed.")
+        os.remove(path)
+        return None
+    os.utime(path)
+    return entry
+
+
+def store_fit_entry(cache_dir, key, entry, cache_size:float = data_cache.CACHE_SIZE):
+    """Store the results of a spectrum and evict the least recently used entries
+    if the fit cache is larger than its maximum size.
+
+    Args:
+        cache_dir (str): The directory of the cache
+        key (str): The cache key
+        entry (dict): The results that should be cached
+        cache_size (float, optional): Maximum size of the fit cache in MB. Defaults to data_cache.CACHE_SIZE.
+    """
+    fit_dir = os.path.join(cache_dir, FIT_CACHE_SUBDIR)
+    os.makedirs(fit_dir, exist_ok=True)
+    path = os.path.join(fit_dir, key + FIT_CACHE_EXTENSION)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(entry, file)
+    except (TypeError, ValueError) as exp:
+        log.warning(f"The fit could not be cached ({exp}).")
+        os.remove(temp_path)
+        return
+    # the entry only appears once it is complete
+    os.replace(temp_path, path)
+    log.info(f"Stored the fit in the cache {fit_dir}.")
+    data_cache.evict_cache_entries(fit_dir, cache_size, extension=FIT_CACHE_EXTENSION)
+
+
+def complex_to_list(values):
+    """Convert a complex array into a list of real and imaginary parts for storing it as json.
+
+    Args:
+        values (np.array): complex array
+
+    Returns:
+        list: real and imaginary parts
+    """
+    values = np.asarray(values, dtype=complex)
+    return [values.real.tolist(), values.imag.tolist()]
+
+
+def list_to_complex(values):
+    """Convert a list of real and imaginary parts back into a complex array.
+
+    Args:
+        values (list): real and imaginary parts
+
+    Returns:
+        np.array: complex array
+    """
+    return np.asarray(values[0], dtype=float) + 1j*np.asarray(values[1], dtype=float)
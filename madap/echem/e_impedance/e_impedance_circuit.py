@@ -0,0 +1,481 @@
+"""Circuit compiler module. A circuit string of the impedance package is parsed once into a tree
+of NumPy expressions, which evaluates the impedance at all frequencies in one vectorized call
+together with its analytic partial derivatives, so that the fit does not need finite differences."""
+import re
+from functools import lru_cache
+
+import numpy as np
+from scipy.linalg import svd
+from scipy.optimize import least_squares
+from impedance.models.circuits.fitting import set_default_bounds, calculateCircuitLength, wrapCircuit
+
+from madap.logger import logger
+
+
+log = logger.get_logger("impedance_circuit")
+# same defaults as the fit of the impedance package
+MAX_NFEV = int(1e5)
+FTOL = 1e-13
+XTOL = 1e-8
+# Levenberg-Marquardt damping of the stacked fit of several spectra
+MAX_STACKED_NFEV = 1000
+INITIAL_DAMPING = 1e-3
+DAMPING_DECREASE = 0.3
+DAMPING_INCREASE = 10.0
+MAX_DAMPING = 1e16
+# parameter sets simulated per vectorized call, which bounds the memory of the partial derivatives
+SIMULATION_BLOCK_SIZE = 1000
+TOKEN = re.compile(r"p\(|\)|,|-|[A-Za-z]+[0-9_]*")
+
+
+def _resistor(parameters, s):
+    resistance, = parameters
+    ones = np.ones(s.shape, dtype=complex)
+    return resistance * ones, [ones]
+
+
+def _capacitor(parameters, s):
+    capacitance, = parameters
+    z = 1.0 / (capacitance * s)
+    return z, [-z / capacitance]
+
+
+def _inductor(parameters, s):
+    inductance, = parameters
+    return inductance * s, [s]
+
+
+def _constant_phase_element(parameters, s):
+    q, alpha = parameters
+    z = 1.0 / (q * s**alpha)
+    return z, [-z / q, -z * np.log(s)]
+
+
+def _modified_inductor(parameters, s):
+    inductance, alpha = parameters
+    z = (inductance * s)**alpha
+    return z, [alpha * z / inductance, z * np.log(inductance * s)]
+
+
+def _warburg(parameters, s):
+    a_w, = parameters
+    dz_da = (1 - 1j) / np.sqrt(s.imag)
+    return a_w * dz_da, [dz_da]
+
+
+def _warburg_open(parameters, s):
+    z_0, tau = parameters
+    x = np.sqrt(s * tau)
+    z = z_0 / (x * np.tanh(x))
+    # 2x/sinh(2x) written with exp(-2x), which does not overflow at high frequency
+    decay = np.exp(-2 * x)
+    return z, [z / z_0, -z / (2 * tau) * (1 + 4 * x * decay / (1 - decay**2))]
+
+
+def _warburg_short(parameters, s):
+    z_0, tau = parameters
+    x = np.sqrt(s * tau)
+    z = z_0 * np.tanh(x) / x
+    # 1/cosh(x)^2 written with exp(-2x), which does not overflow at high frequency
+    decay = np.exp(-2 * x)
+    return z, [z / z_0, (4 * z_0 * decay / (1 + decay)**2 - z) / (2 * tau)]
+
+
+def _rc_element(parameters, s):
+    resistance, tau = parameters
+    denominator = 1 + s * tau
+    return resistance / denominator, [1 / denominator, -resistance * s / denominator**2]
+
+
+def _gerischer(parameters, s):
+    r_g, t_g = parameters
+    root = np.sqrt(1 + s * t_g)
+    return r_g / root, [1 / root, -r_g * s / (2 * root**3)]
+
+
+# element name: number of parameters and function returning the impedance and its derivatives,
+# with the same definitions and parameter order as the elements of the impedance package
+ELEMENTS = {"R": (1, _resistor), "C": (1, _capacitor), "L": (1, _inductor),
+            "CPE": (2, _constant_phase_element), "La": (2, _modified_inductor),
+            "W": (1, _warburg), "Wo": (2, _warburg_open), "Ws": (2, _warburg_short),
+            "K": (2, _rc_element), "G": (2, _gerischer)}
+
+
+class _Element:
+    """Leaf of the circuit tree."""
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.n_parameters, self._function = ELEMENTS[_element_type(name)]
+        self.offset = offset
+
+    def evaluate(self, parameters, s):
+        element_parameters = parameters[..., self.offset:self.offset + self.n_parameters]
+        if element_parameters.ndim == 2:
+            # one column of parameters per spectrum, broadcast over the frequencies of each spectrum
+            element_parameters = element_parameters.T[..., np.newaxis]
+        z, derivatives = self._function(element_parameters, s)
+        # derivatives which do not depend on the parameters are broadcast to the shape of the impedance
+        return z, np.stack(np.broadcast_arrays(z, *derivatives)[1:], axis=-1)
+
+
+class _Series:
+    """Elements in series, the impedances add up."""
+
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, parameters, s):
+        results = [child.evaluate(parameters, s) for child in self.children]
+        return sum(z for z, _ in results), np.concatenate([jacobian for _, jacobian in results], axis=-1)
+
+
+class _Parallel:
+    """Elements in parallel, the admittances add up."""
+
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, parameters, s):
+        results = [child.evaluate(parameters, s) for child in self.children]
+        z = 1 / sum(1 / z_child for z_child, _ in results)
+        # dZ/dp = (Z/Z_i)^2 dZ_i/dp for the parameters p of the child i
+        return z, np.concatenate([jacobian * ((z / z_child)**2)[..., np.newaxis] for z_child, jacobian in results],
+                                 axis=-1)
+
+
+def _element_type(name:str):
+    """Get the element type of an element name, e.g. "CPE" of "CPE1".
+
+    Args:
+        name (str): element name
+
+    Returns:
+        str: element type
+    """
+    return re.sub(r"[0-9_]", "", name)
+
+
+def circuit_elements(circuit:str):
+    """Get the element names of a circuit string in the order of their parameters.
+
+    Args:
+        circuit (str): circuit string, e.g. "R0-p(R1,CPE1)"
+
+    Returns:
+        list: element names, e.g. ["R0", "R1", "CPE1"]
+    """
+    return [token for token in TOKEN.findall(circuit.replace(" ", "")) if token not in ("p(", ")", ",", "-")]
+
+
+def is_supported(circuit:str):
+    """Check if all elements of a circuit string can be compiled.
+
+    Args:
+        circuit (str): circuit string, e.g. "R0-p(R1,CPE1)"
+
+    Returns:
+        bool: True if the circuit can be compiled
+    """
+    tokens = TOKEN.findall(circuit.replace(" ", ""))
+    return "".join(tokens) == circuit.replace(" ", "") and \
+           all(_element_type(element) in ELEMENTS for element in circuit_elements(circuit))
+
+
+class CompiledCircuit:
+    """Circuit string compiled into an expression tree."""
+
+    def __init__(self, circuit:str):
+        """Parse the circuit string.
+
+        Args:
+            circuit (str): circuit string of the impedance package, e.g. "R0-p(R1,CPE1)"
+        """
+        self.circuit = circuit
+        self._tokens = TOKEN.findall(circuit.replace(" ", ""))
+        if "".join(self._tokens) != circuit.replace(" ", ""):
+            log.error(f"The circuit {circuit} could not be parsed.")
+            raise ValueError(f"The circuit {circuit} could not be parsed.")
+        self._position = 0
+        self.n_parameters = 0
+        self._tree = self._parse_series()
+        if self._position != len(self._tokens):
+            log.error(f"The circuit {circuit} could not be parsed.")
+            raise ValueError(f"The circuit {circuit} could not be parsed.")
+        del self._tokens
+
+    def _next_token(self):
+        token = self._tokens[self._position] if self._position < len(self._tokens) else None
+        self._position += 1
+        return token
+
+    def _parse_series(self):
+        children = [self._parse_term()]
+        while self._position < len(self._tokens) and self._tokens[self._position] == "-":
+            self._position += 1
+            children.append(self._parse_term())
+        return children[0] if len(children) == 1 else _Series(children)
+
+    def _parse_term(self):
+        token = self._next_token()
+        if token == "p(":
+            children = [self._parse_series()]
+            while (token := self._next_token()) == ",":
+                children.append(self._parse_series())
+            if token != ")":
+                log.error(f"Unbalanced parentheses in the circuit {self.circuit}.")
+                raise ValueError(f"Unbalanced parentheses in the circuit {self.circuit}.")
+            return _Parallel(children)
+        if token is None or _element_type(token) not in ELEMENTS:
+            log.error(f"The element {token} of the circuit {self.circuit} can not be compiled. "
+                      f"Supported elements are: {list(ELEMENTS)}")
+            raise ValueError(f"The element {token} can not be compiled.")
+        element = _Element(token, self.n_parameters)
+        self.n_parameters += element.n_parameters
+        return element
+
+    def evaluate(self, parameters, frequency):
+        """Evaluate the impedance and its partial derivatives at all frequencies. Several spectra
+        are evaluated at once if the parameters are given per spectrum (n_spectra, n_parameters)
+        and the frequencies per spectrum (n_spectra, n_frequencies).
+
+        Args:
+            parameters (np.array): circuit parameters in the order of the impedance package
+            frequency (np.array): frequencies
+
+        Returns:
+            tuple: complex impedance (n_frequencies) and its partial derivatives
+                with respect to the parameters (n_frequencies, n_parameters), with a leading
+                spectrum axis if several spectra are evaluated
+        """
+        s = 2j * np.pi * np.asarray(frequency, dtype=float)
+        with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+            return self._tree.evaluate(np.asarray(parameters, dtype=float), s)
+
+    def predict(self, parameters, frequency):
+        """Evaluate the impedance at all frequencies.
+
+        Args:
+            parameters (np.array): circuit parameters in the order of the impedance package
+            frequency (np.array): frequencies
+
+        Returns:
+            np.array: complex impedance
+        """
+        return self.evaluate(parameters, frequency)[0]
+
+    def fit(self, frequency, impedance, initial_guess, bounds=None, **kwargs):
+        """Fit the circuit to the impedance by least squares on the stacked real and imaginary
+        part with the analytic Jacobian. The defaults are those of the fit of the impedance package.
+
+        Args:
+            frequency (np.array): frequencies
+            impedance (np.array): complex impedance
+            initial_guess (list): initial parameters
+            bounds (tuple, optional): lower and upper bounds. Defaults to None (bounds of the impedance package).
+            **kwargs: further arguments of scipy.optimize.least_squares
+
+        Returns:
+            tuple: fitted parameters, their one standard deviation errors and the least squares result
+        """
+        frequency = np.asarray(frequency, dtype=float)
+        impedance = np.asarray(impedance)
+        if bounds is None:
+            bounds = set_default_bounds(self.circuit)
+        kwargs.setdefault("max_nfev", MAX_NFEV)
+        kwargs.setdefault("ftol", FTOL)
+        # the residual and the Jacobian are evaluated with the same parameters, so the tree is evaluated once
+        cache = {}
+
+        def evaluate(parameters):
+            if cache.get("parameters") is None or not np.array_equal(cache["parameters"], parameters):
+                cache["parameters"] = np.array(parameters)
+                cache["result"] = self.evaluate(parameters, frequency)
+            return cache["result"]
+
+        def residual(parameters):
+            z = evaluate(parameters)[0] - impedance
+            return np.hstack([z.real, z.imag])
+
+        def jacobian(parameters):
+            jac = evaluate(parameters)[1]
+            return np.vstack([jac.real, jac.imag])
+
+        result = least_squares(residual, initial_guess, jac=jacobian, bounds=bounds, method="trf", **kwargs)
+        return result.x, _parameter_errors(result.jac, result.cost), result
+
+    def fit_stacked(self, frequencies, impedances, initial_guess, bounds=None, max_nfev:int = MAX_STACKED_NFEV,
+                    ftol:float = FTOL, xtol:float = XTOL):
+        """Fit the circuit to several independent spectra as one stacked least squares problem.
+        The tree is evaluated once for all spectra per iteration and the Jacobian is block diagonal,
+        so the Levenberg-Marquardt step of every spectrum is solved from its own small normal equations
+        in one vectorized call. Every spectrum has its own damping and stops on its own convergence.
+        Steps crossing a bound go half way to it, so the parameters stay feasible.
+        Spectra with fewer frequencies are padded and the padding is masked.
+
+        Args:
+            frequencies (list): frequencies of every spectrum
+            impedances (list): complex impedance of every spectrum
+            initial_guess (list): initial parameters, shared (n_parameters) or per spectrum (n_spectra, n_parameters)
+            bounds (tuple, optional): lower and upper bounds of one spectrum. Defaults to None (bounds of the impedance package).
+            max_nfev (int, optional): maximum number of evaluations of all spectra. Defaults to MAX_STACKED_NFEV.
+            ftol (float, optional): relative reduction of the cost below which a spectrum has converged. Defaults to FTOL.
+            xtol (float, optional): relative step size below which a spectrum has converged. Defaults to XTOL.
+
+        Returns:
+            tuple: fitted parameters and their one standard deviation errors (n_spectra, n_parameters)
+                and the sum of squared residuals of every spectrum
+        """
+        n_spectra, n_parameters = len(frequencies), self.n_parameters
+        n_frequencies = max(len(frequency) for frequency in frequencies)
+        mask = np.zeros((n_spectra, n_frequencies), dtype=bool)
+        frequency, impedance = np.ones((n_spectra, n_frequencies)), np.zeros((n_spectra, n_frequencies), dtype=complex)
+        for i, (spectrum_frequency, spectrum_impedance) in enumerate(zip(frequencies, impedances)):
+            mask[i, :len(spectrum_frequency)] = True
+            frequency[i, :len(spectrum_frequency)] = spectrum_frequency
+            impedance[i, :len(spectrum_frequency)] = spectrum_impedance
+        # residuals of a spectrum are its real parts followed by its imaginary parts
+        mask = np.hstack([mask, mask])
+        lower, upper = set_default_bounds(self.circuit) if bounds is None else bounds
+        lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+
+        def evaluate(parameters, rows):
+            z, jac = self.evaluate(parameters, frequency[rows])
+            z = z - impedance[rows]
+            residual = np.where(mask[rows], np.hstack([z.real, z.imag]), 0)
+            jac = np.where(mask[rows][..., np.newaxis], np.concatenate([jac.real, jac.imag], axis=1), 0)
+            return residual, jac, 0.5 * np.sum(residual**2, axis=1)
+
+        parameters = np.array(np.broadcast_to(np.asarray(initial_guess, dtype=float), (n_spectra, n_parameters)))
+        residual, jac, cost = evaluate(parameters, np.arange(n_spectra))
+        damping = np.full(n_spectra, INITIAL_DAMPING)
+        active = np.flatnonzero(np.isfinite(cost))
+        for _ in range(max_nfev - 1):
+            if not active.size:
+                break
+            # only the spectra which have not converged yet are evaluated
+            normal = np.einsum("nmp,nmq->npq", jac[active], jac[active])
+            gradient = np.einsum("nmp,nm->np", jac[active], residual[active])
+            # Marquardt scaling with the diagonal of the normal equations
+            scale = np.diagonal(normal, axis1=1, axis2=2)
+            scale = np.maximum(scale, np.finfo(float).eps * np.max(scale, axis=1, keepdims=True))
+            system = normal + (damping[active, np.newaxis] * scale)[..., np.newaxis] * np.eye(n_parameters)
+            current = parameters[active]
+            with np.errstate(invalid="ignore", over="ignore"):
+                trial = current - np.linalg.solve(system, gradient[..., np.newaxis])[..., 0]
+                trial = np.where(trial <= lower, (current + lower) / 2, trial)
+                trial = np.where(trial > upper, (current + upper) / 2, trial)
+            trial_residual, trial_jac, trial_cost = evaluate(trial, active)
+
+            accepted = np.isfinite(trial_cost) & (trial_cost < cost[active])
+            converged = accepted & ((cost[active] - trial_cost <= ftol * cost[active]) |
+                                    (np.linalg.norm(trial - current, axis=1) <=
+                                     xtol * (xtol + np.linalg.norm(current, axis=1))))
+            rows = active[accepted]
+            parameters[rows], residual[rows], jac[rows], cost[rows] = \
+                trial[accepted], trial_residual[accepted], trial_jac[accepted], trial_cost[accepted]
+            damping[active] = np.where(accepted, damping[active] * DAMPING_DECREASE, damping[active] * DAMPING_INCREASE)
+            # a spectrum stops when it converged or no step reduces its cost anymore
+            active = active[~converged & (damping[active] < MAX_DAMPING)]
+        if active.size:
+            log.warning(f"{active.size} of {n_spectra} spectra did not converge "
+                        f"within {max_nfev} evaluations.")
+
+        errors = np.array([_parameter_errors(jac[i][mask[i]], cost[i]) for i in range(n_spectra)])
+        return parameters, errors, 2 * cost
+
+def _parameter_errors(jac, cost):
+    """One standard deviation errors of the fitted parameters from the Jacobian,
+    computed the same way as in scipy.optimize.curve_fit.
+
+    Args:
+        jac (np.array): Jacobian of the residuals at the solution
+        cost (float): half of the sum of the squared residuals
+
+    Returns:
+        np.array: errors of the parameters
+    """
+    _, singular_values, vt = svd(jac, full_matrices=False)
+    threshold = np.finfo(float).eps * max(jac.shape) * singular_values[0]
+    singular_values = singular_values[singular_values > threshold]
+    vt = vt[:singular_values.size]
+    covariance = np.dot(vt.T / singular_values**2, vt)
+    n_residuals, n_parameters = jac.shape
+    if n_residuals > n_parameters:
+        covariance *= 2 * cost / (n_residuals - n_parameters)
+    else:
+        covariance.fill(np.inf)
+    return np.sqrt(np.diag(covariance))
+
+
+@lru_cache(maxsize=None)
+def compile_circuit(circuit:str):
+    """Compile a circuit string, every circuit is parsed only once.
+
+    Args:
+        circuit (str): circuit string, e.g. "R0-p(R1,CPE1)"
+
+    Returns:
+        CompiledCircuit: the compiled circuit
+    """
+    compiled = CompiledCircuit(circuit)
+    if compiled.n_parameters != calculateCircuitLength(circuit):
+        log.error(f"The compiled circuit {circuit} has {compiled.n_parameters} parameters "
+                  f"instead of {calculateCircuitLength(circuit)}.")
+        raise ValueError(f"The circuit {circuit} could not be compiled.")
+    return compiled
+
+
+def fit_custom_circuit(custom_circuit, frequency, impedance, **kwargs):
+    """Fit a CustomCircuit of the impedance package with the compiled circuit and store the
+    fitted parameters and their errors in it, as CustomCircuit.fit does.
+
+    Args:
+        custom_circuit (CustomCircuit): circuit with its initial guess
+        frequency (np.array): frequencies
+        impedance (np.array): complex impedance
+        **kwargs: further arguments of scipy.optimize.least_squares
+
+    Returns:
+        tuple: the fitted CustomCircuit and the fitted impedance
+    """
+    compiled = compile_circuit(custom_circuit.circuit)
+    parameters, errors, _ = compiled.fit(frequency, impedance, custom_circuit.initial_guess, **kwargs)
+    custom_circuit.parameters_ = parameters
+    custom_circuit.conf_ = errors
+    return custom_circuit, compiled.predict(parameters, frequency)
+
+
+def simulate_circuit(circuit:str, frequency, parameters, block_size:int = SIMULATION_BLOCK_SIZE):
+    """Simulate the impedance of a circuit for many parameter sets. Compilable circuits are evaluated
+    for a block of parameter sets in one vectorized call, other circuits are evaluated by the
+    impedance package one parameter set at a time.
+
+    Args:
+        circuit (str): circuit string, e.g. one of the keys of suggested_circuits
+        frequency (np.array): frequencies (n_frequencies)
+        parameters (np.array): parameter sets (n_sets, n_parameters) in the order of the impedance package
+        block_size (int, optional): parameter sets per vectorized call. Defaults to SIMULATION_BLOCK_SIZE.
+
+    Returns:
+        np.array: complex impedance (n_sets, n_frequencies)
+    """
+    frequency = np.asarray(frequency, dtype=float).ravel()
+    parameters = np.atleast_2d(np.asarray(parameters, dtype=float))
+    n_parameters = calculateCircuitLength(circuit)
+    if parameters.ndim != 2 or parameters.shape[1] != n_parameters:
+        log.error(f"The circuit {circuit} needs parameter sets of {n_parameters} parameters, "
+                  f"got an array of shape {parameters.shape}.")
+        raise ValueError(f"The circuit {circuit} needs parameter sets of {n_parameters} parameters.")
+    impedance = np.empty((parameters.shape[0], frequency.size), dtype=complex)
+    if is_supported(circuit):
+        compiled = compile_circuit(circuit)
+        for start in range(0, parameters.shape[0], block_size):
+            impedance[start:start + block_size] = compiled.predict(parameters[start:start + block_size], frequency)
+        return impedance
+    log.warning(f"The circuit {circuit} can not be compiled, it is simulated one parameter set at a time.")
+    model = wrapCircuit(circuit, {})
+    for i, parameter_set in enumerate(parameters):
+        stacked = model(frequency, *parameter_set)
+        impedance[i] = stacked[:frequency.size] + 1j * stacked[frequency.size:]
+    return impedance
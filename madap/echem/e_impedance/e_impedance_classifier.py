@@ -0,0 +1,211 @@
+"""Spectrum classification module. Simple features of the Nyquist shape (number of arcs,
+low frequency tail, inductive loop and high frequency intercept) are extracted from the
+impedance and used to keep only the suggested circuits whose topology can produce them."""
+import re
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from madap.logger import logger
+
+
+log = logger.get_logger("impedance_classifier")
+# minimum prominence of an arc and minimum size of an inductive loop relative to the range of Re(Z)
+ARC_PROMINENCE = 0.05
+INDUCTIVE_TOLERANCE = 0.02
+# angle range [deg] of the low frequency tail in the Nyquist plot for a Warburg tail, steeper tails are capacitive
+WARBURG_ANGLES = (20, 65)
+# relative size of the high frequency intercept compared to the real impedance range for a series resistance
+INTERCEPT_TOLERANCE = 0.01
+CAPACITIVE_ELEMENT = re.compile(r"^(C|CPE)\d")
+INDUCTIVE_ELEMENT = re.compile(r"^La?\d")
+DIFFUSION_ELEMENT = re.compile(r"^W[os]?\d")
+
+
+def extract_spectrum_features(frequency, real_impedance, imaginary_impedance):
+    """Extract the shape features of an impedance spectrum.
+
+    Args:
+        frequency (np.array): Frequency array.
+        real_impedance (np.array): Real impedance array.
+        imaginary_impedance (np.array): Imaginary impedance array (negative for capacitive behaviour).
+
+    Returns:
+        dict: number of arcs, low frequency tail ("warburg", "capacitive" or None), inductive loop,
+            high frequency intercept and if it shows a series resistance
+    """
+    order = np.argsort(np.asarray(frequency, dtype=float))[::-1]
+    real = np.asarray(real_impedance, dtype=float)[order]
+    # -Im(Z) is positive for the capacitive arcs
+    minus_imag = -np.asarray(imaginary_impedance, dtype=float)[order]
+    # the real range is used as scale, since a capacitive tail can dwarf the arcs in -Im(Z)
+    scale = (np.max(real) - np.min(real)) or np.max(np.abs(minus_imag)) or 1.0
+
+    inductive = minus_imag < -INDUCTIVE_TOLERANCE * scale
+    capacitive = np.clip(minus_imag, 0, None)
+    peaks, _ = find_peaks(capacitive, prominence=ARC_PROMINENCE * scale)
+
+    return {"arcs": int(len(peaks)),
+            "tail": _low_frequency_tail(real, minus_imag, peaks, scale),
+            "inductive_loop": bool(np.count_nonzero(inductive) >= 2),
+            **_high_frequency_intercept(real, minus_imag)}
+
+
+def _low_frequency_tail(real, minus_imag, peaks, scale):
+    """Classify the low frequency end of the spectrum by the angle of the line
+    through its points after the last arc.
+
+    Args:
+        real (np.array): real impedance, ordered from high to low frequency
+        minus_imag (np.array): negative imaginary impedance, ordered from high to low frequency
+        peaks (np.array): indices of the arc maxima
+        scale (float): scale of the spectrum
+
+    Returns:
+        str: "warburg", "capacitive" or None if the spectrum ends on the real axis
+    """
+    # the tail starts at the minimum of -Im(Z) after the last arc
+    start = peaks[-1] if len(peaks) else 0
+    start += int(np.argmin(minus_imag[start:]))
+    tail_real, tail_imag = real[start:], minus_imag[start:]
+    if len(tail_real) < 3 or tail_imag[-1] - tail_imag[0] <= ARC_PROMINENCE * scale:
+        return None
+    angle = np.degrees(np.arctan2(tail_imag[-1] - tail_imag[0], tail_real[-1] - tail_real[0]))
+    if WARBURG_ANGLES[0] <= angle <= WARBURG_ANGLES[1]:
+        return "warburg"
+    if angle > WARBURG_ANGLES[1]:
+        return "capacitive"
+    return None
+
+
+def _high_frequency_intercept(real, minus_imag):
+    """Find the real impedance where the spectrum crosses or approaches the real axis at high frequency.
+
+    Args:
+        real (np.array): real impedance, ordered from high to low frequency
+        minus_imag (np.array): negative imaginary impedance, ordered from high to low frequency
+
+    Returns:
+        dict: high frequency intercept and if it shows a series resistance
+    """
+    crossings = np.nonzero(np.diff(np.sign(minus_imag)) > 0)[0]
+    if len(crossings) and crossings[0] < len(real) // 2:
+        # interpolate the crossing from the inductive to the capacitive part
+        i = crossings[0]
+        weight = -minus_imag[i] / (minus_imag[i + 1] - minus_imag[i])
+        intercept = real[i] + weight * (real[i + 1] - real[i])
+    else:
+        intercept = real[0]
+    real_range = np.max(real) - min(np.min(real), 0)
+    return {"high_frequency_intercept": float(intercept),
+            "series_resistance": bool(intercept > INTERCEPT_TOLERANCE * real_range)}
+
+
+def circuit_topology(circuit:str):
+    """Get the topology features of a circuit string of the impedance package.
+
+    Args:
+        circuit (str): circuit string, e.g. "R0-p(R1,CPE1)"
+
+    Returns:
+        dict: number of arcs (parallel groups with a capacitive element), inductive and diffusion
+            elements, series resistance and series capacitive element
+    """
+    arcs = 0
+    for i in [match.end() for match in re.finditer(r"p\(", circuit)]:
+        # elements directly in this parallel group, not in nested ones
+        depth, elements, element = 1, [], ""
+        for char in circuit[i:]:
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    break
+            elif depth == 1 and char in ",-":
+                elements.append(element)
+                element = ""
+            elif depth == 1:
+                element += char
+        elements.append(element)
+        arcs += any(CAPACITIVE_ELEMENT.match(element) for element in elements)
+
+    elements = re.findall(r"[A-Za-z]+\d+", circuit)
+    series_elements = _series_elements(circuit)
+    return {"arcs": arcs,
+            "inductive": any(INDUCTIVE_ELEMENT.match(element) for element in elements),
+            "diffusion": any(DIFFUSION_ELEMENT.match(element) for element in elements),
+            "series_resistance": any(re.match(r"^R\d", element) for element in series_elements),
+            "series_capacitive": any(CAPACITIVE_ELEMENT.match(element) for element in series_elements)}
+
+
+def _series_elements(circuit:str):
+    """Get the elements of a circuit string which are in series at the top level.
+
+    Args:
+        circuit (str): circuit string
+
+    Returns:
+        list: the top level elements, parallel groups are left out
+    """
+    depth, elements, element = 0, [], ""
+    for char in circuit:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and char == "-":
+            elements.append(element)
+            element = ""
+        elif depth == 0:
+            element += char
+    elements.append(element)
+    return [element for element in elements if element and element != "p"]
+
+
+def is_compatible(features:dict, topology:dict):
+    """Check if a circuit topology can produce the features of a spectrum.
+    A circuit may have one arc more than detected, since overlapping arcs look like one.
+
+    Args:
+        features (dict): spectrum features from extract_spectrum_features
+        topology (dict): circuit topology from circuit_topology
+
+    Returns:
+        bool: True if the circuit is compatible with the spectrum
+    """
+    if not features["arcs"] <= topology["arcs"] <= features["arcs"] + 1:
+        return False
+    if features["inductive_loop"] != topology["inductive"]:
+        return False
+    # a constant phase element in series can also produce a Warburg-like tail
+    if features["tail"] == "warburg" and not (topology["diffusion"] or topology["series_capacitive"]):
+        return False
+    if features["tail"] == "capacitive" and not topology["series_capacitive"]:
+        return False
+    if features["tail"] is None and (topology["diffusion"] or topology["series_capacitive"]):
+        return False
+    if features["series_resistance"] and not topology["series_resistance"]:
+        return False
+    return True
+
+
+def select_compatible_circuits(features:dict, circuits:dict):
+    """Keep the circuits which are compatible with the spectrum features.
+    If none of them is compatible, all circuits are kept.
+
+    Args:
+        features (dict): spectrum features from extract_spectrum_features
+        circuits (dict): circuit strings and their initial guesses
+
+    Returns:
+        dict: the compatible circuits and their initial guesses
+    """
+    compatible = {circuit: guess for circuit, guess in circuits.items()
+                  if is_compatible(features, circuit_topology(circuit))}
+    if not compatible:
+        log.warning("None of the suggested circuits matches the spectrum shape, all of them are fitted.")
+        return dict(circuits)
+    log.info(f"The spectrum shape {features} matches {len(compatible)} of {len(circuits)} "
+             f"suggested circuits: {list(compatible)}")
+    return compatible
@@ -0,0 +1,167 @@
+"""DRT module. The distribution of relaxation times of a spectrum is found by Tikhonov regularized
+non-negative least squares on a logarithmic grid of time constants. The kernel of a frequency grid and
+the eigendecomposition of its normal matrix are computed once and reused for every regularization
+strength of the sweep and for every spectrum measured on the same grid."""
+# Wan, T. H. et al. Influence of the Discretization Methods on the Distribution of Relaxation Times
+# Deconvolution: Implementing Radial Basis Functions with DRTtools.
+# Electrochimica Acta 184, 483–499 (2015) doi: 10.1016/j.electacta.2015.09.097.
+from functools import lru_cache
+
+import numpy as np
+from scipy.optimize import nnls
+from scipy.signal import find_peaks
+
+from madap.logger import logger
+
+
+log = logger.get_logger("impedance_drt")
+DRT_POINTS_PER_DECADE = 10
+# decades by which the time constants extend beyond 1/(2 pi f) of the measured frequencies
+TAU_EXTENSION = 1
+# the regularization strength is chosen from this sweep by generalized cross validation
+REGULARIZATION_STRENGTHS = np.logspace(-6, 0, 13)
+# the series resistance and inductance columns are scaled up, so that the ridge term does not bias them
+SERIES_COLUMN_SCALE = 100
+KERNEL_CACHE_SIZE = 32
+MAX_NNLS_ITERATIONS = 10000
+# minimum prominence of a DRT peak relative to the maximum of the distribution
+PEAK_PROMINENCE = 0.01
+
+
+@lru_cache(maxsize=KERNEL_CACHE_SIZE)
+def drt_kernel(frequency_bytes:bytes, points_per_decade:int = DRT_POINTS_PER_DECADE, inductance:bool = True):
+    """Build the DRT kernel of a frequency grid and the eigendecomposition of its normal matrix.
+    The kernel is cached, so spectra sharing a frequency grid reuse it.
+
+    Args:
+        frequency_bytes (bytes): frequencies as bytes of a float64 array
+        points_per_decade (int, optional): time constants per decade. Defaults to DRT_POINTS_PER_DECADE.
+        inductance (bool, optional): If True, a series inductance is part of the model. Defaults to True.
+
+    Returns:
+        tuple: time constants, column scales, real and imaginary kernel stacked (2 n_frequencies, n_columns),
+            eigenvalues and eigenvectors of the normal matrix
+    """
+    frequency = np.frombuffer(frequency_bytes, dtype=float)
+    omega = 2 * np.pi * frequency
+    log_tau_min = np.log10(1 / np.max(omega)) - TAU_EXTENSION
+    log_tau_max = np.log10(1 / np.min(omega)) + TAU_EXTENSION
+    n_tau = int(np.ceil((log_tau_max - log_tau_min) * points_per_decade)) + 1
+    tau = np.logspace(log_tau_min, log_tau_max, n_tau)
+    d_ln_tau = np.log(tau[1] / tau[0])
+
+    # columns: series resistance, series inductance and the piecewise constant distribution
+    omega_tau = omega[:, np.newaxis] * tau
+    kernel = np.zeros((2 * frequency.size, n_tau + 2))
+    kernel[:frequency.size, 0] = 1
+    if inductance:
+        kernel[frequency.size:, 1] = omega
+    kernel[:frequency.size, 2:] = d_ln_tau / (1 + omega_tau**2)
+    kernel[frequency.size:, 2:] = -omega_tau * d_ln_tau / (1 + omega_tau**2)
+
+    column_norms = np.linalg.norm(kernel[:, :2], axis=0)
+    column_scale = np.ones(n_tau + 2)
+    column_scale[:2] = np.where(column_norms > 0, SERIES_COLUMN_SCALE / np.where(column_norms > 0, column_norms, 1), 1)
+    kernel *= column_scale
+    eigenvalues, eigenvectors = np.linalg.eigh(kernel.T @ kernel)
+    eigenvalues = np.clip(eigenvalues, 0, None)
+    for array in (tau, column_scale, kernel, eigenvalues, eigenvectors):
+        # the cached arrays are shared between the spectra
+        array.flags.writeable = False
+    return tau, column_scale, kernel, eigenvalues, eigenvectors
+
+
+def fit_drt(frequency, impedance, regularization:float = None, points_per_decade:int = DRT_POINTS_PER_DECADE,
+            inductance:bool = True, regularization_strengths = REGULARIZATION_STRENGTHS):
+    """Find the distribution of relaxation times of a spectrum. Without a given regularization
+    strength, the sweep of regularization strengths is solved and the strength with the lowest
+    generalized cross validation error is taken.
+
+    Args:
+        frequency (np.array): measured frequencies
+        impedance (np.array): measured complex impedance
+        regularization (float, optional): regularization strength. Defaults to None (chosen from the sweep).
+        points_per_decade (int, optional): time constants per decade. Defaults to DRT_POINTS_PER_DECADE.
+        inductance (bool, optional): If True, a series inductance is part of the model. Defaults to True.
+        regularization_strengths (np.array, optional): regularization strengths of the sweep.
+            Defaults to REGULARIZATION_STRENGTHS.
+
+    Returns:
+        dict: time constants, distribution [Ohm], series resistance, inductance, fitted impedance,
+            chosen regularization strength and the sweep (strength, residual norm and distribution norm)
+    """
+    frequency = np.asarray(frequency, dtype=float)
+    impedance = np.asarray(impedance, dtype=complex)
+    if frequency.size < 2 or np.min(frequency) <= 0:
+        log.error("The DRT needs at least two positive frequencies.")
+        raise ValueError("The DRT needs at least two positive frequencies.")
+    tau, column_scale, kernel, eigenvalues, eigenvectors = drt_kernel(frequency.tobytes(), points_per_decade,
+                                                                      inductance)
+    # the impedance is normalized, so that the regularization strengths are comparable between spectra
+    scale = np.max(np.abs(impedance))
+    target = np.hstack([impedance.real, impedance.imag]) / scale
+    projected_target = eigenvectors.T @ (kernel.T @ target)
+
+    strengths = np.atleast_1d(regularization if regularization is not None else regularization_strengths)
+    solutions, residual_norms, solution_norms = [], [], []
+    for strength in strengths:
+        # kernel.T kernel + strength I = A.T A with the shared eigendecomposition, so the non-negative
+        # regularized problem is solved on a square system without refactorizing
+        root = np.sqrt(eigenvalues + strength)
+        solution, _ = nnls(root[:, np.newaxis] * eigenvectors.T, projected_target / root,
+                           maxiter=MAX_NNLS_ITERATIONS)
+        solutions.append(solution)
+        residual_norms.append(np.linalg.norm(kernel @ solution - target))
+        solution_norms.append(np.linalg.norm(solution[2:]))
+    best = select_regularization(residual_norms, eigenvalues, strengths, target.size)
+
+    parameters = solutions[best] * column_scale * scale
+    z_drt = scale * (kernel[:frequency.size] @ solutions[best] + 1j * kernel[frequency.size:] @ solutions[best])
+    log.info(f"DRT with {tau.size} time constants and regularization strength {strengths[best]:.2g}.")
+    return {"tau": np.array(tau), "gamma": parameters[2:], "r_inf": parameters[0], "inductance": parameters[1],
+            "z_drt": z_drt, "regularization": float(strengths[best]),
+            "sweep": [{"regularization": float(strength), "residual_norm": float(residual_norm),
+                       "solution_norm": float(solution_norm)}
+                      for strength, residual_norm, solution_norm in zip(strengths, residual_norms, solution_norms)]}
+
+
+def select_regularization(residual_norms:list, eigenvalues, strengths, n_observations:int):
+    """Choose the regularization strength of the sweep by generalized cross validation. The effective
+    number of parameters follows from the eigenvalues of the normal matrix, ignoring the non-negativity.
+
+    Args:
+        residual_norms (list): residual norms of the sweep
+        eigenvalues (np.array): eigenvalues of the normal matrix
+        strengths (np.array): regularization strengths of the sweep
+        n_observations (int): number of fitted real values
+
+    Returns:
+        int: index of the chosen regularization strength
+    """
+    effective_parameters = np.array([np.sum(eigenvalues / (eigenvalues + strength)) for strength in strengths])
+    with np.errstate(divide="ignore"):
+        gcv = np.square(residual_norms) / n_observations / (1 - effective_parameters / n_observations)**2
+    return int(np.argmin(np.where(effective_parameters < n_observations, gcv, np.inf)))
+
+
+def drt_peaks(tau, gamma):
+    """Find the processes of a distribution of relaxation times. The resistance of a peak is the
+    area of the distribution between the neighbouring minima.
+
+    Args:
+        tau (np.array): time constants
+        gamma (np.array): distribution [Ohm]
+
+    Returns:
+        list: time constant, characteristic frequency and resistance of every peak
+    """
+    if np.max(gamma) <= 0:
+        return []
+    d_ln_tau = np.log(tau[1] / tau[0])
+    peaks, _ = find_peaks(np.r_[0, gamma, 0], prominence=PEAK_PROMINENCE * np.max(gamma))
+    peaks -= 1
+    bounds = [0] + [start + int(np.argmin(gamma[start:stop])) for start, stop in zip(peaks[:-1], peaks[1:])] + \
+             [gamma.size]
+    return [{"tau": float(tau[peak]), "frequency": float(1 / (2 * np.pi * tau[peak])),
+             "resistance": float(np.sum(gamma[start:stop]) * d_ln_tau)}
+            for peak, start, stop in zip(peaks, bounds[:-1], bounds[1:])]
@@ -0,0 +1,175 @@
+"""Harmonic analysis module. Time domain recordings of voltage and current at a series of excitation
+frequencies are streamed block by block. The window of every frequency block spans the number of periods
+(at least the requested one) which is closest to a whole number of samples. The complete windows are
+transformed at once with a DFT at the exact harmonic frequencies, so a remaining fraction of a sample per
+window does not shift the harmonics off their bins, and a larger mismatch is tapered with a Hann window.
+Only the samples of the incomplete window are carried over to the next block."""
+import numpy as np
+
+from madap.logger import logger
+
+
+log = logger.get_logger("impedance_harmonics")
+PERIODS_PER_WINDOW = 4
+# the periods of a window are searched up to this multiple of the requested periods per window
+MAX_PERIODS_FACTOR = 4
+# mismatch [periods] between a window and a whole number of samples which is accepted without a taper
+PERIOD_TOLERANCE = 1e-4
+# fundamental and higher harmonics, 5 means up to the 5th harmonic
+N_HARMONICS = 5
+# samples of one period kept per excitation frequency for the Lissajous plot
+LISSAJOUS_POINTS = 500
+# samples at the start of a frequency block used for the sampling interval
+SAMPLING_ESTIMATE_POINTS = 1000
+
+
+class HarmonicAnalyzer:
+    """Running harmonic analysis of a recording at a series of excitation frequencies. The recording is fed
+    in chunks of rows, the rows of one excitation frequency have to be consecutive."""
+    def __init__(self, n_harmonics:int = N_HARMONICS, periods_per_window:int = PERIODS_PER_WINDOW):
+        """Initialize the analyzer.
+
+        Args:
+            n_harmonics (int, optional): Highest harmonic which is extracted. Defaults to N_HARMONICS.
+            periods_per_window (int, optional): Least periods of the excitation per DFT window, more periods are used
+                if they fit a whole number of samples better. Defaults to PERIODS_PER_WINDOW.
+        """
+        if n_harmonics < 1 or periods_per_window < 1:
+            log.error("The number of harmonics and the periods per window have to be at least 1.")
+            raise ValueError("The number of harmonics and the periods per window have to be at least 1.")
+        self.n_harmonics = n_harmonics
+        self.periods_per_window = periods_per_window
+        self.results = []
+        # state of the current frequency block
+        self._frequency = None
+        self._buffer = np.empty((0, 3))
+        self._window_size = None
+        self._periods = None
+        self._basis = None
+        self._impedance_sum = 0
+        self._voltage_amplitudes = None
+        self._current_amplitudes = None
+        self._n_windows = 0
+        self._lissajous = None
+
+    def feed(self, frequency, time, voltage, current):
+        """Feed the next chunk of the recording.
+
+        Args:
+            frequency (np.array): excitation frequency [Hz] of every row
+            time (np.array): time [s]
+            voltage (np.array): voltage [V]
+            current (np.array): current [A]
+        """
+        frequency = np.asarray(frequency, dtype=float)
+        samples = np.column_stack([np.asarray(time, dtype=float), np.asarray(voltage, dtype=float),
+                                   np.asarray(current, dtype=float)])
+        starts = np.r_[0, np.flatnonzero(np.diff(frequency) != 0) + 1]
+        for start, stop in zip(starts, np.r_[starts[1:], frequency.size]):
+            if frequency[start] != self._frequency:
+                self._finish_block()
+                self._frequency = frequency[start]
+            self._buffer = np.concatenate([self._buffer, samples[start:stop]])
+            self._process_windows()
+
+    def finish(self):
+        """Finish the analysis of the last frequency block.
+
+        Returns:
+            list: results of every excitation frequency
+        """
+        self._finish_block()
+        return self.results
+
+    def _process_windows(self):
+        """Transform all complete windows of the buffer at once and keep the rest of the samples.
+        """
+        if self._window_size is None:
+            if len(self._buffer) < min(SAMPLING_ESTIMATE_POINTS, 2 * self.n_harmonics + 2):
+                return
+            self._start_block()
+        n_windows = len(self._buffer) // self._window_size
+        if not n_windows:
+            return
+        windows = self._buffer[:n_windows * self._window_size].reshape(n_windows, self._window_size, 3)
+        # DFT at the exact harmonic frequencies, which are off the FFT bins by the period mismatch of the window
+        spectra = np.einsum("wsc,sh->whc", windows[:, :, 1:], self._basis)
+        voltage_harmonics, current_harmonics = spectra[..., 0], spectra[..., 1]
+        self._impedance_sum = self._impedance_sum + np.sum(voltage_harmonics[:, 0] / current_harmonics[:, 0])
+        self._voltage_amplitudes += np.sum(np.abs(voltage_harmonics), axis=0)
+        self._current_amplitudes += np.sum(np.abs(current_harmonics), axis=0)
+        self._n_windows += n_windows
+        if self._lissajous is None:
+            period = windows[0, :max(2, self._window_size // self._periods)]
+            self._lissajous = period[::max(1, len(period) // LISSAJOUS_POINTS), 1:].copy()
+        self._buffer = self._buffer[n_windows * self._window_size:]
+
+    def _start_block(self):
+        """Set up the windows of a frequency block from its sampling interval.
+        """
+        sampling_interval = np.median(np.diff(self._buffer[:SAMPLING_ESTIMATE_POINTS, 0]))
+        if not sampling_interval > 0 or not self._frequency > 0:
+            log.error(f"The time of the block at {self._frequency} [Hz] is not increasing or the frequency is not positive.")
+            raise ValueError("The time has to increase and the excitation frequency has to be positive.")
+        samples_per_period = 1 / (self._frequency * sampling_interval)
+        # the periods of the window which come closest to a whole number of samples
+        periods = np.arange(self.periods_per_window, MAX_PERIODS_FACTOR * self.periods_per_window + 1)
+        mismatch = np.abs(np.round(periods * samples_per_period) - periods * samples_per_period) / samples_per_period
+        best = int(np.argmax(mismatch <= PERIOD_TOLERANCE)) if np.any(mismatch <= PERIOD_TOLERANCE) \
+            else int(np.argmin(mismatch))
+        self._periods = int(periods[best])
+        self._window_size = int(round(self._periods * samples_per_period))
+        # a Hann taper against the leakage of the remaining mismatch, its main lobe needs two periods per window
+        tapered = mismatch[best] > PERIOD_TOLERANCE and self._periods > 1
+        if mismatch[best] > PERIOD_TOLERANCE:
+            log.warning(f"The windows of {self._periods} periods at {self._frequency} [Hz] are {mismatch[best]:.2e} "
+                        f"periods off a whole number of samples, {'a Hann taper is applied' if tapered else 'the harmonics leak'}.")
+        else:
+            log.info(f"The windows at {self._frequency} [Hz] have {self._window_size} samples for {self._periods} periods "
+                     f"with a mismatch of {mismatch[best]:.2e} periods.")
+        # harmonics below the Nyquist frequency of the window
+        n_harmonics = min(self.n_harmonics, (self._window_size // 2 - 1) // self._periods)
+        if n_harmonics < 1:
+            log.error(f"The sampling rate is too low for the excitation frequency {self._frequency} [Hz].")
+            raise ValueError("The sampling rate is too low for the excitation frequency.")
+        if n_harmonics < self.n_harmonics:
+            log.warning(f"Only {n_harmonics} harmonics are below the Nyquist frequency at {self._frequency} [Hz].")
+        phase = 2 * np.pi * np.outer(np.arange(self._window_size), np.arange(1, n_harmonics + 1)) / samples_per_period
+        taper = np.hanning(self._window_size + 1)[:-1] if tapered else np.ones(self._window_size)
+        self._basis = np.exp(-1j * phase) * (2 * taper / np.sum(taper))[:, np.newaxis]
+        self._voltage_amplitudes = np.zeros(n_harmonics)
+        self._current_amplitudes = np.zeros(n_harmonics)
+
+    def _finish_block(self):
+        """Average the windows of the current frequency block into its result and reset the block state.
+        """
+        if self._frequency is not None and self._window_size is None and len(self._buffer) > 1:
+            self._start_block()
+            self._process_windows()
+        if self._frequency is not None:
+            if self._n_windows:
+                self.results.append(self._block_result())
+            else:
+                log.warning(f"The recording at {self._frequency} [Hz] is shorter than one window and is skipped.")
+        self._frequency = None
+        self._buffer = np.empty((0, 3))
+        self._window_size = self._periods = self._basis = self._lissajous = None
+        self._impedance_sum, self._n_windows = 0, 0
+
+    def _block_result(self):
+        """Result of the current frequency block.
+
+        Returns:
+            dict: frequency, impedance of the fundamental, harmonic amplitudes, total harmonic distortions,
+                number of periods and one period of voltage and current
+        """
+        voltage_amplitudes = self._voltage_amplitudes / self._n_windows
+        current_amplitudes = self._current_amplitudes / self._n_windows
+        return {"frequency": float(self._frequency),
+                "impedance": complex(self._impedance_sum / self._n_windows),
+                "voltage_amplitudes": voltage_amplitudes,
+                "current_amplitudes": current_amplitudes,
+                "thd_voltage": float(np.sqrt(np.sum(voltage_amplitudes[1:]**2)) / voltage_amplitudes[0]),
+                "thd_current": float(np.sqrt(np.sum(current_amplitudes[1:]**2)) / current_amplitudes[0]),
+                "periods": self._n_windows * self._periods,
+                "lissajous": self._lissajous}
@@ -0,0 +1,234 @@
+"""Initial guess library module. Spectra of the suggested circuits are simulated offline for random
+parameter sets on a fixed frequency grid, normalized in magnitude and stored on disk as arrays of
+log-magnitude and phase features and of the normalized parameters. At runtime the arrays are
+memory-mapped, the closest entries of a measured spectrum are found with a KD-tree and the parameters
+of the best entry, scaled to the magnitude of the measured spectrum, are used as initial guess."""
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from madap.logger import logger
+from madap.utils.suggested_circuits import suggested_circuits
+from madap.echem.e_impedance import e_impedance_circuit as ecirc
+
+
+log = logger.get_logger("impedance_library")
+# bump the version if the features or the sampling change, so that old libraries are not used anymore
+LIBRARY_VERSION = 1
+LIBRARY_INDEX = "library.json"
+LIBRARY_FREQUENCY = np.logspace(-2, 6, 33)
+# simulated parameter sets per circuit
+LIBRARY_SIZE = 5000
+# entries returned by the KD-tree, which are ranked again on the measured frequency range
+LIBRARY_NEIGHBOURS = 32
+# library frequencies which have to be inside the measured range for a lookup
+MIN_LIBRARY_POINTS = 5
+# element type: sampling range of every parameter (low, high, logarithmic) of the normalized spectra
+PARAMETER_RANGES = {"R": [(-2, 2, True)], "C": [(-8, 0, True)], "L": [(-9, -3, True)],
+                    "CPE": [(-8, 0, True), (0.5, 1, False)], "W": [(-2, 2, True)],
+                    "Wo": [(-2, 2, True), (-5, 2, True)], "Ws": [(-2, 2, True), (-5, 2, True)],
+                    "K": [(-2, 2, True), (-7, 2, True)], "G": [(-2, 2, True), (-7, 2, True)]}
+# element type: exponent of every parameter if the impedance is scaled by a factor,
+# e.g. a resistance scales with the factor and a capacitance with its inverse
+IMPEDANCE_SCALING = {"R": [1], "C": [-1], "L": [1], "CPE": [-1, 0], "W": [1],
+                     "Wo": [1, 0], "Ws": [1, 0], "K": [1, 0], "G": [1, 0]}
+
+
+def spectrum_features(frequency, impedance, library_frequency):
+    """Get the features of a spectrum, the decadic logarithm of the magnitude and the phase [rad]
+    interpolated on the library frequencies.
+
+    Args:
+        frequency (np.array): frequencies
+        impedance (np.array): complex impedance
+        library_frequency (np.array): frequencies of the library
+
+    Returns:
+        tuple: log-magnitude and phase on the library frequencies (values outside of the measured range
+            are the ones of the closest measured frequency) and the mask of the library frequencies
+            inside of the measured range
+    """
+    order = np.argsort(frequency)
+    log_frequency = np.log10(np.asarray(frequency, dtype=float)[order])
+    impedance = np.asarray(impedance, dtype=complex)[order]
+    log_library_frequency = np.log10(library_frequency)
+    log_magnitude = np.interp(log_library_frequency, log_frequency, np.log10(np.abs(impedance)))
+    phase = np.interp(log_library_frequency, log_frequency, np.unwrap(np.angle(impedance)))
+    inside = (log_library_frequency >= log_frequency[0]) & (log_library_frequency <= log_frequency[-1])
+    return log_magnitude, phase, inside
+
+
+def _parameter_scaling(circuit:str):
+    """Get the scaling exponents of the parameters of a circuit.
+
+    Args:
+        circuit (str): circuit string
+
+    Returns:
+        np.array: exponent of every parameter or None if an element can not be scaled
+    """
+    # pylint: disable=protected-access
+    element_types = [ecirc._element_type(element) for element in ecirc.circuit_elements(circuit)]
+    if not all(element_type in IMPEDANCE_SCALING for element_type in element_types):
+        return None
+    return np.array([exponent for element_type in element_types for exponent in IMPEDANCE_SCALING[element_type]],
+                    dtype=float)
+
+
+def _circuit_stem(circuit:str):
+    """Get the file name stem of the arrays of a circuit, circuit strings are not valid file names.
+
+    Args:
+        circuit (str): circuit string
+
+    Returns:
+        str: file name stem
+    """
+    return hashlib.blake2b(circuit.encode(), digest_size=8).hexdigest()
+
+
+def build_guess_library(library_dir:str, circuits:dict = None, frequency = LIBRARY_FREQUENCY,
+                        size:int = LIBRARY_SIZE, seed:int = 0):
+    """Build the initial guess library offline. For every circuit, random parameter sets are simulated
+    on the library frequencies, scaled so that the mean log-magnitude of their spectrum is zero and
+    stored with the features of their spectrum.
+
+    Args:
+        library_dir (str): directory of the library
+        circuits (dict, optional): circuit strings (keys are used). Defaults to None (suggested_circuits).
+        frequency (np.array, optional): frequencies of the library. Defaults to LIBRARY_FREQUENCY.
+        size (int, optional): parameter sets per circuit. Defaults to LIBRARY_SIZE.
+        seed (int, optional): seed of the parameter sets. Defaults to 0.
+
+    Returns:
+        dict: index of the library
+    """
+    os.makedirs(library_dir, exist_ok=True)
+    frequency = np.asarray(frequency, dtype=float)
+    rng = np.random.default_rng(seed)
+    index = {"version": LIBRARY_VERSION, "frequency": frequency.tolist(), "size": size, "seed": seed, "circuits": {}}
+    for circuit in (suggested_circuits if circuits is None else circuits):
+        scaling = _parameter_scaling(circuit)
+        if scaling is None or not ecirc.is_supported(circuit):
+            log.warning(f"The circuit {circuit} can not be simulated for the guess library and is left out.")
+            continue
+        try:
+            ranges = [parameter_range for element in ecirc.circuit_elements(circuit)
+                      # pylint: disable=protected-access
+                      for parameter_range in PARAMETER_RANGES[ecirc._element_type(element)]]
+            samples = np.column_stack([rng.uniform(low, high, size) for low, high, _ in ranges])
+            parameters = np.where([logarithmic for _, _, logarithmic in ranges], 10**samples, samples)
+            impedance = ecirc.simulate_circuit(circuit, frequency, parameters)
+        except ValueError as exp:
+            log.warning(f"The circuit {circuit} can not be simulated for the guess library ({exp}) and is left out.")
+            continue
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_magnitude = np.log10(np.abs(impedance))
+            phase = np.unwrap(np.angle(impedance), axis=1)
+        valid = np.all(np.isfinite(log_magnitude) & np.isfinite(phase), axis=1)
+        # normalize the spectra to a mean log-magnitude of zero and scale the parameters with them
+        offset = np.mean(log_magnitude[valid], axis=1, keepdims=True)
+        parameters = parameters[valid] * (10**-offset)**scaling
+        features = np.hstack([log_magnitude[valid] - offset, phase[valid]])
+
+        stem = _circuit_stem(circuit)
+        np.save(os.path.join(library_dir, f"{stem}_features.npy"), features)
+        np.save(os.path.join(library_dir, f"{stem}_parameters.npy"), parameters)
+        index["circuits"][circuit] = stem
+        log.info(f"Simulated {features.shape[0]} spectra of the circuit {circuit} for the guess library.")
+    with open(os.path.join(library_dir, LIBRARY_INDEX), "w", encoding="utf-8") as file:
+        json.dump(index, file)
+    return index
+
+
+def lookup_initial_guess(library_dir:str, circuit:str, frequency, impedance):
+    """Get the initial guess of a circuit from the closest spectrum of the library. The KD-tree returns the
+    closest entries on all library frequencies, they are ranked again on the library frequencies inside of the
+    measured range, after shifting their log-magnitude to the one of the measured spectrum.
+
+    Args:
+        library_dir (str): directory of the library
+        circuit (str): circuit string
+        frequency (np.array): frequencies of the measured spectrum
+        impedance (np.array): complex impedance of the measured spectrum
+
+    Returns:
+        list: initial guess or None if the circuit is not in the library or the spectrum does not
+            overlap with the library frequencies
+    """
+    modified = os.path.getmtime(os.path.join(library_dir, LIBRARY_INDEX))
+    library = load_guess_library(library_dir, modified)
+    if circuit not in library["circuits"]:
+        return None
+    library_frequency = library["frequency"]
+    log_magnitude, phase, inside = spectrum_features(frequency, impedance, library_frequency)
+    if np.sum(inside) < MIN_LIBRARY_POINTS or not np.all(np.isfinite(log_magnitude) & np.isfinite(phase)):
+        return None
+    tree, features, parameters = _circuit_entries(library_dir, library["circuits"][circuit], modified)
+    _, neighbours = tree.query(np.hstack([log_magnitude - np.mean(log_magnitude), phase]),
+                               k=min(LIBRARY_NEIGHBOURS, tree.n))
+    neighbours = np.atleast_1d(neighbours)
+
+    n_frequencies = library_frequency.size
+    candidates = features[neighbours]
+    # magnitude offset of every entry on the measured range, the parameters are scaled with it
+    offsets = np.mean(log_magnitude[inside] - candidates[:, :n_frequencies][:, inside], axis=1)
+    distances = np.sum((log_magnitude[inside] - candidates[:, :n_frequencies][:, inside] - offsets[:, np.newaxis])**2 +
+                       (phase[inside] - candidates[:, n_frequencies:][:, inside])**2, axis=1)
+    best = int(np.argmin(distances))
+    return (parameters[neighbours[best]] * (10**offsets[best])**_parameter_scaling(circuit)).tolist()
+
+
+@lru_cache(maxsize=None)
+def load_guess_library(library_dir:str, modified:float = None):
+    """Load the index of the library. The index is cached per modification time, so a rebuilt
+    library is loaded again.
+
+    Args:
+        library_dir (str): directory of the library
+        modified (float, optional): modification time of the index. Defaults to None.
+
+    Returns:
+        dict: index of the library with the frequencies as array
+    """
+    with open(os.path.join(library_dir, LIBRARY_INDEX), "r", encoding="utf-8") as file:
+        index = json.load(file)
+    if index.get("version") != LIBRARY_VERSION:
+        log.error(f"The guess library {library_dir} has the version {index.get('version')} instead of "
+                  f"{LIBRARY_VERSION}, it has to be built again.")
+        raise ValueError(f"The guess library {library_dir} has to be built again.")
+    log.info(f"Loaded the guess library {library_dir} with {len(index['circuits'])} circuits.")
+    return {**index, "frequency": np.asarray(index["frequency"], dtype=float)}
+
+
+@lru_cache(maxsize=None)
+def _circuit_entries(library_dir:str, stem:str, modified:float = None):
+    """Memory-map the arrays of a circuit and build the KD-tree of its features.
+
+    Args:
+        library_dir (str): directory of the library
+        stem (str): file name stem of the circuit
+        modified (float, optional): modification time of the index. Defaults to None.
+
+    Returns:
+        tuple: KD-tree, features and parameters of the circuit
+    """
+    features = np.load(os.path.join(library_dir, f"{stem}_features.npy"), mmap_mode="r")
+    parameters = np.load(os.path.join(library_dir, f"{stem}_parameters.npy"), mmap_mode="r")
+    return cKDTree(features), features, parameters
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the initial guess library of the suggested circuits.")
+    parser.add_argument("library_dir", type=str, help="directory of the library")
+    parser.add_argument("-s", "--size", type=int, required=False, default=LIBRARY_SIZE,
+                        help="simulated parameter sets per circuit")
+    parser.add_argument("--seed", type=int, required=False, default=0, help="seed of the parameter sets")
+    args = parser.parse_args()
+    build_guess_library(args.library_dir, size=args.size, seed=args.seed)
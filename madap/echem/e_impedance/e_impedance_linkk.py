@@ -0,0 +1,198 @@
+"""Lin-KK module. The linear Kramers-Kronig test of the impedance package, with the RC basis of
+all numbers of RC elements built once per frequency grid and the least squares problems of
+consecutive numbers of RC elements solved together in batched calls. The results are the same
+as those of impedance.validation.linKK."""
+# Schönleber, M. et al. A Method for Improving the Robustness of
+# linear Kramers-Kronig Validity Tests.
+# Electrochimica Acta 131, 20–27 (2014) doi: 10.1016/j.electacta.2014.01.034.
+from functools import lru_cache
+
+import numpy as np
+
+from madap.logger import logger
+
+
+log = logger.get_logger("impedance_linkk")
+# number of consecutive numbers of RC elements solved in one batched call
+LINKK_BLOCK_SIZE = 8
+# number of frequency grids whose basis is kept for the following spectra
+BASIS_CACHE_SIZE = 32
+FIT_TYPES = ["real", "imag", "complex"]
+# value of the series capacitance while fitting the real part, nullifies it without dividing by 0
+NULL_CAPACITANCE = 1e-18
+
+
+def lin_kk(frequency, impedance, c:float = 0.85, max_M:int = 50, fit_type:str = "real", add_cap:bool = False):
+    """Lin-KK test with the same arguments and results as impedance.validation.linKK. The number of RC
+    elements is increased from 1 until mu is not above the cut off c or max_M + 1 elements are reached.
+
+    Args:
+        frequency (np.array): measured frequencies
+        impedance (np.array): measured complex impedance
+        c (float, optional): cut off for mu, if None max_M RC elements are used. Defaults to 0.85.
+        max_M (int, optional): maximum number of RC elements. Defaults to 50.
+        fit_type (str, optional): fitted part of the impedance ("real", "imag" or "complex"). Defaults to "real".
+        add_cap (bool, optional): If True, a series capacitance is added to the model. Defaults to False.
+
+    Returns:
+        tuple: number of RC elements, mu, fitted impedance and the real and imaginary residuals
+    """
+    if fit_type not in FIT_TYPES:
+        log.error(f"Invalid choice of fit_type, please choose from {FIT_TYPES}")
+        raise ValueError("Invalid choice of fit_type")
+    frequency = np.asarray(frequency, dtype=float)
+    impedance = np.asarray(impedance, dtype=complex)
+    n_rc = tuple(range(1, max_M + 2)) if c is not None else (max_M,)
+    time_constants, kernels = linkk_basis(frequency.tobytes(), n_rc)
+
+    for start in range(0, len(n_rc), LINKK_BLOCK_SIZE):
+        block = slice(start, start + LINKK_BLOCK_SIZE)
+        elements = _fit_block(frequency, impedance, n_rc[block], kernels[block], fit_type, add_cap)
+        mu = np.array([_calc_mu(rc_elements[1:m + 1]) for m, rc_elements in zip(n_rc[block], elements)])
+        # the number of RC elements is increased as long as mu is above the cut off
+        stops = np.flatnonzero(~(mu > c)) if c is not None else np.array([0])
+        if stops.size or block.stop >= len(n_rc):
+            i = stops[0] if stops.size else len(elements) - 1
+            break
+
+    m = n_rc[start + i]
+    z_fit = _evaluate(elements[i], m, kernels[start + i], frequency, add_cap)
+    residuals = (impedance - z_fit) / np.abs(impedance)
+    log.info(f"Lin-KK test with {m} RC elements (time constants {time_constants[start + i][0]:.3g} "
+             f"to {time_constants[start + i][-1]:.3g} s), mu is {mu[i]}")
+    return m, mu[i], z_fit, residuals.real, residuals.imag
+
+
+@lru_cache(maxsize=BASIS_CACHE_SIZE)
+def linkk_basis(frequency_bytes:bytes, n_rc:tuple):
+    """Build the time constants and RC element impedances of all numbers of RC elements of a frequency grid.
+    The basis is cached, so spectra sharing a frequency grid reuse it.
+
+    Args:
+        frequency_bytes (bytes): frequencies as bytes of a float64 array
+        n_rc (tuple): numbers of RC elements
+
+    Returns:
+        tuple: time constants and impedance of unit RC elements (n_frequencies, n_rc) for every number of RC elements
+    """
+    frequency = np.frombuffer(frequency_bytes, dtype=float)
+    t_max = 1/(2 * np.pi * np.min(frequency))
+    t_min = 1/(2 * np.pi * np.max(frequency))
+    time_constants = []
+    for m in n_rc:
+        # logarithmically distributed as in impedance.validation.get_tc_distribution
+        taus = np.zeros(m)
+        taus[1:m - 1] = 10**(np.log10(t_min) + (np.arange(1, m - 1) / (m - 1)) * np.log10(t_max / t_min))
+        taus[0], taus[-1] = t_min, t_max
+        time_constants.append(taus)
+    # the impedance of all RC elements of all numbers of RC elements in one vectorized call
+    omega = 2 * np.pi * frequency
+    all_kernels = 1 / (1 + 1j * omega[:, np.newaxis] * np.concatenate(time_constants))
+    kernels = np.split(all_kernels, np.cumsum(n_rc)[:-1], axis=1)
+    return time_constants, kernels
+
+
+def _fit_block(frequency, impedance, n_rc, kernels, fit_type, add_cap):
+    """Fit the Lin-KK model for consecutive numbers of RC elements. The design matrices are padded to
+    a common width and solved in one batched call. The elements of every model are ordered as
+    series resistance, RC elements, series capacitance (if added) and series inductance.
+
+    Args:
+        frequency (np.array): measured frequencies
+        impedance (np.array): measured complex impedance
+        n_rc (tuple): numbers of RC elements
+        kernels (list): impedance of unit RC elements for every number of RC elements
+        fit_type (str): fitted part of the impedance
+        add_cap (bool): If True, a series capacitance is added to the model
+
+    Returns:
+        list: elements of every model
+    """
+    omega = 2 * np.pi * frequency
+    abs_z = np.abs(impedance)
+    n_elements = [m + 2 + add_cap for m in n_rc]
+    width = max(n_elements)
+    a_re = np.zeros((len(n_rc), frequency.size, width))
+    a_im = np.zeros((len(n_rc), frequency.size, width))
+    for i, (m, kernel) in enumerate(zip(n_rc, kernels)):
+        a_re[i, :, 0] = 1 / abs_z
+        a_re[i, :, 1:m + 1] = kernel.real / abs_z[:, np.newaxis]
+        a_im[i, :, 1:m + 1] = kernel.imag / abs_z[:, np.newaxis]
+        if add_cap:
+            a_im[i, :, m + 1] = -1 / (omega * abs_z)
+        a_im[i, :, n_elements[i] - 1] = omega / abs_z
+
+    if fit_type == "complex":
+        normal = np.swapaxes(a_re, 1, 2) @ a_re + np.swapaxes(a_im, 1, 2) @ a_im
+        # the padding is an identity block, which leaves the models unchanged and gives zero elements
+        for i, n in enumerate(n_elements):
+            normal[i, range(n, width), range(n, width)] = 1
+        right = np.swapaxes(a_re, 1, 2) @ (impedance.real / abs_z) + np.swapaxes(a_im, 1, 2) @ (impedance.imag / abs_z)
+        solution = (np.linalg.inv(normal) @ right[..., np.newaxis])[..., 0]
+        return [solution[i, :n] for i, n in enumerate(n_elements)]
+
+    # the pseudo inverse gives zero elements for the zero columns of the padding
+    if fit_type == "real":
+        solution = np.linalg.pinv(a_re) @ (impedance.real / abs_z)
+    else:
+        solution = np.linalg.pinv(a_im) @ (impedance.imag / abs_z)
+    elements = [solution[i, :n].copy() for i, n in enumerate(n_elements)]
+
+    if fit_type == "real":
+        # the series inductance (and capacitance) are fitted to the imaginary part left by the real fit
+        a_series = np.zeros((frequency.size, 2))
+        a_series[:, -1] = omega / abs_z
+        if add_cap:
+            a_series[:, -2] = -1 / (omega * abs_z)
+        series_inverse = np.linalg.pinv(a_series)
+        for m, kernel, rc_elements in zip(n_rc, kernels, elements):
+            if add_cap:
+                rc_elements[-2] = NULL_CAPACITANCE
+            z_fit = _evaluate(rc_elements, m, kernel, frequency, add_cap)
+            coefficients = series_inverse.dot((impedance.imag - z_fit.imag) / abs_z)
+            if add_cap:
+                rc_elements[-2:] = coefficients
+            else:
+                rc_elements[-1] = coefficients[-1]
+    else:
+        # ohmic resistance of the imaginary fit, Eq 7 of Boukamp et al.,
+        # J. Electrochem. Soc. 142 (6) (1995)
+        weights = 1 / (impedance.real**2 + impedance.imag**2)
+        for m, kernel, rc_elements in zip(n_rc, kernels, elements):
+            z_fit = _evaluate(rc_elements, m, kernel, frequency, add_cap)
+            rc_elements[0] = np.sum(weights * (impedance.real - z_fit.real)) / np.sum(weights)
+    return elements
+
+
+def _evaluate(elements, m, kernel, frequency, add_cap):
+    """Evaluate the Lin-KK model.
+
+    Args:
+        elements (np.array): series resistance, RC elements, series capacitance (if added) and series inductance
+        m (int): number of RC elements
+        kernel (np.array): impedance of the unit RC elements
+        frequency (np.array): frequencies
+        add_cap (bool): If True, the model has a series capacitance
+
+    Returns:
+        np.array: complex impedance
+    """
+    omega = 2 * np.pi * frequency
+    z_fit = elements[0] + kernel @ elements[1:m + 1] + elements[-1] * 1j * omega
+    if add_cap:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_fit = z_fit + 1.0 / ((1 / elements[-2]) * 1j * omega)
+    return z_fit
+
+
+def _calc_mu(resistances):
+    """Ratio of the negative to the positive resistor mass, as in impedance.validation.calc_mu.
+
+    Args:
+        resistances (np.array): resistances of the RC elements
+
+    Returns:
+        float: mu
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - np.sum(np.abs(resistances[resistances < 0])) / np.sum(np.abs(resistances[resistances >= 0]))
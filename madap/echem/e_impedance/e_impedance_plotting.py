@@ -190,6 +190,98 @@ class ImpedancePlotting(Plots):
                                 scientific_limit=scientific_limit, log_scale=log_scale)
         subplot_ax.legend(loc="lower right", fontsize=5.5)
 
+    def drt(self, subplot_ax, tau, gamma, peaks:list = None, regularization:float = None,
+            ax_sci_notation = None, scientific_limit:int=3):
+        """Defines the plot of the distribution of relaxation times
+
+        Args:
+            subplot_ax (ax): Subplot axis.
+            tau (np.array): Time constant array.
+            gamma (np.array): Distribution of relaxation times array.
+            peaks (list, optional): Peaks of the distribution with their time constant. Defaults to None.
+            regularization (float, optional): Regularization strength of the distribution. Defaults to None.
+            ax_sci_notation (bool, optional): If True, adds scientific notation to the axis. Defaults to None.
+            scientific_limit (int, optional): If ax_sci_notation is True, defines the number of significant digits. Defaults to None.
+        """
+        log.info("Creating a DRT plot")
+        label = fr"$\lambda$ = {np.format_float_scientific(regularization, 2)}" if regularization else None
+        subplot_ax.plot(tau, gamma, color="#453781ff", label=label)
+        for peak in peaks or []:
+            subplot_ax.axvline(peak["tau"], color="#20a387ff", linestyle="--", lw=0.8)
+
+        self.plot_identity(subplot_ax, xlabel=r"$\tau$ $[s]$", ylabel=r"$\gamma$ $[\Omega]$",
+                           ax_sci_notation=ax_sci_notation,
+                           scientific_limit=scientific_limit, log_scale='x')
+        if label:
+            subplot_ax.legend(loc="upper left", fontsize=5.5)
+
+    def mott_schottky(self, subplot_ax, potential, inverse_square_capacitance, fit_mask=None,
+                      inverse_square_capacitance_fit=None, flat_band_potential:float = None,
+                      doping_density:float = None, ax_sci_notation = "y", scientific_limit:int=0):
+        """Defines the Mott-Schottky plot, 1/C² against the potential with optionally its linear fit
+
+        Args:
+            subplot_ax (ax): Subplot axis.
+            potential (np.array): Potential array.
+            inverse_square_capacitance (np.array): 1/C² array.
+            fit_mask (np.array, optional): Mask of the potentials used in the fit. Defaults to None.
+            inverse_square_capacitance_fit (np.array, optional): Fitted 1/C² array. Defaults to None.
+            flat_band_potential (float, optional): Flat band potential of the fit. Defaults to None.
+            doping_density (float, optional): Doping density of the fit. Defaults to None.
+            ax_sci_notation (bool, optional): If True, adds scientific notation to the axis. Defaults to "y".
+            scientific_limit (int, optional): If ax_sci_notation is True, defines the number of significant digits. Defaults to 0.
+        """
+        log.info("Creating a Mott-Schottky plot")
+        subplot_ax.scatter(potential, inverse_square_capacitance, s=10, color="#453781ff", rasterized=True)
+        if inverse_square_capacitance_fit is not None:
+            fit_mask = np.ones(len(potential), dtype=bool) if fit_mask is None else fit_mask
+            label = fr"$E_{{fb}}$ = {np.round(flat_band_potential, 3)} [V]"
+            if doping_density:
+                label += f"\nN = {np.format_float_scientific(doping_density, 3)} [cm$^{{-3}}$]"
+            subplot_ax.plot(potential[fit_mask], inverse_square_capacitance_fit[fit_mask], color="k", label=label)
+            subplot_ax.legend(loc="upper left", fontsize=5.5)
+
+        self.plot_identity(subplot_ax, xlabel=r"E $[V]$", ylabel=r"$C^{-2}$ $[cm^{4}.F^{-2}]$",
+                           ax_sci_notation=ax_sci_notation, scientific_limit=scientific_limit)
+
+    def lissajous(self, subplot_ax, frequency, periods:list, color_map:str="viridis"):
+        """Defines the Lissajous plot, current against voltage of one period per excitation frequency
+
+        Args:
+            subplot_ax (ax): Subplot axis.
+            frequency (np.array): Excitation frequency array.
+            periods (list): Voltage and current of one period (n_samples, 2) per excitation frequency.
+            color_map (str, optional): Color map. Defaults to "viridis".
+        """
+        log.info("Creating a Lissajous plot")
+        norm = mcl.LogNorm(vmin=min(frequency), vmax=max(frequency))
+        cmap = plt.get_cmap(color_map)
+        for excitation, period in zip(frequency, periods):
+            # the voltage is centered, so that the periods of all frequencies overlap
+            subplot_ax.plot(period[:, 0] - np.mean(period[:, 0]), period[:, 1], color=cmap(norm(excitation)), lw=0.8)
+        scalar_mappable = plt.cm.ScalarMappable(norm=norm, cmap=cmap)
+        self.plot_identity(subplot_ax, xlabel=r"E - $\bar{E}$ $[V]$", ylabel=r"I $[A]$",
+                           ax_sci_notation="both", scientific_limit=0)
+        self.add_colorbar(scalar_mappable, subplot_ax, colorbar_label=r"f $[Hz]$")
+
+    def harmonic_distortion(self, subplot_ax, frequency, thd_voltage, thd_current, log_scale='x'):
+        """Defines the plot of the total harmonic distortion against the excitation frequency
+
+        Args:
+            subplot_ax (ax): Subplot axis.
+            frequency (np.array): Excitation frequency array.
+            thd_voltage (np.array): Total harmonic distortion of the voltage.
+            thd_current (np.array): Total harmonic distortion of the current.
+            log_scale (str, optional): If 'x', plots the x axis in log scale. Defaults to 'x'.
+        """
+        log.info("Creating a harmonic distortion plot")
+        subplot_ax.plot(frequency, thd_voltage * 100, label=r"$THD_{V}$", color="#453781ff",
+                        linestyle="--", marker='o')
+        subplot_ax.plot(frequency, thd_current * 100, label=r"$THD_{I}$", color="#20a387ff",
+                        linestyle="--", marker='o')
+        self.plot_identity(subplot_ax, xlabel=r"f $[Hz]$", ylabel=r"THD $[\%]$", log_scale=log_scale)
+        subplot_ax.legend(loc="upper right", fontsize=5.5)
+
     def compose_eis_subplot(self, plots:list):
         """Compose the EIS subplot
 
@@ -238,6 +330,17 @@ class ImpedancePlotting(Plots):
             ax4 = fig.add_subplot(spec[1, 1])
             return fig, [ax1, ax2, ax3, ax4]
 
+        if len(plots) == 5:
+            # three panels in the upper row and two wider ones in the lower row
+            fig = plt.figure(figsize=(10, 6))
+            spec = fig.add_gridspec(2, 6)
+            ax1 = fig.add_subplot(spec[0, 0:2])
+            ax2 = fig.add_subplot(spec[0, 2:4])
+            ax3 = fig.add_subplot(spec[0, 4:6])
+            ax4 = fig.add_subplot(spec[1, 0:3])
+            ax5 = fig.add_subplot(spec[1, 3:6])
+            return fig, [ax1, ax2, ax3, ax4, ax5]
+
         if len(plots) == 0:
             log.error("No plots for EIS were selected.")
             return Exception(f"No plots for EIS were selected for plot {self.plot_type}.")
@@ -11,6 +11,9 @@ from madap.logger import logger
 from madap.utils import utils
 
 log = logger.get_logger("voltammetry")
+# factors for converting the measured units to A and s
+CURRENT_UNITS = {"uA": 1e-6, "mA": 1e-3, "A": 1}
+TIME_UNITS = {"ms": 1e-3, "s": 1, "min": 60, "h": 3600}
 
 
 class Voltammetry(EChemProcedure):
@@ -33,24 +36,18 @@ class Voltammetry(EChemProcedure):
         self.gas_constant = const.physical_constants["molar gas constant"][
             0
         ]  # Unit: J/mol/K
+        # np.asarray does not copy arrays, memory-mapped inputs therefore stay on disk
         self.voltage = voltage
-        self.np_voltage = np.array(voltage)  # Unit: V
+        self.np_voltage = np.asarray(voltage)  # Unit: V
 
         self.current = current
-        self.np_current = np.array(self.current)  # Unit: A
+        self.np_current = np.asarray(self.current)  # Unit: A
 
         self.time = time
-        self.np_time = np.array(self.time) if self.time else None  # Unit: s
+        self.np_time = np.asarray(self.time) if self.time is not None else None  # Unit: s
 
-        if self.np_time is not None:
-            self.cumulative_charge = (
-                self._calculate_charge() if charge is None else charge
-            )
-            self.np_cumulative_charge = np.array(self.cumulative_charge)  # Unit: C
-            self.convert_time()
-        else:
-            self.cumulative_charge = None
-            self.np_cumulative_charge = None
+        # the cumulative charge is calculated on first access if it is not given
+        self._cumulative_charge = charge
 
 
         self.mass_of_active_material = (
@@ -76,9 +73,32 @@ class Voltammetry(EChemProcedure):
         self.measured_current_unit = args.measured_current_units
         self.measured_time_unitis = args.measured_time_units
         self.number_of_electrons = int(args.number_of_electrons)
+        self.data_format = args.data_format
 
         self.convert_current()
+        if self.np_time is not None:
+            self.convert_time()
+
+
+    @property
+    def cumulative_charge(self):
+        """Get the cumulative charge. If it was not given, it is calculated on first access.
 
+        Returns:
+            np.array: Cumulative charge in C, None if no time is available.
+        """
+        if self._cumulative_charge is None and self.np_time is not None:
+            self._cumulative_charge = self._calculate_charge()
+        return self._cumulative_charge
+
+    @property
+    def np_cumulative_charge(self):
+        """Get the cumulative charge as numpy array.
+
+        Returns:
+            np.array: Cumulative charge in C, None if no time is available.
+        """
+        return np.asarray(self.cumulative_charge) if self.cumulative_charge is not None else None
 
     def save_figure(self, fig, plot, optional_name=None, plot_dir=None):
         """Save the figure in the plot directory.
@@ -108,11 +128,11 @@ class Voltammetry(EChemProcedure):
             data (pd.DataFrame): data to save
         """
         data_name = (
-            utils.assemble_file_name(optional_name, class_name, "data.csv")
+            utils.assemble_file_name(optional_name, class_name, f"data.{self.data_format}")
             if optional_name
-            else utils.assemble_file_name(class_name, "data.csv")
+            else utils.assemble_file_name(class_name, f"data.{self.data_format}")
         )
-        utils.save_data_as_csv(save_dir, data, data_name)
+        utils.save_data_table(save_dir, data, data_name, self.data_format)
 
     def _assemble_name(self, save_dir, optional_name, class_name):
         """Assemble the name of the file.
@@ -133,29 +153,21 @@ class Voltammetry(EChemProcedure):
 
     def convert_current(self):
         """Convert the current to A indipendently from the unit of measure"""
-        if self.measured_current_unit == "uA":
-            self.current = self.current * 1e-6
-        elif self.measured_current_unit == "mA":
-            self.current = self.current * 1e-3
-        elif self.measured_current_unit == "A":
-            self.current = self.current * 1e0
-        else:
+        if self.measured_current_unit not in CURRENT_UNITS:
             log.error("Current unit not supported. Supported units are: uA, mA, A")
             raise ValueError("Current unit not supported")
+        # data already in A is not copied
+        if CURRENT_UNITS[self.measured_current_unit] != 1:
+            self.current = self.current * CURRENT_UNITS[self.measured_current_unit]
 
     def convert_time(self):
         """Convert the time to s indipendently from the unit of measure"""
-        if self.measured_time_unitis == "s":
-            self.time = self.time * 1e0
-        elif self.measured_time_unitis == "min":
-            self.time = self.time * 60
-        elif self.measured_time_unitis == "h":
-            self.time = self.time * 3600
-        elif self.measured_time_unitis == "ms":
-            self.time = self.time * 1e-3
-        else:
+        if self.measured_time_unitis not in TIME_UNITS:
             log.error("Time unit not supported. Supported units are: s, min, h")
             raise ValueError("Time unit not supported")
+        # data already in s is not copied
+        if TIME_UNITS[self.measured_time_unitis] != 1:
+            self.time = self.time * TIME_UNITS[self.measured_time_unitis]
 
     def analyze_best_linear_fit(self, x_data, y_data):
         """
@@ -211,4 +223,4 @@ class Voltammetry(EChemProcedure):
         interval_charges = delta_t * self.np_current[1:]
 
         # Compute the cumulative charge
-        return np.cumsum(np.insert(interval_charges, 0, 0)).tolist()
+        return np.concatenate(([0], np.cumsum(interval_charges)))
@@ -0,0 +1,377 @@
+"""This module contains the out-of-core mode of the chrono amperometry and chrono potentiometry
+procedures. The trace is processed chunk by chunk, the running state (cumulative charge, the
+samples needed for the gradients at the chunk boundaries and the summary statistics) is carried
+over from one chunk to the next and the derived columns are written out incrementally, so that
+the memory needed is bounded by the chunk size instead of the size of the file."""
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.constants as const
+
+from madap.utils import utils
+from madap.echem.procedure import EChemProcedure
+from madap.echem.voltammetry.voltammetry import CURRENT_UNITS, TIME_UNITS
+from madap.logger import logger
+
+from madap.echem.voltammetry.voltammetry_plotting import VoltammetryPlotting as voltPlot
+
+
+log = logger.get_logger("chunked_voltammetry")
+# maximum number of samples of the trace kept in memory for the plots
+MAX_TRACE_POINTS = 100_000
+# plots which only need the trace and are available in the out-of-core mode
+CHUNKED_PLOTS = {"CA": ["CA", "CC", "Voltage"], "CP": ["CP", "CC", "Voltage_Profile"]}
+
+
+class Voltammetry_Chunked(EChemProcedure):
+    """This class defines the out-of-core mode of the chrono amperometry and chrono potentiometry methods."""
+    def __init__(self, chunks, procedure:str, args) -> None:
+        """Initialize the out-of-core mode.
+
+        Args:
+            chunks (iterable): Chunks of the trace as tuples of current, voltage and time arrays
+            procedure (str): Voltammetry procedure, "CA" or "CP"
+            args (argparse.Namespace): arguments
+        """
+        if procedure not in CHUNKED_PLOTS:
+            log.error(f"The out-of-core mode is available for the procedures: {list(CHUNKED_PLOTS)}")
+            raise ValueError("Voltammetry procedure not supported in the out-of-core mode")
+        if args.measured_current_units not in CURRENT_UNITS or args.measured_time_units not in TIME_UNITS:
+            log.error("Current or time unit not supported. Supported units are: "
+                      f"{list(CURRENT_UNITS)} and {list(TIME_UNITS)}")
+            raise ValueError("Unit not supported")
+        self.chunks = chunks
+        self.procedure = procedure
+        self.figure = None
+        self.faraday_constant = const.physical_constants["Faraday constant"][0] # Unit: C/mol
+        self.current_factor = CURRENT_UNITS[args.measured_current_units]
+        self.time_factor = TIME_UNITS[args.measured_time_units]
+
+        self.mass_of_active_material = float(args.mass_of_active_material) \
+                                       if args.mass_of_active_material is not None else None # Unit: g
+        self.electrode_area = float(args.electrode_area) if args.electrode_area is not None else 1 # Unit: cm^2
+        self.concentration_of_active_material = float(args.concentration_of_active_material) \
+                                                if args.concentration_of_active_material is not None else 1 # Unit: mol/cm^3
+        self.number_of_electrons = int(args.number_of_electrons)
+        self.applied_voltage = float(args.applied_voltage) \
+                               if getattr(args, "applied_voltage", None) is not None else None # Unit: V
+        self.applied_current = float(args.applied_current) \
+                               if getattr(args, "applied_current", None) is not None else None # Unit: A
+        self.data_format = args.data_format
+        self.dQdV_unit = "mAh/gV" if self.mass_of_active_material is not None else "mAh/cm^2V"
+
+        # running state carried over the chunk boundaries
+        self.n_points = 0
+        self.start_time = None # Unit: s
+        self.end_time = None # Unit: s
+        self.total_charge = 0 # Unit: C
+        self.statistics = {"current": _RunningStatistics(), "voltage": _RunningStatistics()}
+        self.d_coefficient = None # Unit: cm^2/s
+        # the last samples of the previous chunk, needed for the gradients at the chunk boundary
+        self._carry = np.empty((0, 4))
+        self._carry_written = 0
+        # every trace_stride-th sample of the trace is kept for the plots
+        self.trace = np.empty((0, 4))
+        self.trace_stride = 1
+
+    def analyze(self, save_dir:str = None, optional_name:str = None):
+        """Analyze the trace chunk by chunk. The time, voltage, current and cumulative charge
+        and for CP also dV/dt and dQ/dV are written out incrementally if a directory is given.
+
+        Args:
+            save_dir (str, optional): The directory where the derived columns should be saved. Defaults to None.
+            optional_name (str, optional): The optional name of the data. Defaults to None.
+        """
+        writer = None
+        if save_dir is not None:
+            save_dir = utils.create_dir(os.path.join(save_dir, "data"))
+            class_name = f"{self.__class__.__name__}_{self.procedure}"
+            data_name = utils.assemble_file_name(optional_name, class_name, f"data.{self.data_format}") \
+                        if optional_name else utils.assemble_file_name(class_name, f"data.{self.data_format}")
+            writer = utils.TableWriter(save_dir, data_name, self.data_format)
+
+        try:
+            for current, voltage, time in self.chunks:
+                samples = self._convert_chunk(current, voltage, time)
+                if len(samples):
+                    self._write_samples(self._process_samples(samples), writer)
+            self._write_samples(self._finish_samples(), writer)
+        finally:
+            if writer is not None:
+                writer.close()
+        log.info(f"Processed {self.n_points} samples in the out-of-core mode.")
+
+        if self.n_points == 0:
+            log.error("The trace does not contain any samples.")
+            raise ValueError("Empty trace")
+        if self.procedure == "CP":
+            self._calculate_diffusion_coefficient()
+
+    def _convert_chunk(self, current, voltage, time):
+        """Convert a chunk to A and s, integrate its cumulative charge and update the running statistics.
+
+        Args:
+            current (np.array): current of the chunk in the measured unit
+            voltage (np.array): voltage of the chunk in V
+            time (np.array): time of the chunk in the measured unit
+
+        Returns:
+            np.array: samples of the chunk with the columns time, voltage, current and cumulative charge
+        """
+        current = np.asarray(current, dtype=np.float64) * self.current_factor
+        voltage = np.asarray(voltage, dtype=np.float64)
+        time = np.asarray(time, dtype=np.float64) * self.time_factor
+        if len(time) == 0:
+            return np.empty((0, 4))
+
+        # the charge of an interval is its duration times the current at its end, as in _calculate_charge
+        previous_time = time[0] if self.end_time is None else self.end_time
+        interval_charges = np.diff(time, prepend=previous_time) * current
+        charge = self.total_charge + np.cumsum(interval_charges)
+
+        samples = np.column_stack((time, voltage, current, charge))
+        if self.start_time is None:
+            self.start_time = time[0]
+        self.end_time = time[-1]
+        self.total_charge = charge[-1]
+        self.statistics["current"].update(current)
+        self.statistics["voltage"].update(voltage)
+        self._update_trace(samples)
+        self.n_points += len(samples)
+        return samples
+
+    def _process_samples(self, samples):
+        """Get the rows of all samples whose neighbours are known. The last sample is held back
+        until the next chunk arrives, so that the gradients at the chunk boundaries are the same
+        as if the whole trace was in memory.
+
+        Args:
+            samples (np.array): samples of the chunk
+
+        Returns:
+            DataFrame: rows of the samples which can be written
+        """
+        if self.procedure == "CA":
+            return self._assemble_rows(samples)
+        samples = np.concatenate((self._carry, samples))
+        if len(samples) < 3:
+            self._carry = samples
+            return None
+        rows = self._assemble_rows(samples).iloc[self._carry_written:-1]
+        self._carry, self._carry_written = samples[-2:], 1
+        return rows
+
+    def _finish_samples(self):
+        """Get the rows of the samples held back at the end of the trace.
+
+        Returns:
+            DataFrame: rows of the remaining samples
+        """
+        if self.procedure == "CA" or len(self._carry) <= self._carry_written:
+            return None
+        rows = self._assemble_rows(self._carry).iloc[self._carry_written:]
+        self._carry, self._carry_written = np.empty((0, 4)), 0
+        return rows
+
+    def _assemble_rows(self, samples):
+        """Assemble the rows of the derived data of the given samples.
+
+        Args:
+            samples (np.array): consecutive samples of the trace
+
+        Returns:
+            DataFrame: time, voltage, current, cumulative charge and for CP dV/dt and dQ/dV
+        """
+        rows = pd.DataFrame({"Time [s]": samples[:, 0], "Voltage [V]": samples[:, 1],
+                             "Current [A]": samples[:, 2], "Cumulative Charge [C]": samples[:, 3]})
+        if self.procedure == "CP":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if len(samples) > 1:
+                    dVdt = np.gradient(samples[:, 1], samples[:, 0]) * 3600 # V/h
+                    # Convert the cumulative charge from As to mAh
+                    dQdV = np.gradient(samples[:, 3] * (1000/3600), samples[:, 1]) # mAh/V
+                else:
+                    dVdt, dQdV = np.full(1, np.nan), np.full(1, np.nan)
+            dQdV /= self.mass_of_active_material if self.mass_of_active_material is not None \
+                    else self.electrode_area
+            dQdV[~np.isfinite(dQdV)] = np.nan
+            rows["dVdt [V/h]"] = dVdt
+            rows[f"dQdV [{self.dQdV_unit}]"] = dQdV
+        return rows
+
+    def _write_samples(self, rows, writer):
+        """Write the rows of the derived data.
+
+        Args:
+            rows (DataFrame): rows of the derived data or None
+            writer (utils.TableWriter): writer of the derived data or None
+        """
+        if writer is not None and rows is not None and len(rows):
+            writer.write(rows)
+
+    def _update_trace(self, samples):
+        """Keep every trace_stride-th sample of the trace for the plots. If more than
+        MAX_TRACE_POINTS samples are kept, every other one is dropped and the stride is doubled.
+
+        Args:
+            samples (np.array): samples of the chunk
+        """
+        indices = np.arange(self.n_points, self.n_points + len(samples))
+        self.trace = np.concatenate((self.trace, samples[indices % self.trace_stride == 0]))
+        while len(self.trace) > MAX_TRACE_POINTS:
+            self.trace = self.trace[::2]
+            self.trace_stride *= 2
+
+    def _calculate_diffusion_coefficient(self):
+        """Calculate the diffusion coefficient value using Sand's formula without tau,
+        with the mean current if no applied current is given.
+        """
+        current = np.abs(self.applied_current) if self.applied_current is not None \
+                  else np.abs(self.statistics["current"].mean)
+        self.d_coefficient = (4 * current**2) / ((self.number_of_electrons * \
+                                                self.faraday_constant * \
+                                                self.electrode_area * \
+                                                self.concentration_of_active_material)**2 * np.pi)
+
+    def plot(self, save_dir, plots, optional_name: str = None):
+        """Plot the trace from the samples kept in memory.
+
+        Args:
+            save_dir (str): The directory where the plot should be saved
+            plots (list): The list of plots to be plotted
+            optional_name (str): The optional name of the plot.
+        """
+        unavailable = [plot_name for plot_name in plots if plot_name not in CHUNKED_PLOTS[self.procedure]]
+        if unavailable:
+            log.warning(f"The plots {unavailable} are not available in the out-of-core mode.")
+        plots = [plot_name for plot_name in plots if plot_name in CHUNKED_PLOTS[self.procedure]]
+        if not plots:
+            return
+
+        plot_dir = utils.create_dir(os.path.join(save_dir, "plots"))
+        plot = voltPlot(current=self.trace[:, 2], time=self.trace[:, 0],
+                        voltage=self.trace[:, 1],
+                        electrode_area=self.electrode_area,
+                        mass_of_active_material=self.mass_of_active_material,
+                        cumulative_charge=self.trace[:, 3],
+                        procedure_type=f"Voltammetry_{self.procedure}",
+                        applied_voltage=self.applied_voltage,
+                        applied_current=self.applied_current)
+        fig, available_axes = plot.compose_volt_subplot(plots=plots)
+        for sub_ax, plot_name in zip(available_axes, plots):
+            if plot_name == "CA":
+                plot.CA(subplot_ax=sub_ax)
+            elif plot_name == "CC":
+                plot.CC(subplot_ax=sub_ax)
+            elif plot_name in ("CP", "Voltage"):
+                plot.CP(subplot_ax=sub_ax)
+            elif plot_name == "Voltage_Profile":
+                plot.voltage_profile(subplot_ax=sub_ax)
+
+        fig.tight_layout()
+        self.figure = fig
+        class_name = f"{self.__class__.__name__}_{self.procedure}"
+        name = utils.assemble_file_name(optional_name, class_name) if optional_name \
+               else utils.assemble_file_name(class_name)
+        plot.save_plot(fig, plot_dir, name)
+
+    def save_data(self, save_dir:str, optional_name:str = None):
+        """Save the settings and the summary of the trace. The derived columns are already
+        written by analyze.
+
+        Args:
+            save_dir (str): The directory where the data should be saved
+            optional_name (str): The optional name of the data.
+        """
+        log.info("Saving data...")
+        save_dir = utils.create_dir(os.path.join(save_dir, "data"))
+        class_name = f"{self.__class__.__name__}_{self.procedure}"
+        name = utils.assemble_file_name(optional_name, class_name, "params.json") if optional_name \
+               else utils.assemble_file_name(class_name, "params.json")
+        added_data = {
+            "Number of samples": self.n_points,
+            "Duration [s]": self.end_time - self.start_time,
+            "Total charge [C]": self.total_charge,
+            "Current statistics [A]": self.statistics["current"].summary(),
+            "Voltage statistics [V]": self.statistics["voltage"].summary(),
+            "Electrode area [cm^2]": self.electrode_area,
+            "Mass of active material [g]": self.mass_of_active_material,
+            "Concentration of active material [mol/cm^3]": self.concentration_of_active_material,
+        }
+        if self.procedure == "CA":
+            added_data["Applied voltage [V]"] = self.applied_voltage
+        else:
+            added_data["Applied Current [A]"] = self.applied_current
+            added_data["Diffusion Coefficient [cm^2/s]"] = f"{self.d_coefficient} * Tau"
+        utils.save_data_as_json(save_dir, utils.convert_numpy_to_python(added_data), name)
+
+    def perform_all_actions(self, save_dir:str, plots:list, optional_name:str = None):
+        """Perform all the actions of the out-of-core mode: analyze (and save the derived columns),
+        plot and save the summary.
+
+        Args:
+            save_dir (str): The directory where the data should be saved
+            plots (list): The list of plots to be plotted
+            optional_name (str): The optional name of the data.
+        """
+        self.analyze(save_dir, optional_name=optional_name)
+        self.plot(save_dir, plots, optional_name=optional_name)
+        self.save_data(save_dir=save_dir, optional_name=optional_name)
+
+    @property
+    def figure(self):
+        """Get the figure of the plot.
+
+        Returns:
+            obj: Figure object for the plot.
+        """
+        return self._figure
+
+    @figure.setter
+    def figure(self, figure):
+        """Set the figure of the plot.
+
+        Args:
+            figure (obj): Figure object for the plot.
+        """
+        self._figure = figure
+
+
+class _RunningStatistics:
+    """Count, mean, standard deviation, minimum and maximum of a column, updated chunk by chunk."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._sum_of_squares = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def update(self, values):
+        """Merge the statistics of a chunk (Chan et al. parallel algorithm).
+
+        Args:
+            values (np.array): values of the chunk
+        """
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        count, mean = len(values), values.mean()
+        delta = mean - self.mean
+        total = self.count + count
+        self._sum_of_squares += ((values - mean)**2).sum() + delta**2 * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+
+    def summary(self):
+        """Get the statistics.
+
+        Returns:
+            dict: mean, standard deviation, minimum and maximum
+        """
+        return {"mean": self.mean,
+                "std": np.sqrt(self._sum_of_squares / self.count) if self.count else np.nan,
+                "min": self.minimum, "max": self.maximum}
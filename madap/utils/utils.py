@@ -5,12 +5,16 @@ import os
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import parquet
 
 from madap.logger import logger
 
 
 
 log = logger.get_logger("utils")
+# formats in which the data tables of the procedures can be saved
+DATA_FORMATS = ["csv", "parquet", "feather"]
 
 
 def create_dir(directory):
@@ -64,6 +68,122 @@ def save_data_as_csv(directory, data, name):
     data.to_csv(os.path.join(directory, name))
 
 
+def save_data_as_parquet(directory, data, name):
+    """Save the given data as parquet
+
+    Args:
+        directory (str): The directory where the data should be saved
+        data (Pandas DataFrame): The data that should be saved
+        name (str): The name of the file
+    """
+    log.info(f"Saving data in {directory}.parquet")
+    split_complex_columns(data).to_parquet(os.path.join(directory, name), index=False)
+
+
+def save_data_as_feather(directory, data, name):
+    """Save the given data as feather (Arrow IPC)
+
+    Args:
+        directory (str): The directory where the data should be saved
+        data (Pandas DataFrame): The data that should be saved
+        name (str): The name of the file
+    """
+    log.info(f"Saving data in {directory}.feather")
+    split_complex_columns(data).to_feather(os.path.join(directory, name))
+
+
+def save_data_table(directory, data, name, data_format:str = "csv"):
+    """Save the given data table in the given format
+
+    Args:
+        directory (str): The directory where the data should be saved
+        data (Pandas DataFrame): The data that should be saved
+        name (str): The name of the file
+        data_format (str, optional): One of DATA_FORMATS. Defaults to "csv".
+    """
+    if data_format == "csv":
+        save_data_as_csv(directory, data, name)
+    elif data_format == "parquet":
+        save_data_as_parquet(directory, data, name)
+    elif data_format == "feather":
+        save_data_as_feather(directory, data, name)
+    else:
+        log.error(f"Data format not supported. Supported formats are: {DATA_FORMATS}")
+        raise ValueError("Data format not supported")
+
+
+class TableWriter:
+    """Write a data table chunk by chunk, so that the whole table never has to be held in memory."""
+
+    def __init__(self, directory, name, data_format:str = "csv"):
+        """Initialize the writer, the file is created with the first chunk.
+
+        Args:
+            directory (str): The directory where the data should be saved
+            name (str): The name of the file
+            data_format (str, optional): One of DATA_FORMATS. Defaults to "csv".
+        """
+        if data_format not in DATA_FORMATS:
+            log.error(f"Data format not supported. Supported formats are: {DATA_FORMATS}")
+            raise ValueError("Data format not supported")
+        self.path = os.path.join(directory, name)
+        self.data_format = data_format
+        self.n_rows = 0
+        self._writer = None
+        log.info(f"Saving data in chunks in {self.path}")
+
+    def write(self, data):
+        """Append a chunk of rows to the table.
+
+        Args:
+            data (Pandas DataFrame): The chunk that should be appended
+        """
+        if self.data_format == "csv":
+            data.to_csv(self.path, mode="w" if self.n_rows == 0 else "a", header=self.n_rows == 0, index=False)
+        else:
+            table = pa.Table.from_pandas(split_complex_columns(data), preserve_index=False)
+            if self._writer is None:
+                self._writer = parquet.ParquetWriter(self.path, table.schema) if self.data_format == "parquet" \
+                               else pa.ipc.new_file(self.path, table.schema)
+            self._writer.write_table(table)
+        self.n_rows += len(data)
+
+    def close(self):
+        """Finish the table."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def split_complex_columns(data):
+    """Split the complex columns of the data into a real and an imaginary column,
+    since columnar formats only store real numbers.
+
+    Args:
+        data (Pandas DataFrame): The data that should be converted
+
+    Returns:
+        Pandas DataFrame: The data with real valued columns
+    """
+    columns = {}
+    for name, values in data.infer_objects().items():
+        values = values.to_numpy()
+        if not np.iscomplexobj(values):
+            columns[str(name)] = values
+        elif np.any(np.nan_to_num(values.imag)):
+            columns[f"{name} (real)"] = values.real
+            columns[f"{name} (imag)"] = values.imag
+        else:
+            columns[str(name)] = values.real
+    return pd.DataFrame(columns)
+
+
 def save_data_as_json(directory, data, name):
     """Save the given data as json
 
@@ -4,13 +4,16 @@ import os
 import re
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from madap.data_acquisition import data_acquisition as da
+from madap.data_acquisition import data_cache
+from madap.data_acquisition import instrument_readers as ir
 from madap.echem.arrhenius import arrhenius
-from madap.echem.e_impedance import e_impedance
+from madap.echem.e_impedance import e_impedance, e_impedance_batch, e_impedance_drt, e_impedance_harmonics
 from madap.echem.voltammetry import (voltammetry_CA, voltammetry_CP,
-                                     voltammetry_CV)
+                                     voltammetry_CV, voltammetry_chunked)
 from madap.logger import logger
 from madap.utils import utils
 
@@ -29,7 +32,7 @@ def _analyze_parser_args():
                           help="Procedure of the analysis")
     proc = first_parser.parse_known_args()[0]
     if proc.procedure == "impedance":
-        procedure.add_argument("-ip", "--impedance_procedure", type=str, required=True, choices=['EIS', 'Mottschotcky', 'Lissajous'],
+        procedure.add_argument("-ip", "--impedance_procedure", type=str, required=True, choices=['EIS', 'DRT', 'Mottschotcky', 'Lissajous'],
                             help="Which of the impedance procedures you want to use?")
         proc = first_parser.parse_known_args()[0]
         if proc.impedance_procedure == "EIS":
@@ -49,13 +52,72 @@ def _analyze_parser_args():
                             help="initial values for the suggested circuit. \
                                 \n format: element1, element2, ... \
                                 \n it will be used just if the suggested_circuit is available.")
+            eis.add_argument("-nw", "--n_workers", type=int, required=False, default=1,
+                            help="number of processes fitting the suggested circuits, the perturbed starts \
+                                or the spectra of a batch in parallel. Default is 1 (no worker processes).")
+            eis.add_argument("-fb", "--fit_budget", type=int, required=False, default=None,
+                            help="total number of function evaluations for a successive halving search \
+                                over the suggested circuits if no suggested circuit is given. \
+                                \n by default every suggested circuit is fitted to convergence.")
+            eis.add_argument("-cls", "--classify_spectrum", action="store_true",
+                            help="fit only the suggested circuits matching the shape of the spectrum \
+                                (number of arcs, diffusion tail, inductive loop and high frequency intercept)")
+            eis.add_argument("-rs", "--refine_seed", type=int, required=False, default=0,
+                            help="seed of the perturbed starts which are fitted in parallel if the suggested circuit \
+                                does not reach the threshold error. \n the same seed gives the same result")
+            eis.add_argument("-gl", "--guess_library", type=Path, required=False, default=None,
+                            help="directory of the initial guess library of the suggested circuits if no suggested circuit \
+                                is given. \n it is built offline with python -m madap.echem.e_impedance.e_impedance_library")
+            eis.add_argument("-sid", "--spectrum_id", type=str, required=False, default=None,
+                            help="column identifying the spectrum of each row (e.g. voltage, state of charge or time) \
+                                of a file with many spectra one below the other. \
+                                \n all spectra are fitted in batch and summarized in one table, only with the header list")
+            eis.add_argument("-stk", "--stacked_fit", action="store_true",
+                            help="fit the suggested circuit to all spectra of the batch as one stacked least squares \
+                                problem. \n needs the suggested circuit and its initial values")
+
+        elif proc.impedance_procedure == "DRT":
+            drt = first_parser.add_argument_group("Options for the DRT procedure")
+            drt.add_argument("-pl", "--plots", required=True, choices=["nyquist", "nyquist_fit", "residual", "bode", "drt"],
+                            nargs="+", help="plots to be generated")
+            drt.add_argument("-v", "--voltage", type=float, required=False, default=None,
+                            help="applied voltage [V] if applicable")
+            drt.add_argument("-lam", "--regularization", type=float, required=False, default=None,
+                            help="regularization strength of the distribution of relaxation times. \
+                                \n by default it is chosen from a sweep of strengths by generalized cross validation")
+            drt.add_argument("-ppd", "--points_per_decade", type=int, required=False,
+                            default=e_impedance_drt.DRT_POINTS_PER_DECADE, help="time constants per decade")
 
         elif proc.impedance_procedure == "Mottschotcky":
-            # TODO
-            pass
+            mott = first_parser.add_argument_group("Options for the Mottschotcky procedure")
+            mott.add_argument("-pl", "--plots", required=True, choices=["nyquist", "mott_schottky", "mott_schottky_fit"],
+                            nargs="+", help="plots to be generated")
+            mott.add_argument("-vc", "--potential_column", type=str, required=True,
+                            help="column with the applied potential [V] of every row. \
+                                \n the spectra of all potentials are one below the other, only with the header list")
+            mott.add_argument("-af", "--analysis_frequency", type=float, required=False,
+                            default=e_impedance.MOTT_SCHOTTKY_FREQUENCY,
+                            help="frequency [Hz] at which the space charge capacitance is evaluated")
+            mott.add_argument("-ea", "--electrode_area", type=float, required=False, default=1.0,
+                            help="electrode area [cm\u00b2]")
+            mott.add_argument("-dc", "--dielectric_constant", type=float, required=False, default=None,
+                            help="relative permittivity of the semiconductor, needed for the doping density")
+            mott.add_argument("-temp", "--temperature", type=float, required=False, default=298.15,
+                            help="temperature [K]")
+            mott.add_argument("-fr", "--fit_range", type=float, nargs=2, required=False, default=None,
+                            help="lower and upper potential [V] of the linear Mott-Schottky region")
         elif proc.impedance_procedure == "Lissajous":
-            # TODO
-            pass
+            liss = first_parser.add_argument_group("Options for the Lissajous procedure")
+            liss.add_argument("-pl", "--plots", required=True, choices=["nyquist", "bode", "lissajous", "harmonic_distortion"],
+                            nargs="+", help="plots to be generated")
+            liss.add_argument("-nh", "--n_harmonics", type=int, required=False, default=e_impedance_harmonics.N_HARMONICS,
+                            help="highest harmonic which is extracted")
+            liss.add_argument("-ppw", "--periods_per_window", type=int, required=False,
+                            default=e_impedance_harmonics.PERIODS_PER_WINDOW,
+                            help="least periods of the excitation per DFT window")
+            liss.add_argument("-ch", "--chunk_size", type=int, required=False, default=da.CHUNK_SIZE,
+                            help="number of rows of the recording which are read at once. \
+                                \n the header list gives the excitation frequency, time, voltage and current columns")
 
     elif proc.procedure == "arrhenius":
         arrhenius_pars = first_parser.add_argument_group("Options for the Arrhenius procedure")
@@ -78,6 +140,9 @@ def _analyze_parser_args():
                             default=None, help="Mass of the active material [g]")
         voltammetry_pars.add_argument("-ea", "--electrode_area", type=float, required=False,
                             default=None, help="Electrode area [cm^2]")
+        voltammetry_pars.add_argument("-ch", "--chunk_size", type=int, required=False, default=None,
+                            help="Analyze CA and CP data out-of-core in chunks of this number of rows. \
+                            \n the derived data is written chunk by chunk and only the trace plots are available")
         proc = first_parser.parse_known_args()[0]
         if proc.voltammetry_procedure == "CV":
             cv = first_parser.add_argument_group("Options for the CV procedure")
@@ -114,6 +179,11 @@ def _analyze_parser_args():
                       default=0.99, help="Upper quantile for detecting the outliers in data")
     data.add_argument("-l", "--lower_limit_quantile", type=float, required=False,
                       default=0.01, help="Lower quantile for detecting the outliers in data")
+    data.add_argument("-cd", "--cache_dir", type=Path, required=False, default=None,
+                      help="Directory for caching the parsed data files and the EIS fits. \
+                      \n a repeated run on the same file loads the cached data and fits instead of parsing and fitting again")
+    data.add_argument("-cs", "--cache_size", type=float, required=False, default=data_cache.CACHE_SIZE,
+                      help="Maximum size of the cache [MB], the least recently used files are removed")
     data_selection = data.add_mutually_exclusive_group()
     data_selection.add_argument("-sp", "--specific", type=str, nargs="+",
                             help="row and column number of the frequency, real impedance, \
@@ -133,57 +203,148 @@ def _analyze_parser_args():
     # Options for results
     parser.add_argument("-r", "--results", type=Path, required=True,
                         help="Directory for saving results")
+    parser.add_argument("-df", "--data_format", type=str, required=False, default="csv",
+                        choices=utils.DATA_FORMATS, help="Format of the saved data tables")
 
     return parser
 
 
-def call_impedance(data, result_dir, args):
+def _get_header_names(args):
+    """Private function to get the header names from the parsed arguments
+
+    Args:
+        args (parser.args): Parsed arguments
+
+    Returns:
+        list: The header names given by the user
+    """
+    # Check if args header is a list
+    if isinstance(args.header_list, list):
+        return args.header_list[0].split(", ") if len(args.header_list) == 1 else args.header_list
+    return args.header_list
+
+
+def _get_specific_selection(args):
+    """Private function to get the specific row and column selections from the parsed arguments
+
+    Args:
+        args (parser.args): Parsed arguments
+
+    Returns:
+        list: The selections in format start_row,end_row,start_column,end_column
+    """
+    try:
+        if len(args.specific) > 1:
+            return args.specific
+        return re.split('; |;', args.specific[0])
+
+    except ValueError as e:
+        log.error("The format of the specific data is not correct. Please check the help.")
+        raise e
+
+
+def _data_projection(args):
+    """Private function to get the columns and rows of the data file that are used in the analysis,
+    so that the rest of the file is never parsed.
+
+    Args:
+        args (parser.args): Parsed arguments
+
+    Returns:
+        tuple: columns, rows and the specific selections relative to the projected data
+    """
+    if args.header_list:
+        columns = [name for name in _get_header_names(args) if name != "n"]
+        # the column identifying the spectrum of every row is needed too
+        spectrum_id = getattr(args, "spectrum_id", None) or getattr(args, "potential_column", None)
+        return columns + [spectrum_id] if spectrum_id and spectrum_id not in columns else columns, None, None
+    if args.specific:
+        try:
+            return da.project_selection(_get_specific_selection(args))
+        except (ValueError, KeyError, IndexError) as e:
+            log.warning(f"The specific selection could not be used for loading only a part of the data: {e}")
+    return None, None, None
+
+
+def _acquire_instrument_data(args):
+    """Private function to read a native potentiostat file. Its columns are available
+    under their instrument names and under the roles used by MADAP (see instrument_readers).
+    If neither header list nor specific selection is given, the roles are used as header list.
+
+    Args:
+        args (parser.args): Parsed arguments
+
+    Returns:
+        dict or DataFrame: The columns of the file, a dict of arrays for voltammetry
+    """
+    columns = ir.read_instrument_file(args.file)
+    data = {**columns, **ir.map_column_roles(columns)}
+    log.info(f"the columns of your data are: \n {list(data)}")
+
+    if not args.header_list and not args.specific:
+        args.header_list = [role for role in ir.ROLE_HEADERS.get(args.procedure.lower(), []) if role in data]
+        if not args.header_list:
+            log.error("The columns for this procedure could not be found in the file. Please give the header list.")
+            raise ValueError("No header list given for the instrument file.")
+        log.info(f"Using the columns {args.header_list} of the instrument file.")
+
+    if args.procedure in ["voltammetry", "Voltammetry"]:
+        # the role columns are already converted to A and s
+        header_names = _get_header_names(args) or []
+        if "current" in header_names:
+            args.measured_current_units = "A"
+        if "time" in header_names:
+            args.measured_time_units = "s"
+        return data
+    return pd.DataFrame(data)
+
+
+def call_impedance(data, result_dir, args, selection:list = None):
     """calling the impedance procedure and parse the corresponding arguments
 
     Args:
         data (class): the given data frame for analysiswrite
         result_dir (str): the directory for saving results
         args (parser.args): Parsed arguments
+        selection (list, optional): specific selections relative to the given data frame.
+            Defaults to None, in which case args.specific is used.
     """
 
+    if args.impedance_procedure == "EIS" and args.spectrum_id:
+        return call_batch_impedance(data, result_dir, args)
+    if args.impedance_procedure == "Mottschotcky" and not args.header_list:
+        log.error("The Mottschotcky procedure needs the header list for selecting the potential column.")
+        raise ValueError("The Mottschotcky procedure needs the header list.")
+
     if args.header_list:
-        # Check if args header is a list
-        if isinstance(args.header_list, list):
-            header_names = args.header_list[0].split(", ") if len(args.header_list) == 1 else \
-            args.header_list
+        header_names = _get_header_names(args)
+
+        # remove the rows with outliers or nan values, of every potential on its own for a potential series
+        if args.impedance_procedure == "Mottschotcky":
+            data, _ = da.remove_outliers_per_group(df = data,
+                                                   group_column = args.potential_column,
+                                                   columns = [header_names[1], header_names[2]],
+                                                   low_quantile = args.lower_limit_quantile,
+                                                   high_quantile = args.upper_limit_quantile)
         else:
-            header_names = args.header_list
-
+            data, _ = da.remove_outliers(df = data,
+                                         columns = [header_names[1], header_names[2]],
+                                         low_quantile = args.lower_limit_quantile,
+                                         high_quantile = args.upper_limit_quantile)
         phase_shift_data = None if len(header_names) == 3 else data[header_names[3]]
-
-        _, nan_indices = da.remove_outlier_specifying_quantile(df = data,
-                                                           columns = [header_names[1],
-                                                                       header_names[2]],
-                                                           low_quantile = args.lower_limit_quantile,
-                                                           high_quantile = args.upper_limit_quantile)
-        # remove nan rows
-        data = da.remove_nan_rows(data, nan_indices)
+        potential_data = data[args.potential_column] if args.impedance_procedure == "Mottschotcky" else None
         # extracting the data
         freq_data, real_data, imag_data = data[header_names[0]],\
                                           data[header_names[1]],\
                                           data[header_names[2]]
 
     if args.specific:
-
-        try:
-            if len(args.specific) >= 3:
-                row_col = args.specific
-            else:
-                row_col = re.split('; |;', args.specific[0])
-
-        except ValueError as e:
-            log.error("The format of the specific data is not correct. Please check the help.")
-            raise e
+        row_col = selection if selection else _get_specific_selection(args)
 
         selected_data = data.iloc[int(row_col[0].split(',')[0]): int(row_col[0].split(',')[1]), :]
 
 
-        phase_shift_data = None if len(row_col) == 3 else da.select_data(data, row_col[3])
+        phase_shift_data = None if len(row_col) == 3 else da.select_data(selected_data, row_col[3])
 
 
         freq_data, real_data, imag_data = da.select_data(selected_data, row_col[0]), \
@@ -192,13 +353,13 @@ def call_impedance(data, result_dir, args):
 
         unprocessed_data = pd.DataFrame({"freq": freq_data, "real": real_data, "imag": imag_data})
 
-        _, nan_indices = da.remove_outlier_specifying_quantile(df = unprocessed_data,
-                                            columns = ["real", "imag"],
-                                            low_quantile = args.lower_limit_quantile,
-                                            high_quantile = args.upper_limit_quantile)
-
-        data = da.remove_nan_rows(unprocessed_data, nan_indices)
+        data, kept_mask = da.remove_outliers(df = unprocessed_data,
+                                             columns = ["real", "imag"],
+                                             low_quantile = args.lower_limit_quantile,
+                                             high_quantile = args.upper_limit_quantile)
         freq_data, real_data, imag_data = data["freq"], data["real"], data["imag"]
+        if phase_shift_data is not None:
+            phase_shift_data = np.asarray(phase_shift_data)[kept_mask]
 
     impedance = e_impedance.EImpedance(da.format_data(freq_data), da.format_data(real_data),
                                 da.format_data(imag_data), da.format_data(phase_shift_data))
@@ -213,16 +374,33 @@ def call_impedance(data, result_dir, args):
                                     suggested_circuit=args.suggested_circuit,
                                     initial_value=eval(args.initial_values)
                                     if args.initial_values else None,
-                                    cell_constant=args.cell_constant)
+                                    cell_constant=args.cell_constant,
+                                    data_format=args.data_format,
+                                    n_workers=args.n_workers,
+                                    cache_dir=args.cache_dir,
+                                    cache_size=args.cache_size,
+                                    fit_budget=args.fit_budget,
+                                    classify_spectrum=args.classify_spectrum,
+                                    refine_seed=args.refine_seed,
+                                    guess_library=args.guess_library)
+
+    elif args.impedance_procedure == "DRT":
+        log.info(f"The given voltage is {args.voltage} [V] and the regularization strength is {args.regularization}.")
+        procedure = e_impedance.DRT(impedance, voltage=args.voltage,
+                                    regularization=args.regularization,
+                                    points_per_decade=args.points_per_decade,
+                                    data_format=args.data_format)
 
     elif args.impedance_procedure == "Mottschotcky":
-        #TODO
-        # # Instantiate the procedure
-        pass
-    elif args.impedance_procedure == "Lissajous":
-        #TODO
-        # # Instantiate the procedure
-        pass
+        log.info(f"The analysis frequency is {args.analysis_frequency} [Hz], the electrode area is {args.electrode_area} [cm\u00b2] \
+                   and the dielectric constant is {args.dielectric_constant}.")
+        procedure = e_impedance.Mottschotcky(impedance, potential=da.format_data(potential_data),
+                                             analysis_frequency=args.analysis_frequency,
+                                             electrode_area=args.electrode_area,
+                                             dielectric_constant=args.dielectric_constant,
+                                             temperature=args.temperature,
+                                             fit_range=args.fit_range,
+                                             data_format=args.data_format)
 
     # Format plots arguments
     plots = da.format_list(args.plots)
@@ -232,35 +410,64 @@ def call_impedance(data, result_dir, args):
 
     return procedure
 
-def call_arrhenius(data, result_dir, args):
+def call_batch_impedance(data, result_dir, args):
+    """Calling the EIS procedure for every spectrum of a file with many spectra
+    and saving one summary table of the fits.
+
+    Args:
+        data (class): the given data frame with the spectra one below the other
+        result_dir (str): the directory for saving results
+        args (parser.args): Parsed arguments
+
+    Returns:
+        Pandas DataFrame: the summary of the fits
+    """
+    if not args.header_list:
+        log.error("The batch EIS needs the header list for selecting the columns of the spectra.")
+        raise ValueError("The batch EIS needs the header list.")
+    header_names = [name for name in _get_header_names(args) if name != "n"]
+    spectra = e_impedance_batch.split_spectra(data, args.spectrum_id, header_names,
+                                              low_quantile=args.lower_limit_quantile,
+                                              high_quantile=args.upper_limit_quantile)
+    log.info("The plots of the single spectra are not generated in the batch mode.")
+    if args.stacked_fit and not (args.suggested_circuit and args.initial_values):
+        log.error("The stacked fit needs the suggested circuit and its initial values.")
+        raise ValueError("The stacked fit needs the suggested circuit and its initial values.")
+    summary = e_impedance_batch.analyze_batch(spectra, n_workers=args.n_workers, spectrum_id=args.spectrum_id,
+                                              stacked=args.stacked_fit,
+                                              voltage=args.voltage,
+                                              suggested_circuit=args.suggested_circuit,
+                                              initial_value=eval(args.initial_values)
+                                              if args.initial_values else None,
+                                              cell_constant=args.cell_constant,
+                                              data_format=args.data_format,
+                                              cache_dir=args.cache_dir,
+                                              cache_size=args.cache_size,
+                                              fit_budget=args.fit_budget,
+                                              classify_spectrum=args.classify_spectrum,
+                                              refine_seed=args.refine_seed,
+                                    guess_library=args.guess_library)
+    e_impedance_batch.save_batch_summary(summary, result_dir, args.data_format)
+    return summary
+
+def call_arrhenius(data, result_dir, args, selection:list = None):
     """Calling the arrhenius procedure and parse the corresponding arguments
 
     Args:
         data (class): the given data frame for analysis
         result_dir (str): the directory for saving results
         args (parser.args): Parsed arguments
+        selection (list, optional): specific selections relative to the given data frame.
+            Defaults to None, in which case args.specific is used.
     """
 
 
     if args.header_list:
-        if isinstance(args.header_list, list):
-            header_names = args.header_list[0].split(", ") if len(args.header_list) == 1 else \
-            args.header_list
-        else:
-            header_names = args.header_list
+        header_names = _get_header_names(args)
 
         temp_data, cond_data = data[header_names[0]], data[header_names[1]]
     if args.specific:
-
-        try:
-            if len(args.specific) == 2:
-                row_col = args.specific
-            else:
-                row_col = re.split('; |;', args.specific[0])
-
-        except ValueError as e:
-            log.error("The format of the specific data is not correct. Please check the help.")
-            raise e
+        row_col = selection if selection else _get_specific_selection(args)
 
         selected_data = data.iloc[int(row_col[0].split(',')[0]): int(row_col[0].split(',')[1]), :]
 
@@ -271,7 +478,8 @@ def call_arrhenius(data, result_dir, args):
         if (not isinstance(temp_data, pd.Series)) and (not isinstance(cond_data, pd.Series)):
             temp_data, cond_data = pd.Series(temp_data).astype(float), pd.Series(cond_data).astype(float)
     # Instantiate the procedure
-    arrhenius_cls = arrhenius.Arrhenius(da.format_data(temp_data), da.format_data(cond_data))
+    arrhenius_cls = arrhenius.Arrhenius(da.format_data(temp_data), da.format_data(cond_data),
+                                        data_format=args.data_format)
 
     # Format the plots arguments
     plots = da.format_list(args.plots)
@@ -290,14 +498,8 @@ def call_voltammetry(data, result_dir, args):
         plots (list): list of plots to be generated
     """
     if args.header_list:
-        # Check if args header is a list
-        if isinstance(args.header_list, list):
-            header_names = args.header_list[0].split(", ") if len(args.header_list) == 1 else \
-            args.header_list
-        else:
-            header_names = args.header_list
+        header_names = _get_header_names(args)
 
-        
         if len(header_names) == 2:
             current_data, voltage_data = data[header_names[0]], data[header_names[1]]
             time_data = None
@@ -376,6 +578,50 @@ def call_voltammetry(data, result_dir, args):
     return voltammetry_cls
 
 
+def call_chunked_voltammetry(result_dir, args):
+    """Calling the out-of-core mode of the CA and CP procedures, the data file is read in chunks.
+
+    Args:
+        result_dir (str): the directory for saving results
+        args (parser.args): Parsed arguments
+    """
+    header_names = _get_header_names(args)
+    if not header_names or len(header_names) < 3:
+        log.error("The out-of-core mode needs the header list of the current, voltage and time.")
+        raise ValueError("No header list of current, voltage and time given for the out-of-core mode.")
+    current_name, voltage_name, time_name = header_names[:3]
+    chunks = da.acquire_data_chunks(args.file, columns=[current_name, voltage_name, time_name],
+                                    chunk_size=args.chunk_size)
+    voltammetry_cls = voltammetry_chunked.Voltammetry_Chunked(
+        ((chunk[current_name], chunk[voltage_name], chunk[time_name]) for chunk in chunks),
+        procedure=args.voltammetry_procedure, args=args)
+    voltammetry_cls.perform_all_actions(result_dir, plots=da.format_list(args.plots))
+    return voltammetry_cls
+
+
+def call_lissajous(result_dir, args):
+    """Calling the Lissajous procedure, the time domain recording is read in chunks.
+
+    Args:
+        result_dir (str): the directory for saving results
+        args (parser.args): Parsed arguments
+    """
+    header_names = _get_header_names(args)
+    if not header_names or len(header_names) < 4:
+        log.error("The Lissajous procedure needs the header list of the excitation frequency, time, voltage and current.")
+        raise ValueError("No header list of excitation frequency, time, voltage and current given.")
+    frequency_name, time_name, voltage_name, current_name = header_names[:4]
+    chunks = da.acquire_data_chunks(args.file, columns=[frequency_name, time_name, voltage_name, current_name],
+                                    chunk_size=args.chunk_size or da.CHUNK_SIZE)
+    procedure = e_impedance.Lissajous(((chunk[frequency_name], chunk[time_name], chunk[voltage_name], chunk[current_name])
+                                       for chunk in chunks),
+                                      n_harmonics=args.n_harmonics,
+                                      periods_per_window=args.periods_per_window,
+                                      data_format=args.data_format)
+    procedure.perform_all_actions(result_dir, plots=da.format_list(args.plots))
+    return procedure
+
+
 def start_procedure(args):
     """Function to prepare the data for analysis.
     It also prepares folder for results and plots.
@@ -384,16 +630,46 @@ def start_procedure(args):
         args (object): Object containing arguments from parser or gui.
     """
 
-    data = da.acquire_data(args.file)
-    da.remove_unnamed_col(data)
-    log.info(f"the header of your data is: \n {data.head()}")
+    _, extension = os.path.splitext(args.file)
+    if args.procedure in ["voltammetry", "Voltammetry"] and args.chunk_size:
+        if args.voltammetry_procedure in ["CA", "CP"]:
+            # the data file is read in chunks by the procedure itself
+            result_dir = utils.create_dir(os.path.join(args.results, args.procedure))
+            procedure = call_chunked_voltammetry(result_dir, args)
+            log.info("==================================DONE==================================")
+            return procedure
+        log.warning("The out-of-core mode is only available for CA and CP, the data is loaded into memory.")
+    if args.procedure in ["impedance", "Impedance"] and args.impedance_procedure == "Lissajous":
+        # the recording is streamed by the procedure itself
+        result_dir = utils.create_dir(os.path.join(args.results, args.procedure))
+        procedure = call_lissajous(result_dir, args)
+        log.info("==================================DONE==================================")
+        return procedure
+
+    if extension.lower() in ir.INSTRUMENT_EXTENSIONS:
+        # native potentiostat files are read directly into numpy columns
+        data, selection = _acquire_instrument_data(args), None
+    else:
+        columns, rows, selection = _data_projection(args)
+        if args.procedure in ["voltammetry", "Voltammetry"] and extension in da.ARRAY_EXTENSIONS:
+            # raw arrays are memory-mapped and handed to the procedure without a dataframe
+            data = da.acquire_arrays(args.file, names=columns)
+            log.info(f"the columns of your data are: \n {list(data)}")
+        elif args.cache_dir:
+            data = data_cache.acquire_data_cached(args.file, args.cache_dir, args.cache_size,
+                                                  columns=columns, rows=rows)
+            log.info(f"the header of your data is: \n {data.head()}")
+        else:
+            data = da.acquire_data(args.file, columns=columns, rows=rows)
+            da.remove_unnamed_col(data)
+            log.info(f"the header of your data is: \n {data.head()}")
     result_dir = utils.create_dir(os.path.join(args.results, args.procedure))
 
     if args.procedure in ["impedance", "Impedance"]:
-        procedure = call_impedance(data, result_dir, args)
+        procedure = call_impedance(data, result_dir, args, selection=selection)
 
     elif args.procedure in ["arrhenius", "Arrhenius"]:
-        procedure = call_arrhenius(data, result_dir, args)
+        procedure = call_arrhenius(data, result_dir, args, selection=selection)
 
     elif args.procedure in ["voltammetry", "Voltammetry"]:
         procedure = call_voltammetry(data, result_dir, args)
@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasAgg
 
 from madap.logger.logger import log_queue
+from madap.echem.e_impedance import e_impedance, e_impedance_harmonics
 from madap.utils import gui_elements
 from madap_cli import start_procedure
 class MadapGui:
@@ -49,6 +50,23 @@ class MadapGui:
         self.penalty_value = None
         self.temperature = None
         self.applied_scan_rate = None
+        self.data_format = "csv"
+        self.cache_dir = None
+        self.cache_size = None
+        self.chunk_size = None
+        self.n_workers = 1
+        self.fit_budget = None
+        self.classify_spectrum = False
+        self.spectrum_id = None
+        self.stacked_fit = False
+        self.refine_seed = 0
+        self.guess_library = None
+        self.potential_column = None
+        self.analysis_frequency = e_impedance.MOTT_SCHOTTKY_FREQUENCY
+        self.dielectric_constant = None
+        self.fit_range = None
+        self.n_harmonics = e_impedance_harmonics.N_HARMONICS
+        self.periods_per_window = e_impedance_harmonics.PERIODS_PER_WINDOW
 
     # pylint: disable=inconsistent-return-statements
     # pylint: disable=too-many-return-statements
@@ -14,6 +14,7 @@ requirements = ["attrs==21.4.0",
         "matplotlib",
         "numpy",
         "pandas",
+        "pyarrow",
         "PySimpleGUI",
         "pytest",
         "scikit_learn",
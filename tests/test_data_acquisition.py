@@ -0,0 +1,56 @@
+"""Tests for the data acquisition helpers."""
+import numpy as np
+import pandas as pd
+
+from madap.data_acquisition import data_acquisition as da
+from madap.echem.e_impedance import e_impedance as ei
+
+
+POTENTIALS = np.linspace(0.0, 0.8, 9)
+FREQUENCY = np.logspace(4, 2, 9)
+ANALYSIS_FREQUENCY = 1e3
+FLAT_BAND_POTENTIAL = -0.5
+DOPING_DENSITY = 1e18
+DIELECTRIC_CONSTANT = 10
+
+
+def _potential_series():
+    """Series RC spectra of a potential series of an n-type semiconductor, one below the other."""
+    elementary_charge, permittivity = 1.602176634e-19, 8.8541878128e-12
+    thermal_voltage = 1.380649e-23 * 298.15 / elementary_charge
+    # Mott-Schottky equation, doping density in cm^-3 and capacitance in F/cm^2
+    inverse_square_capacitance = 2 / (elementary_charge * DIELECTRIC_CONSTANT * permittivity * 1e-2 * DOPING_DENSITY) \
+        * (POTENTIALS - FLAT_BAND_POTENTIAL - thermal_voltage)
+    return pd.concat([pd.DataFrame({"potential": potential, "freq": FREQUENCY,
+                                    "re": 20 + 0.1 * row + 0.01 * np.arange(FREQUENCY.size),
+                                    "im": -1 / (2 * np.pi * FREQUENCY * capacitance**-0.5)})
+                      for row, (potential, capacitance) in enumerate(zip(POTENTIALS, inverse_square_capacitance))],
+                     ignore_index=True)
+
+
+def test_remove_outliers_per_group_keeps_every_group():
+    table = _potential_series()
+    table.loc[5, "potential"] = np.nan
+    cleaned, kept_mask = da.remove_outliers_per_group(table, "potential", ["re", "im"], 0.1, 0.9)
+    assert kept_mask.size == len(table) and not kept_mask[5]
+    # the first and last frequency of every potential are its own extremes
+    assert cleaned.groupby("potential")["freq"].agg(["min", "max"]).values.tolist() == \
+        [[FREQUENCY[-2], FREQUENCY[1]]] * POTENTIALS.size
+    assert list(cleaned.index) == list(range(len(cleaned)))
+
+
+def test_mottschotcky_after_outlier_removal_per_potential():
+    table = _potential_series()
+    # the pooled quantiles remove the analysis frequency of the highest potential
+    pooled, _ = da.remove_outliers(table, ["re", "im"], 0.1, 0.9)
+    assert not np.any((pooled["potential"] == POTENTIALS[-1]) & (pooled["freq"] == ANALYSIS_FREQUENCY))
+
+    cleaned, _ = da.remove_outliers_per_group(table, "potential", ["re", "im"], 0.1, 0.9)
+    mott = ei.Mottschotcky(ei.EImpedance(cleaned["freq"], cleaned["re"], cleaned["im"]),
+                           potential=cleaned["potential"], analysis_frequency=ANALYSIS_FREQUENCY,
+                           dielectric_constant=DIELECTRIC_CONSTANT)
+    mott.analyze()
+    np.testing.assert_allclose(mott.potentials, POTENTIALS)
+    np.testing.assert_allclose(mott.frequencies, ANALYSIS_FREQUENCY)
+    np.testing.assert_allclose(mott.flat_band_potential, FLAT_BAND_POTENTIAL, atol=1e-6)
+    np.testing.assert_allclose(mott.doping_density, DOPING_DENSITY, rtol=1e-6)
@@ -0,0 +1,80 @@
+"""Tests for the EIS procedure."""
+import os
+import time
+
+import numpy as np
+import pytest
+
+from madap.echem.e_impedance import e_impedance as ei
+from madap.echem.e_impedance import e_impedance_circuit as ecirc
+
+
+CIRCUIT = "R0-p(R1,C1)"
+PARAMETERS = [10.0, 100.0, 1e-5]
+FREQUENCY = np.logspace(-1, 5, 30)
+# plot choices of the DRT procedure on the CLI
+DRT_PLOTS = ["nyquist", "nyquist_fit", "residual", "bode", "drt"]
+
+
+def _impedance():
+    z = ecirc.simulate_circuit(CIRCUIT, FREQUENCY, [PARAMETERS])[0]
+    return ei.EImpedance(FREQUENCY, z.real, z.imag)
+
+
+def _sleeping_fit(guess):
+    """Fit stand-in which does not return for the guess "slow"."""
+    if guess[0] == "slow":
+        time.sleep(60)
+    return guess[0], guess[1], None, 0.0
+
+
+def test_parallel_fits_are_opt_in():
+    assert ei.EIS(_impedance()).n_workers == 1
+
+
+def test_fit_timeout_records_failed_fit():
+    eis = ei.EIS(_impedance(), n_workers=2, fit_timeout=1)
+    start = time.perf_counter()
+    # pylint: disable=protected-access
+    results = eis._map_circuit_fits(_sleeping_fit, [("fast", 1), ("slow", 2), ("fast", 3)], ei._failed_fit)
+    assert time.perf_counter() - start < 30
+    assert results[0] == ("fast", 1, None, 0.0)
+    assert results[2] == ("fast", 3, None, 0.0)
+    circuit, custom_circuit, z_fit, message = results[1]
+    assert (circuit, custom_circuit, z_fit) == ("slow", None, None)
+    assert "did not finish" in message
+
+
+def test_cached_fit_with_tuple_initial_value(tmp_path, monkeypatch):
+    # the CLI evaluates "a, b, c" to a tuple, the cache gives the settings back with a list
+    first = ei.EIS(_impedance(), suggested_circuit=CIRCUIT, initial_value=(5, 50, 1e-6), cell_constant=None,
+                   cache_dir=str(tmp_path))
+    first.analyze()
+
+    def _no_fit(*args, **kwargs):
+        raise AssertionError("the cached fit was not used")
+    monkeypatch.setattr(ei, "_fit_circuit", _no_fit)
+    second = ei.EIS(_impedance(), suggested_circuit=CIRCUIT, initial_value=(5, 50, 1e-6), cell_constant=None,
+                    cache_dir=str(tmp_path))
+    second.analyze()
+    assert not second.warm_started
+    np.testing.assert_allclose(second.custom_circuit.parameters_, first.custom_circuit.parameters_)
+    np.testing.assert_allclose(second.custom_circuit.parameters_, PARAMETERS, rtol=1e-6)
+
+
+def test_stalled_fits_share_one_deadline():
+    eis = ei.EIS(_impedance(), n_workers=3, fit_timeout=2)
+    start = time.perf_counter()
+    # pylint: disable=protected-access
+    results = eis._map_circuit_fits(_sleeping_fit, [("slow", 1), ("slow", 2), ("slow", 3)], ei._failed_fit)
+    # one round of fits over the workers, not one timeout per stalled fit
+    assert time.perf_counter() - start < 4
+    assert all(custom_circuit is None for _, custom_circuit, _, _ in results)
+
+
+@pytest.mark.parametrize("plots", [[plot] for plot in DRT_PLOTS] + [DRT_PLOTS])
+def test_drt_plots(tmp_path, plots):
+    drt = ei.DRT(_impedance())
+    drt.perform_all_actions(str(tmp_path), plots=plots)
+    assert len(drt.figure.axes) >= len(plots)
+    assert os.listdir(tmp_path / "plots")
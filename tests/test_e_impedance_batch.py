@@ -0,0 +1,29 @@
+"""Tests for the batch EIS mode."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from madap.echem.e_impedance import e_impedance_batch as ebatch
+
+
+COLUMNS = ["freq", "real", "imag"]
+
+
+def _spectra_table():
+    frequency = np.logspace(5, -1, 10)
+    z = 10 + 100 / (1 + 2j * np.pi * frequency * 1e-3)
+    table = pd.concat([pd.DataFrame({"soc": soc, "freq": frequency, "real": z.real, "imag": z.imag})
+                       for soc in (0.2, 0.5)], ignore_index=True)
+    table.loc[3, "soc"] = np.nan
+    return table
+
+
+def test_split_spectra_leaves_out_rows_without_id():
+    spectra = ebatch.split_spectra(_spectra_table(), "soc", COLUMNS)
+    assert [spectrum for spectrum, _ in spectra] == [0.2, 0.5]
+    assert [len(impedance.frequency) for _, impedance in spectra] == [9, 10]
+
+
+def test_analyze_batch_without_spectra():
+    with pytest.raises(ValueError, match="no spectra"):
+        ebatch.analyze_batch([], spectrum_id="soc")
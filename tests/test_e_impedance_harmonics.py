@@ -0,0 +1,41 @@
+"""Tests for the harmonic analysis."""
+import numpy as np
+import pytest
+
+from madap.echem.e_impedance import e_impedance_harmonics as eharm
+
+
+SAMPLING_RATE = 1000.0
+# voltage amplitude of every harmonic, 1 is the fundamental
+VOLTAGE_HARMONICS = {1: 1.0, 3: 0.05, 5: 0.02}
+IMPEDANCE = 100 * np.exp(0.4j)
+
+
+def _analyze(frequency, periods=20):
+    time = np.arange(int(periods * SAMPLING_RATE / frequency) + 37) / SAMPLING_RATE
+    omega = 2 * np.pi * frequency
+    voltage = sum(amplitude * np.sin(order * omega * time) for order, amplitude in VOLTAGE_HARMONICS.items())
+    current = np.sin(omega * time - np.angle(IMPEDANCE)) / np.abs(IMPEDANCE)
+    analyzer = eharm.HarmonicAnalyzer()
+    # fed in chunks which split the windows
+    for chunk in np.array_split(np.arange(time.size), 7):
+        analyzer.feed(np.full(chunk.size, frequency), time[chunk], voltage[chunk], current[chunk])
+    return analyzer.finish()[0]
+
+
+@pytest.mark.parametrize("frequency, periods", [(7.0, 7), (50.0, 4)])
+def test_window_of_whole_samples(frequency, periods):
+    # 4 periods of 7 Hz are 571.4 samples at 1 kHz, 7 periods are 1000 samples
+    result = _analyze(frequency)
+    assert result["periods"] % periods == 0
+    np.testing.assert_allclose(result["impedance"], IMPEDANCE, rtol=1e-9)
+    np.testing.assert_allclose(result["thd_voltage"], np.hypot(0.05, 0.02), rtol=1e-9)
+    assert result["thd_current"] < 1e-9
+
+
+def test_window_mismatch_is_tapered():
+    # no window of 4 to 16 periods of 3.3 Hz is a whole number of samples at 1 kHz
+    result = _analyze(3.3)
+    np.testing.assert_allclose(result["impedance"], IMPEDANCE, rtol=1e-5)
+    np.testing.assert_allclose(result["thd_voltage"], np.hypot(0.05, 0.02), rtol=1e-4)
+    assert result["thd_current"] < 1e-5
@@ -0,0 +1,68 @@
+"""Tests for the readers of the native potentiostat files. The fixtures are small synthetic files
+written to the layout the readers expect (an impedance spectrum of five points), not instrument output."""
+import os
+
+import numpy as np
+import pytest
+
+from madap.data_acquisition import data_acquisition as da
+from madap.data_acquisition import instrument_readers as ir
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+FREQUENCY = [1e5, 1e4, 1e3, 1e2, 1e1]
+REAL_IMPEDANCE = [10.5, 12.0, 25.0, 80.0, 105.0]
+# capacitive, so negative in MADAP and in Gamry files and positive in the -Im(Z) column of BioLogic
+IMAGINARY_IMPEDANCE = [-1.5, -8.0, -30.0, -20.0, -4.0]
+CURRENT = [5e-4, 2.5e-4, -2.5e-4, -5e-4, 1e-3]
+TIME = [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_read_mpr_columns():
+    columns = ir.read_instrument_file(os.path.join(DATA_DIR, "eis.mpr"))
+    assert list(columns) == ["freq/Hz", "Re(Z)/Ohm", "-Im(Z)/Ohm", "Ewe/V", "I/mA", "time/s", "ox/red"]
+    assert columns["freq/Hz"].dtype == np.float32
+    assert columns["time/s"].dtype == np.float64
+    np.testing.assert_allclose(columns["-Im(Z)/Ohm"], [1.5, 8.0, 30.0, 20.0, 4.0])
+    np.testing.assert_allclose(columns["I/mA"], [0.5, 0.25, -0.25, -0.5, 1.0])
+    # the flag is unpacked from its bit of the flags byte
+    np.testing.assert_array_equal(columns["ox/red"], [1, 0, 1, 1, 0])
+
+
+def test_read_mpt_columns():
+    # the fixture is written with a decimal comma
+    columns = ir.read_instrument_file(os.path.join(DATA_DIR, "eis.mpt"))
+    assert list(columns) == ["freq/Hz", "Re(Z)/Ohm", "-Im(Z)/Ohm", "Ewe/V", "I/mA", "time/s"]
+    np.testing.assert_allclose(columns["Re(Z)/Ohm"], REAL_IMPEDANCE)
+    np.testing.assert_allclose(columns["Ewe/V"], 0.1)
+
+
+def test_read_dta_columns():
+    columns = ir.read_instrument_file(os.path.join(DATA_DIR, "eis.DTA"))
+    assert list(columns) == ["Pt", "Time", "Freq", "Zreal", "Zimag", "Zmod", "Vdc"]
+    np.testing.assert_array_equal(columns["Pt"], np.arange(5))
+    np.testing.assert_allclose(columns["Zimag"], IMAGINARY_IMPEDANCE)
+
+
+@pytest.mark.parametrize("file_name", ["eis.mpr", "eis.mpt", "eis.DTA"])
+def test_map_column_roles(file_name):
+    roles = ir.map_column_roles(ir.read_instrument_file(os.path.join(DATA_DIR, file_name)))
+    np.testing.assert_allclose(roles["frequency"], FREQUENCY)
+    np.testing.assert_allclose(roles["real_impedance"], REAL_IMPEDANCE)
+    np.testing.assert_allclose(roles["imaginary_impedance"], IMAGINARY_IMPEDANCE)
+    np.testing.assert_allclose(roles["time"], TIME)
+    assert all(column.dtype == np.float64 for column in roles.values())
+    if file_name != "eis.DTA":
+        # mA of BioLogic to A
+        np.testing.assert_allclose(roles["current"], CURRENT, rtol=1e-6)
+
+
+def test_acquire_data_reads_instrument_file():
+    data = da.acquire_data(os.path.join(DATA_DIR, "eis.mpr"))
+    assert list(data.columns[:3]) == ["freq/Hz", "Re(Z)/Ohm", "-Im(Z)/Ohm"]
+    assert len(data) == 5
+
+
+def test_read_mpr_rejects_other_files():
+    with pytest.raises(ValueError):
+        ir.read_mpr(os.path.join(DATA_DIR, "eis.mpt"))